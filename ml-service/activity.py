@@ -0,0 +1,180 @@
+# activity.py — Per-source-IP event rates in fixed memory
+#
+# How many events a source sent recently is tracked with count-min sketches
+# over a ring of time buckets, plus a small heavy-hitter list. Memory does
+# not depend on the number of distinct IPs, so a scan from millions of
+# addresses only adds estimation error, never memory.
+
+import os
+import mmap
+import time
+import struct
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+class SourceActivity:
+    """Sliding-window event counts per source IP.
+
+    `buckets` count-min sketches (depth x width uint32 counters) each cover
+    window_seconds / buckets seconds of a ring. The current bucket is cleared
+    when the ring comes back to it. An estimate sums a source's counters over
+    the buckets still inside the window and takes the minimum over the depth
+    rows. It never undercounts (within one process) and overcounts by at most
+    about e/width of all events in the window. Conservative updates make
+    it tighter than that in practice.
+
+    The counters live in an anonymous shared mapping, so the workers that
+    serve.py forks after import all add to the same sketch. Increments are
+    not atomic across processes; under contention an estimate can come out
+    slightly low, which a rate signal tolerates. The heavy-hitter list is
+    per process.
+    """
+
+    def __init__(self, window_seconds: float = 60.0, buckets: int = 6, width: int = 32768,
+                 depth: int = 4, top_k: int = 32, heavy_min: int = 30):
+        self.window_seconds = float(window_seconds)
+        self.n_buckets = max(int(buckets), 1)
+        self.bucket_seconds = self.window_seconds / self.n_buckets
+        self.width = max(int(width), 1)
+        self.depth = max(int(depth), 1)
+        self.top_k = max(int(top_k), 0)
+        self.heavy_min = int(heavy_min)
+
+        counts_bytes = self.n_buckets * self.depth * self.width * 4
+        self._buf = mmap.mmap(-1, counts_bytes + self.n_buckets * 8)
+        self.counts = np.frombuffer(self._buf, dtype=np.uint32, count=self.n_buckets * self.depth * self.width
+                                    ).reshape(self.n_buckets, self.depth, self.width)
+        self.epochs = np.frombuffer(self._buf, dtype=np.int64, count=self.n_buckets, offset=counts_bytes)
+        self.epochs[:] = -1
+        # Per-event reads and writes touch depth x buckets counters; plain
+        # memoryview indexing beats NumPy's per-call overhead at that size
+        self._cells_mv = memoryview(self._buf).cast("I")[:self.counts.size]
+        self._bucket_size = self.depth * self.width
+        self._live: List[int] = []  # offsets of the buckets inside the window
+        self._row_base = [row * self.width for row in range(self.depth)]
+        self._unpack = struct.Struct(f"<{self.depth}I").unpack
+
+        # Keyed hash: sources cannot pick addresses that collide on purpose
+        self._key = os.urandom(16)
+        self._top: Dict[str, int] = {}
+        self._floor = 0  # smallest count in a full heavy-hitter list
+        self._epoch = -1
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._buf)
+
+    def _cells(self, src_ip: str) -> List[int]:
+        # One counter per depth row, as offsets into a bucket
+        h = hashlib.blake2b(src_ip.encode("utf-8", "surrogatepass"), key=self._key,
+                            digest_size=4 * self.depth).digest()
+        width = self.width
+        return [base + value % width for base, value in zip(self._row_base, self._unpack(h))]
+
+    def _live_offsets(self, epoch: int) -> List[int]:
+        return [slot * self._bucket_size for slot, e in enumerate(self.epochs.tolist())
+                if epoch - self.n_buckets < e <= epoch]
+
+    def _estimate(self, cells: List[int], live: List[int]) -> int:
+        mv = self._cells_mv
+        return min([sum([mv[offset + cell] for offset in live]) for cell in cells])
+
+    def _rotate(self, epoch: int):
+        slot = epoch % self.n_buckets
+        if self.epochs[slot] != epoch:
+            self.counts[slot] = 0
+            self.epochs[slot] = epoch
+        if epoch != self._epoch:
+            # Once per bucket: refresh the candidates so quiet ones can drop out
+            self._epoch = epoch
+            self._live = self._live_offsets(epoch)
+            for ip in list(self._top):
+                count = self._estimate(self._cells(ip), self._live)
+                if count:
+                    self._top[ip] = count
+                else:
+                    del self._top[ip]
+            self._floor = min(self._top.values()) if len(self._top) >= self.top_k else 0
+
+    def _track(self, src_ip: str, count: int):
+        # Space-bounded top-k; the floor check keeps a scan of one-off
+        # sources from paying for a min() per event
+        top = self._top
+        if src_ip in top:
+            top[src_ip] = count
+        elif len(top) < self.top_k:
+            top[src_ip] = count
+        elif top and count > self._floor:
+            del top[min(top, key=top.get)]
+            top[src_ip] = count
+        else:
+            return
+        if len(top) >= self.top_k:
+            self._floor = min(top.values())
+
+    def observe(self, src_ip: str, now: Optional[float] = None) -> Dict:
+        """Count one event from `src_ip` and return its activity so far.
+
+        {"events": n in the window (this one included), "window_seconds",
+         "rate_per_min", "heavy_hitter": bool}
+        """
+        now = time.time() if now is None else now
+        epoch = int(now // self.bucket_seconds)
+        slot = epoch % self.n_buckets
+        cells = self._cells(src_ip or "")
+        with self._lock:
+            self._rotate(epoch)
+            mv, base = self._cells_mv, slot * self._bucket_size
+            current = [mv[base + cell] for cell in cells]
+            low = min(current)
+            if low < 0xFFFFFFFF:
+                # Conservative update: only the counters at the minimum grow
+                for cell, value in zip(cells, current):
+                    if value == low:
+                        mv[base + cell] = low + 1
+            count = self._estimate(cells, self._live)
+            self._track(src_ip, count)
+            heavy = src_ip in self._top and count >= self.heavy_min
+        return {
+            "events": count,
+            "window_seconds": self.window_seconds,
+            "rate_per_min": round(count * 60.0 / self.window_seconds, 2),
+            "heavy_hitter": heavy,
+        }
+
+    def heavy_hitters(self, now: Optional[float] = None) -> List[Dict]:
+        """Busiest tracked sources in the window, highest first."""
+        now = time.time() if now is None else now
+        epoch = int(now // self.bucket_seconds)
+        with self._lock:
+            live = self._live_offsets(epoch)
+            counts = [(ip, self._estimate(self._cells(ip), live)) for ip in self._top]
+        return [
+            {"srcIp": ip, "events": count}
+            for ip, count in sorted(counts, key=lambda c: -c[1])
+            if count >= self.heavy_min
+        ]
+
+    def clear(self):
+        with self._lock:
+            self.counts[:] = 0
+            self.epochs[:] = -1
+            self._top.clear()
+            self._floor = 0
+            self._epoch = -1
+
+    def stats(self) -> Dict:
+        return {
+            "window_seconds": self.window_seconds,
+            "buckets": self.n_buckets,
+            "sketch_width": self.width,
+            "sketch_depth": self.depth,
+            "top_k": self.top_k,
+            "heavy_min": self.heavy_min,
+            "memory_bytes": self.nbytes,
+            "tracked_sources": len(self._top),
+        }
@@ -0,0 +1,172 @@
+# admission.py — Bounded admission for model work, priority first
+#
+# At most `max_in_flight` requests have model work outstanding; the rest wait
+# in a bounded queue for at most `deadline` seconds. A request that cannot be
+# admitted in time fails fast (queue full -> 429, deadline -> 503) instead of
+# piling up behind the backend's 60 s client timeout. Priority requests
+# (payloads that already match a signature) are admitted before routine ones
+# and may use `priority_reserve` queue places routine requests cannot.
+# Background work (/predict/stream chunks) has no deadline: it waits behind
+# every queued request for as long as it takes, which slows the stream down
+# instead of failing it.
+#
+# Runs on the event loop: acquire() is awaited by the endpoints, slots are
+# released from executor threads through the loop.
+
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+import metrics
+
+class AdmissionRejected(Exception):
+    """Not admitted; the endpoint answers `status_code` with Retry-After."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Concurrency limit + bounded two-class wait queue + per-request deadline.
+
+    A request whose expected wait (queue ahead of it x average model time /
+    max_in_flight) is already past the deadline is rejected on arrival rather
+    than after waiting it out.
+    """
+
+    def __init__(self, max_in_flight: int = 64, max_queue: int = 256, deadline: float = 5.0,
+                 priority_reserve: int = 64, retry_after: float = 1.0):
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self.max_queue = max(int(max_queue), 0)
+        self.priority_reserve = max(int(priority_reserve), 0)
+        self.deadline = max(float(deadline), 0.001)
+        self.retry_after = max(float(retry_after), 0.0)
+        self._active = 0
+        self._waiters = {True: deque(), False: deque()}  # priority -> futures
+        self._background = deque()
+        self._service_s = None  # EWMA of slot hold time
+        self.counts: Dict[str, int] = {}
+
+    def _count(self, outcome: str, priority: Optional[bool]):
+        cls = "background" if priority is None else "priority" if priority else "routine"
+        self.counts[f"{outcome}_{cls}"] = self.counts.get(f"{outcome}_{cls}", 0) + 1
+        metrics.ADMISSION_EVENTS.labels(outcome, cls).inc()
+
+    def _reject(self, status_code: int, outcome: str, priority: bool) -> AdmissionRejected:
+        self._count(outcome, priority)
+        return AdmissionRejected(status_code, outcome, self.retry_after)
+
+    def queued(self, priority: Optional[bool] = None) -> int:
+        if priority is None:
+            return len(self._waiters[True]) + len(self._waiters[False])
+        return len(self._waiters[priority])
+
+    # --------------------------
+    # Admission
+    # --------------------------
+    async def acquire(self, priority: bool) -> float:
+        """Wait for a slot; the monotonic deadline of this request.
+
+        Raises AdmissionRejected: 429 queue_full, 503 overloaded (expected
+        wait past the deadline) or 503 expired (waited out the deadline).
+        """
+        now = time.monotonic()
+        deadline = now + self.deadline
+        # Priority requests only queue behind priority ones
+        ahead = self.queued(True) if priority else self.queued()
+        if self._active < self.max_in_flight and ahead == 0:
+            self._active += 1
+            self._count("admitted", priority)
+            return deadline
+
+        if self.queued() >= self.max_queue + (self.priority_reserve if priority else 0):
+            raise self._reject(429, "queue_full", priority)
+        if self._service_s is not None and (ahead + 1) * self._service_s / self.max_in_flight > self.deadline:
+            raise self._reject(503, "overloaded", priority)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=deadline - now)
+        except asyncio.TimeoutError:
+            self._abandon(waiter, self._waiters[priority])
+            raise self._reject(503, "expired", priority)
+        except asyncio.CancelledError:  # client went away while queued
+            self._abandon(waiter, self._waiters[priority])
+            raise
+        self._count("admitted", priority)
+        return deadline
+
+    async def acquire_background(self):
+        """Wait for a slot behind every queued request, however long it takes."""
+        if self._active < self.max_in_flight and self.queued() == 0 and not self._background:
+            self._active += 1
+            self._count("admitted", None)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._background.append(waiter)
+        try:
+            await asyncio.shield(waiter)
+        except asyncio.CancelledError:  # client went away while queued
+            self._abandon(waiter, self._background)
+            raise
+        self._count("admitted", None)
+
+    def _abandon(self, waiter: asyncio.Future, queue):
+        if waiter.done():
+            self._release_slot()  # handed a slot just as we gave up: pass it on
+        else:
+            waiter.cancel()
+            try:
+                queue.remove(waiter)
+            except ValueError:
+                pass
+
+    def _release_slot(self):
+        # Hand the slot straight to the next waiter, priority class first
+        for waiters in (self._waiters[True], self._waiters[False], self._background):
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self._active -= 1
+
+    def release_when_done(self, fut: Future, admitted_at: float):
+        """Free the slot once `fut` (the model work) finishes, even if nobody waits for it anymore."""
+        loop = asyncio.get_running_loop()
+
+        def _done(_):
+            loop.call_soon_threadsafe(self._finish, time.monotonic() - admitted_at)
+
+        fut.add_done_callback(_done)
+
+    def release(self):
+        """Free a slot that started no model work."""
+        self._release_slot()
+
+    def timed_out(self, priority: bool) -> AdmissionRejected:
+        """503 for an admitted request whose model work missed its deadline."""
+        return self._reject(503, "deadline", priority)
+
+    def _finish(self, held_s: float):
+        self._service_s = held_s if self._service_s is None else 0.9 * self._service_s + 0.1 * held_s
+        self._release_slot()
+
+    def stats(self) -> Dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "priority_reserve": self.priority_reserve,
+            "deadline_ms": round(self.deadline * 1000, 1),
+            "in_flight": self._active,
+            "queued_priority": self.queued(True),
+            "queued_routine": self.queued(False),
+            "queued_background": len(self._background),
+            "avg_model_ms": round(self._service_s * 1000, 2) if self._service_s is not None else None,
+            **self.counts,
+        }
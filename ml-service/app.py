@@ -14,35 +14,193 @@ import warnings
 warnings.filterwarnings('ignore', category=UserWarning)
 warnings.filterwarnings('ignore', category=FutureWarning)
 
+import math
 import time
 import json
+import signal
+import asyncio
 import logging
+import threading
+import multiprocessing
 from datetime import datetime
 import numpy as np
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional, Dict
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Header, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.requests import ClientDisconnect
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from pydantic.error_wrappers import ErrorWrapper
+from pydantic.errors import DictError
+from typing import Callable, Optional, Dict, List, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
 
-import joblib
-from tensorflow.keras.models import load_model  
+import scipy.sparse as sp
 
-from features import extract_features
+from features import numeric_blocks, tfidf_blocks, extract_feature_blocks_batch, stack_dense, NUMERIC_DIM
+from batching import MicroBatcher
+from model_store import ModelSet, ArtifactWatcher, load_model_set, file_digest
+from signatures import SignatureEngine
+from cache import PredictionCache, digest
+from activity import SourceActivity
+from neardup import NearDuplicateIndex
+from shadow import ShadowScorer
+from predlog import PredictionLog
+from admission import AdmissionController, AdmissionRejected
+from memprofile import AllocationProfiler, memory_report, model_memory
+import codec
+import metrics
 
 # --------------------------
 # Config + Paths
 # --------------------------
 IF_MODEL_PATH = os.environ.get("MODEL_PATH", "model/isolation_forest_model.pkl")
-IF_MODEL_VERSION = os.environ.get("MODEL_VERSION", "v1.0")
+IF_NUMPY_PATH = os.environ.get("IF_NUMPY_PATH", "model/isolation_forest_model.npz")
 
 AE_MODEL_PATH = os.environ.get("AE_MODEL_PATH", "model/autoencoder_model_colab.keras")
+AE_NUMPY_PATH = os.environ.get("AE_NUMPY_PATH", "model/autoencoder_model_colab.npz")
 NUM_SCALER_PATH = os.environ.get("NUM_SCALER_PATH", "model/num_scaler_colab.pkl")
 TFIDF_VECTORIZER_PATH = os.environ.get("TFIDF_VECTORIZER_PATH", "model/tfidf_vectorizer_colab.pkl")
+TFIDF_NUMPY_PATH = os.environ.get("TFIDF_NUMPY_PATH", "model/tfidf_vectorizer_colab.npz")
+
+# Numeric precision of the NumPy models (artifacts written by precision.py;
+# accuracy against float64: python precision.py --report). int8 and the
+# float32 IF are memory-only: int8 is slower per call (its weights are
+# widened on every call) and the float32 IF is no faster than float64.
+AE_PRECISION = os.environ.get("AE_PRECISION", "float32").lower()  # float64 | float32 | int8
+IF_PRECISION = os.environ.get("IF_PRECISION", "float64").lower()  # float64 | float32
+AE_INT8_PATH = os.environ.get("AE_INT8_PATH", "model/autoencoder_model_colab.int8.npz")
+IF_FLOAT32_PATH = os.environ.get("IF_FLOAT32_PATH", "model/isolation_forest_model.f32.npz")
+AE_DTYPE = np.float64 if AE_PRECISION == "float64" else np.float32
+
+MODEL_PATHS = {
+    "isolation_forest": IF_MODEL_PATH,
+    "isolation_forest_numpy": IF_FLOAT32_PATH if IF_PRECISION == "float32" else IF_NUMPY_PATH,
+    "autoencoder": AE_MODEL_PATH,
+    "autoencoder_numpy": AE_INT8_PATH if AE_PRECISION == "int8" else AE_NUMPY_PATH,
+    "num_scaler": NUM_SCALER_PATH,
+    "tfidf_vectorizer": TFIDF_VECTORIZER_PATH,
+    "tfidf_vectorizer_numpy": TFIDF_NUMPY_PATH,
+}
+
+# IOC signatures for the token override (built-in six tokens if the file is missing)
+SIGNATURES_PATH = os.environ.get("SIGNATURES_PATH", "model/signatures.txt")
+
+# Shadow (canary) model set: a sample of live events is scored with the
+# artifacts in SHADOW_MODEL_DIR after the response is sent, and compared
+# with the primary scores (GET /admin/shadow). Artifacts missing from the
+# directory are taken from the primary set. Empty = disabled.
+SHADOW_MODEL_DIR = os.environ.get("SHADOW_MODEL_DIR", "")
+SHADOW_SAMPLE_RATE = float(os.environ.get("SHADOW_SAMPLE_RATE", "0.1"))
+SHADOW_QUEUE_SIZE = int(os.environ.get("SHADOW_QUEUE_SIZE", "1000"))
+SHADOW_BATCH_SIZE = int(os.environ.get("SHADOW_BATCH_SIZE", "64"))
+
+# Hot reload: poll the artifacts every N seconds (0 = only via /admin/reload)
+MODEL_WATCH_INTERVAL = float(os.environ.get("MODEL_WATCH_INTERVAL", "30"))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")  # if set, required in X-Admin-Token
+
+# Set by serve.py in its forked workers: reloads go through the master
+PREFORK_MASTER_PID = int(os.environ.get("PREFORK_MASTER_PID", "0"))
+
+# Synthetic record scored once before the service reports ready
+WARMUP_RECORD = {
+    "honeypotId": "warmup",
+    "srcIp": "0.0.0.0",
+    "event": "cowrie.command.input",
+    "payload": "uname -a; cat /proc/cpuinfo",
+}
 
 ANOMALY_THRESHOLD = float(os.environ.get("ANOMALY_THRESHOLD", "0.55"))
 IF_WEIGHT = float(os.environ.get("IF_WEIGHT", "0.85"))
-NUMERIC_DIM = 3  # payload_len, num_digits, num_words
 AE_OUTLIER_RATIO = float(os.environ.get("AE_OUTLIER_RATIO", "100.0"))
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "1000"))
+
+# /predict/stream: events are scored in fixed-size chunks as the body arrives
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "256"))
+STREAM_MAX_LINE_BYTES = int(os.environ.get("STREAM_MAX_LINE_BYTES", str(1 << 20)))
+
+# Micro-batching of concurrent single /predict calls
+MICROBATCH_ENABLED = os.environ.get("MICROBATCH_ENABLED", "true").lower() == "true"
+MICROBATCH_WINDOW_MS = float(os.environ.get("MICROBATCH_WINDOW_MS", "2.0"))
+MICROBATCH_MAX_SIZE = int(os.environ.get("MICROBATCH_MAX_SIZE", "32"))
+
+# Scoring executor: model work runs here, never on the event loop.
+# SCORING_WORKERS x TF_INTRA_OP_THREADS should not exceed the available cores.
+SCORING_EXECUTOR = os.environ.get("SCORING_EXECUTOR", "thread").lower()  # thread | process
+TF_INTRA_OP_THREADS = int(os.environ.get("TF_INTRA_OP_THREADS", "1"))
+TF_INTER_OP_THREADS = int(os.environ.get("TF_INTER_OP_THREADS", "1"))
+SCORING_WORKERS = int(os.environ.get(
+    "SCORING_WORKERS", str(max(1, (os.cpu_count() or 1) // TF_INTRA_OP_THREADS))
+))
+os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(TF_INTRA_OP_THREADS))
+os.environ.setdefault("TF_NUM_INTEROP_THREADS", str(TF_INTER_OP_THREADS))
+
+# Admission control for requests that need model work (cache misses on
+# /predict, every /predict/batch): at most ADMISSION_MAX_IN_FLIGHT at once,
+# up to ADMISSION_QUEUE_SIZE waiting, each answered within
+# ADMISSION_DEADLINE_MS or failed fast: 429 when the queue is full, 503 when
+# the deadline cannot be met, both with Retry-After. Requests whose payload
+# matches a signature are admitted first and get ADMISSION_PRIORITY_RESERVE
+# extra queue places. /predict/stream chunks wait behind all of them with no
+# deadline. Keep the deadline well below the backend's
+# ML_SERVICE_TIMEOUT (60 s) so it falls back instead of hanging.
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get(
+    "ADMISSION_MAX_IN_FLIGHT", str(2 * SCORING_WORKERS * MICROBATCH_MAX_SIZE)  # enough to fill micro-batches
+))
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "256"))
+ADMISSION_PRIORITY_RESERVE = int(os.environ.get("ADMISSION_PRIORITY_RESERVE", "64"))
+ADMISSION_DEADLINE_MS = float(os.environ.get("ADMISSION_DEADLINE_MS", "5000"))
+ADMISSION_RETRY_AFTER = float(os.environ.get("ADMISSION_RETRY_AFTER", "1"))
+
+# Per-source event rates (count-min sketches, fixed memory). Sources above
+# RATE_BASELINE events per window get up to RATE_WEIGHT added to the fused
+# score, reaching the full boost at RATE_SATURATION events. Only live traffic
+# counts: /predict/stream (backfills, replays) only with ?live=true.
+RATE_FEATURES_ENABLED = os.environ.get("RATE_FEATURES_ENABLED", "true").lower() == "true"
+RATE_WINDOW_SECONDS = float(os.environ.get("RATE_WINDOW_SECONDS", "60"))
+RATE_BUCKETS = int(os.environ.get("RATE_BUCKETS", "6"))
+RATE_SKETCH_WIDTH = int(os.environ.get("RATE_SKETCH_WIDTH", "32768"))
+RATE_SKETCH_DEPTH = int(os.environ.get("RATE_SKETCH_DEPTH", "4"))
+RATE_TOP_K = int(os.environ.get("RATE_TOP_K", "32"))
+RATE_BASELINE = float(os.environ.get("RATE_BASELINE", "30"))
+RATE_SATURATION = float(os.environ.get("RATE_SATURATION", "600"))
+RATE_WEIGHT = float(os.environ.get("RATE_WEIGHT", "0.2"))
+
+# Prediction log: one JSON line per decision, written in batches by a
+# background thread. Every anomalous result and 1 in N normal ones are kept
+# (1 = all, 0 = none); entries that find the queue full are dropped and
+# counted (ml_prediction_log_events). Empty path = stderr.
+PREDICTION_LOG_PATH = os.environ.get("PREDICTION_LOG_PATH", "")
+PREDICTION_LOG_NORMAL_EVERY = int(os.environ.get("PREDICTION_LOG_NORMAL_EVERY", "10"))
+PREDICTION_LOG_QUEUE_SIZE = int(os.environ.get("PREDICTION_LOG_QUEUE_SIZE", "10000"))
+PREDICTION_LOG_BATCH_SIZE = int(os.environ.get("PREDICTION_LOG_BATCH_SIZE", "256"))
+PREDICTION_LOG_FLUSH_SECONDS = float(os.environ.get("PREDICTION_LOG_FLUSH_SECONDS", "0.5"))
+
+# Prediction cache (level 1: features, level 2: model scores)
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "true").lower() == "true"
+FEATURE_CACHE_SIZE = int(os.environ.get("FEATURE_CACHE_SIZE", "10000"))
+SCORE_CACHE_SIZE = int(os.environ.get("SCORE_CACHE_SIZE", "50000"))
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", "3600"))
+
+# Near-duplicate collapsing (MinHash + LSH): an exact-cache miss whose
+# payload is at least NEARDUP_THRESHOLD similar (Jaccard over character
+# shingles) to a recently scored one of the same event type reuses its
+# model scores. Reported in explanation.near_duplicate. Needs CACHE_ENABLED.
+# Signatures are computed off the event loop, after admission control.
+NEARDUP_ENABLED = os.environ.get("NEARDUP_ENABLED", "true").lower() == "true"
+NEARDUP_THRESHOLD = float(os.environ.get("NEARDUP_THRESHOLD", "0.7"))
+NEARDUP_INDEX_SIZE = int(os.environ.get("NEARDUP_INDEX_SIZE", "5000"))
+NEARDUP_PERMUTATIONS = int(os.environ.get("NEARDUP_PERMUTATIONS", "64"))
+NEARDUP_SHINGLE = int(os.environ.get("NEARDUP_SHINGLE", "4"))
+NEARDUP_MIN_LENGTH = int(os.environ.get("NEARDUP_MIN_LENGTH", "32"))
+
+# Memory introspection (GET /admin/memory). The tracemalloc window started
+# with POST /admin/memory/profile/start records MEMORY_PROFILE_FRAMES frames
+# per allocation and switches itself off after MEMORY_PROFILE_SECONDS
+# (0 = until /admin/memory/profile/stop); tracing slows every allocation.
+MEMORY_PROFILE_FRAMES = int(os.environ.get("MEMORY_PROFILE_FRAMES", "1"))
+MEMORY_PROFILE_SECONDS = float(os.environ.get("MEMORY_PROFILE_SECONDS", "300"))
 
 # --------------------------
 # Logging + FastAPI setup
@@ -64,140 +222,1244 @@ class PredictResponse(BaseModel):
     model_version: Optional[Dict]
     explanation: Optional[Dict]
 
+class PredictBatchRequest(BaseModel):
+    events: List[PredictRequest]
+
+class PredictBatchResponse(BaseModel):
+    results: List[PredictResponse]
+
 # --------------------------
 # Globals
 # --------------------------
-if_model = None
-ae_model = None
-num_scaler = None
-tfidf_vec = None
+models = ModelSet()  # replaced as a whole, never mutated in place
+models_loaded = threading.Event()
+startup_ms = None
+reload_lock = threading.Lock()
+last_reload = None
+watcher = None
+shadow_models: Optional[ModelSet] = None
+shadow = None
+shadow_watcher = None
+last_shadow_load = None
+signatures = SignatureEngine.load(None)
+signature_watcher = None
+prediction_log = None  # started with the service; offline callers log nothing
+allocation_profiler = AllocationProfiler()
+admission = AdmissionController(
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_QUEUE_SIZE, ADMISSION_DEADLINE_MS / 1000.0,
+    ADMISSION_PRIORITY_RESERVE, ADMISSION_RETRY_AFTER,
+) if ADMISSION_ENABLED else None
+batcher = None
+executor = None
+near_executor = None  # near-duplicate signatures; the scoring executor in thread mode
+cache = PredictionCache(
+    FEATURE_CACHE_SIZE if CACHE_ENABLED else 0,
+    SCORE_CACHE_SIZE if CACHE_ENABLED else 0,
+    CACHE_TTL_SECONDS,
+)
+near_duplicates = NearDuplicateIndex(
+    NEARDUP_INDEX_SIZE, NEARDUP_THRESHOLD, NEARDUP_PERMUTATIONS, NEARDUP_SHINGLE,
+    NEARDUP_MIN_LENGTH, CACHE_TTL_SECONDS,
+) if CACHE_ENABLED and NEARDUP_ENABLED else None
+# Created at import so workers forked by serve.py share the counters
+source_activity = SourceActivity(
+    RATE_WINDOW_SECONDS, RATE_BUCKETS, RATE_SKETCH_WIDTH, RATE_SKETCH_DEPTH,
+    RATE_TOP_K, heavy_min=int(RATE_BASELINE),
+) if RATE_FEATURES_ENABLED else None
 
 # --------------------------
 # Helpers
 # --------------------------
-def sigmoid(x: float) -> float:
-    x = float(np.clip(x, -50.0, 50.0))
+def sigmoid(x):
+    x = np.clip(x, -50.0, 50.0)
     return 1.0 / (1.0 + np.exp(-x))
 
+def rate_score(events: int) -> float:
+    # 0 up to RATE_BASELINE events per window, 1 from RATE_SATURATION on
+    span = max(RATE_SATURATION - RATE_BASELINE, 1e-9)
+    return float(min(max((events - RATE_BASELINE) / span, 0.0), 1.0))
+
+def observe_sources(records: List[dict]) -> List[Optional[dict]]:
+    """Count each record in the per-source tracker; its activity for build_response."""
+    if source_activity is None:
+        return [None] * len(records)
+    return [source_activity.observe(r.get("srcIp") or "") for r in records]
+
 def safe_float(x, default=0.0):
     try:
         return float(x)
     except:
         return default
 
+def warm_up(candidate: ModelSet) -> bool:
+    """Score WARMUP_RECORD with `candidate`; ready only if both models answered."""
+    start = time.perf_counter()
+    try:
+        scores = model_scores([WARMUP_RECORD], candidate)[0]
+    except Exception as e:
+        logger.error(f"❌ Warm-up failed: {e}")
+        scores = (None, None)
+    candidate.warmup_ms = round((time.perf_counter() - start) * 1000, 1)
+    candidate.ready = candidate.complete and None not in scores
+    return candidate.ready
+
+def load_models():
+    """Load and warm up the model set, then mark the service loaded."""
+    global models, startup_ms
+    start = time.perf_counter()
+
+    loaded = load_model_set(MODEL_PATHS, ae_dtype=AE_DTYPE)
+    if warm_up(loaded):
+        logger.info(f"✅ Warm-up done in {loaded.warmup_ms}ms, ready")
+    else:
+        logger.error("❌ Models incomplete or warm-up failed, serving degraded")
+
+    models = loaded
+    cache.set_version(loaded.version)
+    if near_duplicates is not None:
+        near_duplicates.clear()
+    if SHADOW_MODEL_DIR:
+        load_shadow_models("startup")
+    startup_ms = round((time.perf_counter() - start) * 1000, 1)
+    models_loaded.set()
+
+def reload_models(reason: str) -> dict:
+    """Load a fresh model set, warm it up and swap it in only if it is ready.
+
+    The swap is a single reference assignment: requests that already picked
+    up the old set finish on it, new ones see the new set. In process mode
+    the executor is replaced too and the old workers drain their queue.
+    An export made from an older source artifact is never swapped in: the
+    loader serves the source instead, or the candidate is incomplete and
+    rejected when the source cannot be loaded.
+    """
+    global models, executor, last_reload
+    with reload_lock:
+        start = time.perf_counter()
+        previous = models.version
+        candidate = load_model_set(MODEL_PATHS, ae_dtype=AE_DTYPE)
+        result = {
+            "reason": reason,
+            "previous_version": previous,
+            "candidate_version": candidate.version,
+            "models": candidate.status(),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+
+        if not warm_up(candidate):
+            result["status"] = "rejected"
+            logger.error(f"❌ Reload ({reason}) rejected, keeping {previous}: candidate failed warm-up")
+        else:
+            old_executor = None
+            if SCORING_EXECUTOR == "process" and executor is not None:
+                old_executor, executor = executor, create_executor()
+                if batcher is not None:
+                    batcher.executor = executor
+            models = candidate
+            cache.set_version(candidate.version)
+            if near_duplicates is not None:
+                near_duplicates.clear()  # scoped by version anyway; frees the memory
+            if old_executor is not None:
+                old_executor.shutdown(wait=False)
+            result["status"] = "swapped"
+            logger.info(f"✅ Reload ({reason}) swapped models {previous} -> {candidate.version}")
+
+        result["reload_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        last_reload = result
+        return result
+
+def shadow_paths() -> Dict[str, Optional[str]]:
+    """MODEL_PATHS with every artifact found in SHADOW_MODEL_DIR swapped in."""
+    paths: Dict[str, Optional[str]] = {}
+    for name, path in MODEL_PATHS.items():
+        candidate = os.path.join(SHADOW_MODEL_DIR, os.path.basename(path))
+        paths[name] = candidate if os.path.exists(candidate) else path
+    # A NumPy export is only valid next to the artifact it was exported from
+    for source, export in (("isolation_forest", "isolation_forest_numpy"), ("autoencoder", "autoencoder_numpy"),
+                           ("tfidf_vectorizer", "tfidf_vectorizer_numpy")):
+        if paths[source] != MODEL_PATHS[source] and paths[export] == MODEL_PATHS[export]:
+            paths[export] = None
+    return paths
+
+def load_shadow_models(reason: str) -> dict:
+    """Load and warm up the shadow set; keep the previous one if it fails."""
+    global shadow_models, last_shadow_load
+    start = time.perf_counter()
+    candidate = load_model_set(shadow_paths(), ae_dtype=AE_DTYPE)
+    result = {
+        "reason": reason,
+        "previous_version": shadow_models.version if shadow_models else None,
+        "candidate_version": candidate.version,
+        "models": candidate.status(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    if not warm_up(candidate):
+        result["status"] = "rejected"
+        logger.error(f"❌ Shadow load ({reason}) rejected: candidate failed warm-up")
+    else:
+        shadow_models = candidate
+        if shadow is not None:
+            shadow.reset(candidate.version)
+        result["status"] = "loaded"
+        if candidate.version == models.version:
+            logger.warning("⚠️ Shadow set is identical to the primary set")
+        logger.info(f"✅ Shadow models {candidate.version} loaded ({reason})")
+    result["load_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    last_shadow_load = result
+    return result
+
+def load_signatures(reason: str) -> dict:
+    """Compile the signature file and swap the engine in; keep the old one on error."""
+    global signatures
+    start = time.perf_counter()
+    try:
+        if SIGNATURES_PATH and os.path.exists(SIGNATURES_PATH):
+            engine = SignatureEngine.load(SIGNATURES_PATH, version=file_digest(SIGNATURES_PATH))
+        else:
+            logger.warning(f"⚠️ No signature file at {SIGNATURES_PATH}, using built-in tokens")
+            engine = SignatureEngine.load(None)
+    except Exception as e:
+        logger.error(f"❌ Signature load ({reason}) failed, keeping {signatures.version}: {e}")
+        return {"status": "rejected", "version": signatures.version, "error": str(e)}
+
+    signatures = engine
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+    logger.info(f"✅ Loaded {len(engine)} signatures ({engine.version}) in {elapsed_ms}ms")
+    return {"status": "loaded", "version": engine.version, "count": len(engine), "load_ms": elapsed_ms}
+
+def limit_framework_threads():
+    # NumPy/sklearn BLAS and OpenMP pools get the same per-worker budget as TensorFlow
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=TF_INTRA_OP_THREADS)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not limit BLAS threads: {e}")
+
+def _init_scoring_process():
+    global models
+    limit_framework_threads()
+    models = load_model_set(MODEL_PATHS, ae_dtype=AE_DTYPE)
+
+def create_executor():
+    if SCORING_EXECUTOR == "process":
+        # spawn: the parent already runs threads, forking it is unsafe
+        return ProcessPoolExecutor(
+            max_workers=SCORING_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_scoring_process,
+        )
+    return ThreadPoolExecutor(max_workers=SCORING_WORKERS, thread_name_prefix="scoring")
+
 # --------------------------
 # Startup
 # --------------------------
 @app.on_event("startup")
 def startup_event():
-    global if_model, ae_model, num_scaler, tfidf_vec
+    global batcher, executor
 
-    try:
-        if_model = joblib.load(IF_MODEL_PATH)
-        logger.info(f"✅ Loaded Isolation Forest model from {IF_MODEL_PATH}")
-    except Exception as e:
-        logger.error(f"❌ IF model load error: {e}")
+    limit_framework_threads()
+    metrics.register_service(metrics_snapshot)
+    if SCORING_EXECUTOR == "process" and not metrics.MULTIPROCESS:
+        logger.warning("⚠️ PROMETHEUS_MULTIPROC_DIR not set: stage metrics from scoring processes are not exported")
+    load_signatures("startup")
+    if models_loaded.is_set():
+        # Forked by serve.py with the master's models already in memory
+        logger.info(f"✅ Using preloaded models {models.version} (pid {os.getpid()})")
+    else:
+        # Models load (in parallel) and warm up off the startup path; until then
+        # /health/live answers and /health/ready + /predict return 503
+        threading.Thread(target=load_models, name="model-loader", daemon=True).start()
 
-    try:
-        ae_model = load_model(AE_MODEL_PATH)
-        num_scaler = joblib.load(NUM_SCALER_PATH)
-        tfidf_vec = joblib.load(TFIDF_VECTORIZER_PATH)
-        logger.info("✅ Loaded Autoencoder model + scalers")
-    except Exception as e:
-        logger.error(f"❌ AE model load error: {e}")
+    executor = create_executor()
+    logger.info(f"✅ Scoring executor: {SCORING_EXECUTOR} x{SCORING_WORKERS} "
+                f"(intra_op={TF_INTRA_OP_THREADS}, inter_op={TF_INTER_OP_THREADS})")
+
+    global near_executor
+    if near_duplicates is not None:
+        # The index lives in this process, out of reach of scoring processes
+        near_executor = executor if SCORING_EXECUTOR == "thread" else \
+            ThreadPoolExecutor(max_workers=SCORING_WORKERS, thread_name_prefix="neardup")
+
+    if MICROBATCH_ENABLED:
+        batcher = MicroBatcher(model_scores, MICROBATCH_WINDOW_MS, MICROBATCH_MAX_SIZE,
+                               executor=executor)
+        batcher.start()
+        logger.info(f"✅ Micro-batching enabled (window={MICROBATCH_WINDOW_MS}ms, max={MICROBATCH_MAX_SIZE})")
+
+    global prediction_log
+    prediction_log = PredictionLog(PREDICTION_LOG_PATH, PREDICTION_LOG_NORMAL_EVERY, PREDICTION_LOG_QUEUE_SIZE,
+                                   PREDICTION_LOG_BATCH_SIZE, PREDICTION_LOG_FLUSH_SECONDS)
+    prediction_log.start()
+
+    global shadow
+    if SHADOW_MODEL_DIR:
+        shadow = ShadowScorer(shadow_scores, fuse_scores, ANOMALY_THRESHOLD, SHADOW_SAMPLE_RATE,
+                              SHADOW_QUEUE_SIZE, SHADOW_BATCH_SIZE)
+        shadow.reset(shadow_models.version if shadow_models else None)
+        shadow.start()
+        logger.info(f"✅ Shadow scoring enabled ({SHADOW_MODEL_DIR}, sample rate {SHADOW_SAMPLE_RATE})")
+
+    if PREFORK_MASTER_PID:
+        return  # the master watches the files and restarts workers on change
+
+    global watcher
+    watcher = ArtifactWatcher(MODEL_PATHS, MODEL_WATCH_INTERVAL, lambda: reload_models("file change"))
+    watcher.start()
+
+    global signature_watcher
+    signature_watcher = ArtifactWatcher({"signatures": SIGNATURES_PATH}, MODEL_WATCH_INTERVAL,
+                                        lambda: load_signatures("file change"))
+    signature_watcher.start()
+
+    if SHADOW_MODEL_DIR:
+        global shadow_watcher
+        shadow_watcher = ArtifactWatcher({"shadow": SHADOW_MODEL_DIR, **shadow_paths()}, MODEL_WATCH_INTERVAL,
+                                         lambda: load_shadow_models("file change"))
+        shadow_watcher.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    if watcher is not None:
+        watcher.stop()
+    if signature_watcher is not None:
+        signature_watcher.stop()
+    if shadow_watcher is not None:
+        shadow_watcher.stop()
+    if shadow is not None:
+        shadow.stop()
+    if batcher is not None:
+        batcher.stop()
+    if near_executor is not None and near_executor is not executor:
+        near_executor.shutdown(wait=True)
+    if executor is not None:
+        executor.shutdown(wait=True)
+    if prediction_log is not None:
+        prediction_log.stop()  # after the executor: the last results get logged too
 
 # --------------------------
-# Health Check Endpoint
+# Health Check Endpoints
 # --------------------------
-@app.get("/health")
-def health_check():
+def readiness() -> dict:
+    current = models
+    if not models_loaded.is_set():
+        status = "loading"
+    else:
+        status = "ready" if current.ready else "degraded"
     return {
-        "status": "healthy",
-        "models_loaded": if_model is not None and ae_model is not None,
+        "status": status,
+        "ready": current.ready,
+        "models": current.status(),
+        "warmup_ms": current.warmup_ms,
+        "startup_ms": startup_ms,
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.get("/health/live")
+def health_live():
+    return {"status": "alive", "timestamp": datetime.utcnow().isoformat()}
+
+@app.get("/health/ready")
+def health_ready():
+    body = readiness()
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/health")
+def health_check():
+    # Kept for existing clients; only healthy once the models are warm
+    body = readiness()
+    return JSONResponse({
+        "status": "healthy" if body["ready"] else body["status"],
+        "models_loaded": models.complete,
+        "models": body["models"],
+        "timestamp": body["timestamp"]
+    }, status_code=200 if body["ready"] else 503)
+
+def require_models():
+    if not models_loaded.is_set():
+        raise HTTPException(status_code=503, detail="Models are still loading")
+
 # --------------------------
-# Prediction Endpoint
+# Scoring
 # --------------------------
-@app.post("/predict", response_model=PredictResponse)
-def predict(req: PredictRequest):
-    start = time.perf_counter()
-
-    feats = extract_features(req.dict())
-    feats = np.array(feats).reshape(1, -1)
+def score_features(X_num: np.ndarray, X_tfidf: sp.csr_matrix, m: ModelSet):
+    """Run one IF pass and one AE pass over n rows of feature blocks.
 
-    X_num = feats[:, :NUMERIC_DIM]
-    X_tfidf = feats[:, NUMERIC_DIM:]
+    The TF-IDF block is densified once into a float32 matrix that both models
+    read. Returns two lists of per-row scores; a model that is missing or
+    fails yields None for every row, exactly like the single-row path did.
+    """
+    n = X_num.shape[0]
+    metrics.observe_batch_rows(n)
+    with metrics.timed("densify"):
+        X = stack_dense(X_num, X_tfidf)
 
-    # ----- Isolation Forest
-    if_score = None
+    # ----- Isolation Forest (raw numeric features)
+    if_scores = [None] * n
     try:
-        raw = if_model.decision_function(feats)[0]
-        if_score = 1.0 / (1.0 + np.exp(float(raw)))
+        with metrics.timed("if_scoring"):
+            raw = m.if_model.decision_function(X)
+            if_scores = (1.0 / (1.0 + np.exp(raw))).tolist()
     except:
         pass
 
-    # ----- Autoencoder
-    ae_score = None
+    # ----- Autoencoder (scaled numeric features, tf-idf as is)
+    ae_scores = [None] * n
     try:
-        X_num_scaled = num_scaler.transform(X_num)
-        X_tfidf_scaled = X_tfidf  # already tfidf vectorized
-        X_combined = np.hstack([X_num_scaled, X_tfidf_scaled])
-        recon = ae_model.predict(X_combined, verbose=0)
-        recon_error = float(np.mean((X_combined - recon) ** 2))
-        ae_score = sigmoid(recon_error * AE_OUTLIER_RATIO)
+        with metrics.timed("ae_scoring"):
+            X[:, :NUMERIC_DIM] = m.num_scaler.transform(X_num)
+            recon = m.ae_model.predict(X, verbose=0)
+            recon_error = np.mean(np.square(np.subtract(X, recon, dtype=np.float64)), axis=1)
+            ae_scores = sigmoid(recon_error * AE_OUTLIER_RATIO).tolist()
     except:
         pass
 
-    # ----- Fusion (Weighted Average)
-    final_score = None
+    return if_scores, ae_scores
+
+def fuse_scores(if_score, ae_score) -> Optional[float]:
+    # Weighted average; either model alone when the other one failed
     if (if_score is not None) and (ae_score is not None):
-        final_score = IF_WEIGHT * if_score + (1 - IF_WEIGHT) * ae_score
-    elif if_score is not None:
-        final_score = if_score
-    elif ae_score is not None:
-        final_score = ae_score
-
-    # ----- Rule-Based Override (Token Heuristic)
-    text = f"{req.event} {req.payload}".lower()
-    suspicious_tokens = ["curl", "bash", "password", "root", "wget", "eval"]
-    matched_tokens = [tok for tok in suspicious_tokens if tok in text]
-    if matched_tokens:
-        final_score = max(final_score or 0, 0.9)
+        return IF_WEIGHT * if_score + (1 - IF_WEIGHT) * ae_score
+    if if_score is not None:
+        return if_score
+    return ae_score
+
+def build_response(record: dict, if_score, ae_score, latency_ms: int,
+                   activity: Optional[dict] = None, near: Optional[dict] = None,
+                   matched: Optional[list] = None) -> dict:
+    """Fuse the model scores with the source rate and signature rules.
+
+    `activity` is what observe_sources returned for this record; offline
+    callers leave it out and get the pure per-event decision. `near` is set
+    when the model scores were taken from a near-duplicate payload.
+    `matched` is the record's match_signatures entry, if already computed.
+    """
+    fusion_start = time.perf_counter()
+
+    # ----- Fusion (Weighted Average)
+    final_score = fuse_scores(if_score, ae_score)
+    model_score = final_score
+
+    # ----- Source rate boost
+    source_rate = None
+    if activity is not None:
+        source_rate = rate_score(activity["events"])
+        if final_score is not None and source_rate > 0:
+            final_score = min(1.0, final_score + RATE_WEIGHT * source_rate)
+
+    # ----- Rule-Based Override (IOC signatures)
+    if matched is None:
+        matched = match_signatures([record])[0]
+    matched_tokens = list(dict.fromkeys(sig.pattern for sig in matched))
+    matched_categories = sorted({sig.category for sig in matched})
+    if matched:
+        final_score = max(final_score or 0, max(sig.weight for sig in matched))
 
     # ----- Final Label
     label = "anomalous" if final_score is not None and final_score >= ANOMALY_THRESHOLD else "normal"
+    if matched_tokens:
+        reason = "suspicious token override"
+    elif label == "anomalous" and (model_score is None or model_score < ANOMALY_THRESHOLD):
+        reason = "high source event rate"
+    else:
+        reason = "model ensemble decision"
+    metrics.observe_stage("fusion", time.perf_counter() - fusion_start)
+    metrics.PREDICTIONS.labels(label).inc()
 
-    latency_ms = int((time.perf_counter() - start) * 1000)
-    logger.info(json.dumps({
-        "ts": datetime.utcnow().isoformat(),
-        "srcIp": req.srcIp,
-        "latency_ms": latency_ms,
-        "if_score": if_score,
-        "ae_score": ae_score,
-        "final_score": final_score,
-        "label": label,
-        "if_weight": IF_WEIGHT,
-        "matched_tokens": matched_tokens
-    }))
+    if prediction_log is not None:
+        prediction_log.record({
+            "ts": datetime.utcnow().isoformat(),
+            "srcIp": record["srcIp"],
+            "latency_ms": latency_ms,
+            "if_score": if_score,
+            "ae_score": ae_score,
+            "final_score": final_score,
+            "label": label,
+            "if_weight": IF_WEIGHT,
+            "src_events": activity["events"] if activity else None,
+            "matched_tokens": matched_tokens,
+            "matched_categories": matched_categories
+        }, label == "anomalous")
 
     return {
         "score": final_score,
         "label": label,
         "model_version": {
-            "isolation_forest": IF_MODEL_VERSION,
-            "autoencoder": "colab-final"
+            "isolation_forest": models.versions.get("isolation_forest"),
+            "autoencoder": models.versions.get("autoencoder"),
+            "set": models.version
         },
         "explanation": {
             "if_score": if_score,
             "ae_score": ae_score,
             "fusion": f"Weighted average (IF={IF_WEIGHT}, AE={1 - IF_WEIGHT})",
             "matched_tokens": matched_tokens if matched_tokens else None,
-            "reason": "suspicious token override" if matched_tokens else "model ensemble decision"
+            "matched_categories": matched_categories if matched_categories else None,
+            "source_activity": {**activity, "rate_score": source_rate} if activity else None,
+            "near_duplicate": near,
+            "reason": reason
         }
     }
 
+# Keys carry the model set version, so nothing computed by an old set is
+# served after a swap even if it lands in the cache late.
+def feature_key(record: dict, version: str) -> bytes:
+    # Features only depend on the payload (and the set's vectorizer)
+    return digest(version, record.get("payload") or "")
+
+def score_key(record: dict, version: Optional[str] = None) -> bytes:
+    return digest(version or models.version, (record.get("event") or "").strip(),
+                  record.get("payload") or "")
+
+def model_scores(records: List[dict], m: Optional[ModelSet] = None) -> List[tuple]:
+    """(if_score, ae_score) per record, no score cache involved.
+
+    This is the CPU-bound step that runs on the scoring executor. Feature
+    blocks are cached per process (shared by all workers in thread mode).
+    """
+    m = m or models
+    start = time.perf_counter()
+    blocks = [None] * len(records)
+    misses: Dict[bytes, List[int]] = {}
+    for i, r in enumerate(records):
+        fkey = feature_key(r, m.version)
+        block = cache.features.get(fkey)
+        if block is None:
+            misses.setdefault(fkey, []).append(i)
+        else:
+            blocks[i] = block
+
+    tfidf_s = 0.0
+    X_num = X_tfidf = None
+    if misses:
+        # Vectorized numeric features and one TF-IDF transform for all misses
+        payloads = [records[idxs[0]].get("payload") or "" for idxs in misses.values()]
+        new_num = numeric_blocks(payloads)
+        t = time.perf_counter()
+        new_tfidf = tfidf_blocks(payloads, m.tfidf_vec)
+        tfidf_s = time.perf_counter() - t
+        for j, (fkey, idxs) in enumerate(misses.items()):
+            block = (new_num[j:j + 1], new_tfidf[j])
+            cache.features.set(fkey, block)
+            for i in idxs:
+                blocks[i] = block
+        if len(payloads) == len(records):  # all distinct misses: already in order
+            X_num, X_tfidf = new_num, new_tfidf
+
+    if X_num is None:
+        X_num = np.vstack([b[0] for b in blocks])
+        X_tfidf = sp.vstack([b[1] for b in blocks], format="csr")
+    # feature_extraction: cache lookups, numeric features and row stacking
+    metrics.observe_stage("feature_extraction", time.perf_counter() - start - tfidf_s)
+    if tfidf_s:
+        metrics.observe_stage("tfidf_transform", tfidf_s)
+    if_scores, ae_scores = score_features(X_num, X_tfidf, m)
+    return list(zip(if_scores, ae_scores))
+
+def _run_model_scores(records: List[dict]) -> Future:
+    if executor is not None:
+        return executor.submit(model_scores, records)
+    fut = Future()
+    try:
+        fut.set_result(model_scores(records))
+    except Exception as e:
+        fut.set_exception(e)
+    return fut
+
+def _store_scores(key: bytes, scores: tuple):
+    if None not in scores:
+        cache.scores.set(key, scores)  # never cache a failed model call
+
+def _near_scope(record: dict) -> tuple:
+    return models.version, (record.get("event") or "").strip()
+
+def _near_info(cluster_id: str, similarity: float) -> dict:
+    return {"cluster_id": cluster_id, "similarity": round(similarity, 3)}
+
+def _add_near(key: bytes, step: Optional[tuple], scores: tuple):
+    # A freshly scored "new" payload represents its cluster, named after its score key
+    if step is not None and None not in scores:
+        near_duplicates.add(step[1], step[2], scores, key.hex()[:16])
+
+def _run_near(items: List[tuple]) -> Future:
+    """Future of near_duplicates.resolve(items), computed off the event loop.
+
+    MinHash signatures cost about as much as feature extraction, so they run
+    on a thread like the models do (near_executor), inline when offline.
+    """
+    if near_executor is not None:
+        return near_executor.submit(near_duplicates.resolve, items)
+    fut = Future()
+    try:
+        fut.set_result(near_duplicates.resolve(items))
+    except Exception as e:
+        fut.set_exception(e)
+    return fut
+
+def _chain(job: Future, out: Future, then: Callable[[object], None]):
+    # then(result) once `job` is done; any failure fails `out`
+    def _done(job: Future):
+        try:
+            then(job.result())
+        except Exception as e:
+            if not out.done():
+                out.set_exception(e)
+
+    job.add_done_callback(_done)
+
+def submit_scores(records: List[dict]) -> Tuple[Future, List[Optional[dict]]]:
+    """Future of (if_score, ae_score) per record, served from the caches where possible.
+
+    Identical records in the same call are scored once, and so are near
+    duplicates (see neardup.py). Also returns, per record, the near-duplicate
+    cluster its scores were taken from (None if scored or exactly cached);
+    it is filled in by the time the Future resolves.
+    """
+    results = [None] * len(records)
+    near: List[Optional[dict]] = [None] * len(records)
+    misses: Dict[bytes, List[int]] = {}
+    for i, r in enumerate(records):
+        key = score_key(r)
+        hit = cache.scores.get(key)
+        if hit is not None:
+            results[i] = hit
+        else:
+            misses.setdefault(key, []).append(i)
+
+    out = Future()
+    if not misses:
+        out.set_result(results)
+        return out, near
+
+    new: Dict[bytes, tuple] = {}  # key -> ("new", scope, sig)
+    followers: Dict[bytes, List[tuple]] = {}  # lead key -> [(record indexes, similarity)]
+
+    def _scored(scores: List[tuple]):
+        for (key, idxs), s in zip(misses.items(), scores):
+            _store_scores(key, s)
+            _add_near(key, new.get(key), s)
+            for i in idxs:
+                results[i] = s
+            for follower_idxs, similarity in followers.get(key, ()):
+                for i in follower_idxs:
+                    results[i] = s
+                    near[i] = _near_info(key.hex()[:16], similarity)
+        out.set_result(results)
+
+    def _score_misses():
+        if not misses:
+            out.set_result(results)
+        else:
+            _chain(_run_model_scores([records[idxs[0]] for idxs in misses.values()]), out, _scored)
+
+    if near_duplicates is None:
+        _score_misses()
+        return out, near
+
+    keys = list(misses)
+
+    def _planned(plan: List[tuple]):
+        for key, step in zip(keys, plan):
+            if step[0] == "hit":
+                for i in misses.pop(key):
+                    results[i] = step[1]
+                    near[i] = _near_info(step[2], step[3])
+            elif step[0] == "follow":
+                followers.setdefault(keys[step[1]], []).append((misses.pop(key), step[2]))
+            else:
+                new[key] = step
+        _score_misses()
+
+    _chain(_run_near([(_near_scope(records[misses[k][0]]), records[misses[k][0]].get("payload") or "")
+                      for k in keys]), out, _planned)
+    return out, near
+
+def submit_score(record: dict, key: bytes) -> Future:
+    """Future of ((if_score, ae_score), near-duplicate info) for one record that missed the cache.
+
+    The near-duplicate info is None unless the scores came from a near duplicate.
+    """
+    out = Future()
+
+    def _score(step: Optional[tuple]):
+        inner = batcher.submit(record) if batcher is not None else _run_model_scores([record])
+
+        def _scored(result):
+            scores = result if batcher is not None else result[0]
+            _store_scores(key, scores)
+            _add_near(key, step, scores)
+            out.set_result((scores, None))
+
+        _chain(inner, out, _scored)
+
+    def _planned(plan: List[tuple]):
+        step = plan[0]
+        if step[0] == "hit":
+            out.set_result((step[1], _near_info(step[2], step[3])))
+        else:
+            _score(step)
+
+    if near_duplicates is None:
+        _score(None)
+    else:
+        _chain(_run_near([(_near_scope(record), record.get("payload") or "")]), out, _planned)
+    return out
+
+async def _await(fut: Future):
+    # shield: a disconnecting client must not cancel work other callers share
+    return await asyncio.shield(asyncio.wrap_future(fut))
+
+def match_signatures(records: List[dict]) -> List[list]:
+    """Matching signatures per record, computed once for admission and build_response."""
+    return [signatures.match(f"{r['event']} {r['payload']}") for r in records]
+
+async def _await_admitted(priority: bool, submit: Callable[[], Future]):
+    """Result of the model work `submit` starts, under admission control.
+
+    Requests with a signature match (a forced anomaly) are `priority`. The
+    slot is held until that work finishes, even when this request has
+    given up on it, so the in-flight limit bounds real model work.
+    """
+    if admission is None:
+        return await _await(submit())
+    try:
+        deadline = await admission.acquire(priority)
+    except AdmissionRejected as e:
+        raise _overloaded(e)
+    try:
+        fut = submit()
+    except BaseException:
+        admission.release()
+        raise
+    admission.release_when_done(fut, time.monotonic())
+    try:
+        return await asyncio.wait_for(_await(fut), timeout=max(deadline - time.monotonic(), 0.0))
+    except asyncio.TimeoutError:
+        raise _overloaded(admission.timed_out(priority))
+
+def _overloaded(e: AdmissionRejected) -> HTTPException:
+    detail = {"queue_full": "Too many requests waiting for the models",
+              "overloaded": "Service overloaded, expected wait exceeds the deadline",
+              "expired": "No scoring slot within the deadline",
+              "deadline": "Scoring did not finish within the deadline"}[e.reason]
+    return HTTPException(status_code=e.status_code, detail=detail,
+                         headers={"Retry-After": str(max(int(math.ceil(e.retry_after)), 1))})
+
+def score_records(records: List[dict]) -> List[dict]:
+    """Score a list of request records with a single feature matrix.
+
+    Results are returned in input order. Blocking; endpoints use the async path.
+    """
+    if not records:
+        return []
+    start = time.perf_counter()
+    activity = observe_sources(records)
+
+    fut, near = submit_scores(records)
+    scores = fut.result()
+
+    latency_ms = int((time.perf_counter() - start) * 1000)
+    return [
+        build_response(r, if_s, ae_s, latency_ms, a, n)
+        for r, (if_s, ae_s), a, n in zip(records, scores, activity, near)
+    ]
+
+def shadow_scores(records: List[dict]) -> Optional[List[tuple]]:
+    """(if_score, ae_score) per record from the shadow set; runs on the shadow thread.
+
+    Bypasses the caches so shadow features never push out primary ones.
+    """
+    m = shadow_models
+    if m is None:
+        return None
+    X_num, X_tfidf = extract_feature_blocks_batch(records, m.tfidf_vec)
+    return list(zip(*score_features(X_num, X_tfidf, m)))
+
+def offer_shadow(records: List[dict], scores: List[tuple]):
+    # Runs as a background task, i.e. once the response has been sent
+    if shadow is not None and shadow_models is not None:
+        shadow.offer(records, scores)
+
+# --------------------------
+# Request / response bodies
+# --------------------------
+_RECORD_FIELDS = ("honeypotId", "srcIp", "event", "payload")
+
+def parse_record(obj) -> dict:
+    """The record dict for one decoded event, with PredictRequest's rules.
+
+    The common case (four strings, optional string timestamp) is copied
+    straight from the decoded body; anything else goes through the model
+    for its coercions and validation errors.
+    """
+    if type(obj) is dict:
+        record = {name: obj.get(name) for name in _RECORD_FIELDS}
+        timestamp = obj.get("timestamp")
+        if all(type(v) is str for v in record.values()) and (timestamp is None or type(timestamp) is str):
+            record["timestamp"] = timestamp
+            return record
+    return PredictRequest.parse_obj(_as_dict(obj)).dict()
+
+def _as_dict(obj) -> dict:
+    # pydantic v1 accepts anything dict() takes for a model; same error otherwise
+    if isinstance(obj, dict):
+        return obj
+    try:
+        return dict(obj)
+    except (TypeError, ValueError):
+        raise ValidationError([ErrorWrapper(DictError(), loc=())], PredictRequest)
+
+def _validation_error(e: ValidationError, *loc) -> RequestValidationError:
+    # Same 422 body FastAPI produces for an invalid typed body parameter
+    return RequestValidationError([ErrorWrapper(e, loc=("body", *loc))])
+
+async def read_body(request: Request):
+    try:
+        return codec.decode(await request.body(), request.headers.get("content-type"))
+    except codec.BodyError as e:
+        if isinstance(e.__cause__, json.JSONDecodeError):  # as FastAPI reports it
+            raise RequestValidationError([ErrorWrapper(e.__cause__, loc=("body", e.__cause__.pos))])
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+def body_response(request: Request, content) -> Response:
+    # Encoded here rather than through response_model: the dicts built by
+    # build_response already have the documented shape
+    try:
+        body, media_type = codec.encode(content, codec.wants_msgpack(request.headers.get("accept")))
+    except codec.BodyError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return Response(content=body, media_type=media_type)
+
+def _body_schema(model) -> dict:
+    schema = {"schema": model.schema()}
+    return {"requestBody": {"required": True, "content": {
+        codec.JSON_MEDIA_TYPE: schema, codec.MSGPACK_MEDIA_TYPE: schema}}}
+
+# --------------------------
+# Prediction Endpoints
+# --------------------------
+@app.post("/predict", response_model=PredictResponse, openapi_extra=_body_schema(PredictRequest))
+async def predict(request: Request, background_tasks: BackgroundTasks):
+    """Score one event. JSON or msgpack in and out (Content-Type / Accept)."""
+    require_models()
+    with metrics.track_request("predict"):
+        obj = await read_body(request)
+        try:
+            record = parse_record(obj)
+        except ValidationError as e:
+            raise _validation_error(e)
+        start = time.perf_counter()
+        activity = observe_sources([record])[0]
+        matched = match_signatures([record])[0]
+
+        key = score_key(record)
+        scores = cache.scores.get(key)
+        near = None
+        if scores is None:
+            # Concurrent identical requests share one model call
+            scores, near = await _await_admitted(
+                bool(matched), lambda: cache.flight.do(key, lambda: submit_score(record, key)))
+
+        latency_ms = int((time.perf_counter() - start) * 1000)
+        if shadow is not None:
+            background_tasks.add_task(offer_shadow, [record], [scores])
+        return body_response(request, build_response(record, *scores, latency_ms, activity, near, matched))
+
+def parse_batch(obj) -> List[dict]:
+    try:
+        obj = _as_dict(obj)
+    except ValidationError as e:
+        raise _validation_error(e)
+    events = obj.get("events")
+    if type(events) is not list:
+        try:
+            events = PredictBatchRequest.parse_obj(obj).events  # raises for most shapes
+        except ValidationError as e:
+            raise _validation_error(e)
+    if len(events) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(events)} events exceeds MAX_BATCH_SIZE={MAX_BATCH_SIZE}"
+        )
+    records = []
+    for i, event in enumerate(events):
+        try:
+            records.append(event.dict() if isinstance(event, PredictRequest) else parse_record(event))
+        except ValidationError as e:
+            raise _validation_error(e, "events", i)
+    return records
+
+@app.post("/predict/batch", response_model=PredictBatchResponse,
+          openapi_extra=_body_schema(PredictBatchRequest))
+async def predict_batch(request: Request, background_tasks: BackgroundTasks):
+    """Score {"events": [...]} in one pass. JSON or msgpack in and out."""
+    require_models()
+    with metrics.track_request("predict_batch"):
+        records = parse_batch(await read_body(request))
+        start = time.perf_counter()
+        activity = observe_sources(records)
+        matched = match_signatures(records)
+
+        near = None
+
+        def _submit() -> Future:
+            nonlocal near
+            fut, near = submit_scores(records)
+            return fut
+
+        scores = await _await_admitted(any(matched), _submit)
+
+        latency_ms = int((time.perf_counter() - start) * 1000)
+        if shadow is not None:
+            background_tasks.add_task(offer_shadow, records, scores)
+        return body_response(request, {"results": [
+            build_response(r, if_s, ae_s, latency_ms, a, n, m)
+            for r, (if_s, ae_s), a, n, m in zip(records, scores, activity, near, matched)
+        ]})
+
+# --------------------------
+# Streaming (NDJSON) Endpoint
+# --------------------------
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body iterator is still reading the request.
+
+    The stock class listens on receive() for a disconnect while streaming,
+    which swallows request body chunks. Here the body iterator is the only
+    reader; a client that goes away surfaces as ClientDisconnect from
+    request.stream() and ends the stream.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def _ndjson_lines(chunks):
+    """(line_no, bytes) per non-empty line of an NDJSON byte stream.
+
+    Only the current partial line is buffered. A line longer than
+    STREAM_MAX_LINE_BYTES is dropped and reported as (line_no, None).
+    """
+    buf = b""
+    line_no = 0
+    oversized = False
+    async for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if oversized:
+                oversized = False
+                yield line_no, None
+            elif line.strip():
+                yield line_no, line
+        if len(buf) > STREAM_MAX_LINE_BYTES:
+            oversized, buf = True, b""
+    if oversized:
+        yield line_no + 1, None
+    elif buf.strip():
+        yield line_no + 1, buf
+
+def _parse_stream_entry(line_no: int, obj) -> tuple:
+    # (line_no, record, error): exactly one of record/error is set
+    try:
+        return line_no, parse_record(obj), None
+    except ValidationError as e:
+        return line_no, None, "; ".join(
+            f"{'.'.join(map(str, err['loc']))}: {err['msg']}" if err["loc"] else err["msg"]
+            for err in e.errors())
+
+async def _ndjson_entries(chunks):
+    async for line_no, line in _ndjson_lines(chunks):
+        if line is None:
+            yield line_no, None, f"line exceeds STREAM_MAX_LINE_BYTES={STREAM_MAX_LINE_BYTES}"
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"invalid JSON: {e}"
+            continue
+        yield _parse_stream_entry(line_no, obj)
+
+async def _msgpack_entries(chunks):
+    # Entries are numbered by position; a broken object ends the stream
+    stream = codec.MsgpackStream(STREAM_MAX_LINE_BYTES)
+    n = 0
+    try:
+        async for chunk in chunks:
+            for obj in stream.feed(chunk):
+                n += 1
+                yield _parse_stream_entry(n, obj)
+        stream.close()
+    except codec.BodyError as e:
+        yield n + 1, None, str(e)
+
+async def _start_chunk(entries: List[tuple], live: bool) -> tuple:
+    records = [record for _, record, _ in entries if record is not None]
+    activity = observe_sources(records) if live else [None] * len(records)
+    if admission is None or not records:
+        fut, near = submit_scores(records)
+        return entries, fut, near, activity, time.perf_counter()
+    # Backfills yield to every queued /predict request, however long they wait
+    await admission.acquire_background()
+    try:
+        fut, near = submit_scores(records)
+    except BaseException:
+        admission.release()
+        raise
+    admission.release_when_done(fut, time.monotonic())
+    return entries, fut, near, activity, time.perf_counter()
+
+async def _finish_chunk(chunk: tuple, use_msgpack: bool) -> bytes:
+    entries, fut, near, activity, start = chunk
+    chunk_scores = await _await(fut)
+    scores, near, activity = iter(chunk_scores), iter(near), iter(activity)
+    latency_ms = int((time.perf_counter() - start) * 1000)
+    out = []
+    for line_no, record, error in entries:
+        if error is not None:
+            result = {"line": line_no, "error": error}
+        else:
+            result = {"line": line_no, **build_response(record, *next(scores), latency_ms, next(activity),
+                                                        next(near))}
+        try:
+            out.append(codec.encode_stream_item(result, use_msgpack))
+        except ValueError:  # NaN / Infinity score: report it on its line, keep the stream valid
+            out.append(codec.encode_stream_item({"line": line_no, "error": "result is not valid JSON"},
+                                                use_msgpack))
+    # Queue only (the shadow thread scores later); the chunk goes out right after
+    offer_shadow([record for _, record, _ in entries if record is not None], chunk_scores)
+    return b"".join(out)
+
+async def _stream_results(request: Request, use_msgpack: bool, live: bool):
+    # One chunk is scored while the next one is read, so at most two chunks
+    # of events are held no matter how long the stream is.
+    with metrics.track_request("predict_stream"):
+        if codec.is_msgpack(request.headers.get("content-type")):
+            reader = _msgpack_entries(request.stream())
+        else:
+            reader = _ndjson_entries(request.stream())
+        pending = None
+        entries = []
+        try:
+            async for entry in reader:
+                entries.append(entry)
+                if len(entries) >= STREAM_BATCH_SIZE:
+                    if pending is not None:
+                        yield await _finish_chunk(pending, use_msgpack)
+                    pending, entries = await _start_chunk(entries, live), []
+        except ClientDisconnect:
+            logger.warning("⚠️ /predict/stream client disconnected")
+            return
+        if pending is not None:
+            yield await _finish_chunk(pending, use_msgpack)
+        if entries:
+            yield await _finish_chunk(await _start_chunk(entries, live), use_msgpack)
+
+@app.post("/predict/stream")
+async def predict_stream(request: Request, live: bool = False):
+    """Score an NDJSON body of events; NDJSON results stream back in input order.
+
+    Each result carries the input `line` number; lines that do not parse come
+    back as {"line": n, "error": ...} and the stream carries on. With
+    msgpack (see codec.py) the body and/or the results are concatenated
+    msgpack maps instead, `line` being the position in the stream; there a
+    broken object ends the stream after its error entry. Results are
+    sent while the body is still uploading, so the client has to read them
+    as it sends (curl, Node http and async clients with separate reader and
+    writer tasks do); a client that only reads after sending everything will
+    stall once the socket buffers fill.
+
+    Streams are mostly backfills and replays, so their events are not counted
+    in the live per-source rates and get no rate boost; ?live=true counts
+    them like /predict does, for a live feed sent as a stream.
+    """
+    require_models()
+    use_msgpack = codec.wants_msgpack(request.headers.get("accept"))
+    if use_msgpack or codec.is_msgpack(request.headers.get("content-type")):
+        if codec.msgpack is None:
+            raise HTTPException(status_code=415, detail="msgpack is not installed on this server")
+    media_type = codec.MSGPACK_MEDIA_TYPE if use_msgpack else "application/x-ndjson"
+    return DuplexStreamingResponse(_stream_results(request, use_msgpack, live), media_type=media_type)
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "enabled": CACHE_ENABLED,
+        **cache.stats(),
+        "near_duplicates": near_duplicates.stats() if near_duplicates is not None else None,
+    }
+
+# --------------------------
+# Metrics
+# --------------------------
+def metrics_snapshot() -> dict:
+    current = models
+    return {
+        "cache": {**cache.stats(),
+                  "near_duplicates": near_duplicates.stats() if near_duplicates is not None else None},
+        "models": current.status(),
+        "model_version": current.version,
+        "ready": current.ready,
+        "queue_depth": batcher.pending() if batcher is not None else 0,
+        "admission": admission.stats() if admission is not None else None,
+    }
+
+@app.get("/metrics")
+def metrics_endpoint():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+# --------------------------
+# Admin Endpoints
+# --------------------------
+def require_admin(token: Optional[str]):
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def reload_via_master(reason: str) -> JSONResponse:
+    # A worker reloading on its own would drop out of the shared copy-on-write
+    # pages; the master reloads once and replaces the workers instead
+    os.kill(PREFORK_MASTER_PID, signal.SIGHUP)
+    return JSONResponse({
+        "status": "scheduled",
+        "reason": reason,
+        "master_pid": PREFORK_MASTER_PID,
+        "timestamp": datetime.utcnow().isoformat()
+    }, status_code=202)
+
+@app.get("/admin/models")
+def admin_models(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    current = models
+    return {
+        "version": current.version,
+        "ready": current.ready,
+        "loaded_at": datetime.utcfromtimestamp(current.loaded_at).isoformat() if current.loaded_at else None,
+        "models": current.status(),
+        "last_reload": last_reload
+    }
+
+@app.post("/admin/reload")
+def admin_reload(x_admin_token: Optional[str] = Header(None)):
+    # Plain def: runs in the threadpool, the event loop keeps serving meanwhile
+    require_admin(x_admin_token)
+    require_models()
+    if PREFORK_MASTER_PID:
+        return reload_via_master("admin request")
+    result = reload_models("admin request")
+    return JSONResponse(result, status_code=200 if result["status"] == "swapped" else 409)
+
+@app.get("/admin/signatures")
+def admin_signatures(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    current = signatures
+    categories: Dict[str, int] = {}
+    for sigs in current.by_pattern.values():
+        for sig in sigs:
+            categories[sig.category] = categories.get(sig.category, 0) + 1
+    return {"version": current.version, "count": len(current), "categories": categories}
+
+@app.get("/admin/activity")
+def admin_activity(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    if source_activity is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        **source_activity.stats(),
+        "rate_baseline": RATE_BASELINE,
+        "rate_saturation": RATE_SATURATION,
+        "rate_weight": RATE_WEIGHT,
+        # Per worker under serve.py; the counts behind them are shared
+        "heavy_hitters": source_activity.heavy_hitters(),
+    }
+
+@app.get("/admin/admission")
+def admin_admission(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    if admission is None:
+        return {"enabled": False}
+    return {"enabled": True, **admission.stats()}  # per worker under serve.py
+
+@app.get("/admin/prediction-log")
+def admin_prediction_log(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    if prediction_log is None:
+        return {"enabled": False}
+    return {"enabled": True, **prediction_log.stats()}  # per worker under serve.py
+
+def check_memory_group(group: str):
+    if group not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=422, detail="group must be lineno, filename or traceback")
+
+@app.get("/admin/memory")
+def admin_memory(top: int = 20, group: str = "lineno", x_admin_token: Optional[str] = Header(None)):
+    # Per worker under serve.py; pss shows what each one costs given the shared model pages
+    require_admin(x_admin_token)
+    check_memory_group(group)
+    current = models
+    report = memory_report(current, {
+        "feature_cache": cache.features,
+        "score_cache": cache.scores,
+        "near_duplicates": near_duplicates,
+        "source_activity": source_activity,  # shared by all workers
+    }, allocation_profiler, max(top, 1), group)
+    report["model_version"] = current.version
+    report["shadow_models"] = model_memory(shadow_models) if shadow_models is not None else None
+    return report
+
+@app.post("/admin/memory/profile/start")
+def admin_memory_profile_start(frames: int = MEMORY_PROFILE_FRAMES, seconds: float = MEMORY_PROFILE_SECONDS,
+                               x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    status = allocation_profiler.start(frames, seconds)
+    logger.info(f"✅ Allocation profiling on ({status['frames']} frames, {seconds or 'no'} seconds limit)")
+    return status
+
+@app.post("/admin/memory/profile/stop")
+def admin_memory_profile_stop(top: int = 20, group: str = "lineno", x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    check_memory_group(group)
+    report = allocation_profiler.stop(max(top, 1), group)
+    if report is None:
+        raise HTTPException(status_code=409, detail="Allocation profiling is not running")
+    return report
+
+@app.get("/admin/shadow")
+def admin_shadow(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    if not SHADOW_MODEL_DIR:
+        return {"enabled": False}
+    current = shadow_models
+    return {
+        "enabled": True,
+        "directory": SHADOW_MODEL_DIR,
+        "primary_version": models.version,
+        "version": current.version if current else None,
+        "models": current.status() if current else None,
+        "last_load": last_shadow_load,
+        # Per worker under serve.py
+        "stats": shadow.stats() if shadow is not None else None,
+    }
+
+@app.post("/admin/shadow/reload")
+def admin_shadow_reload(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    if not SHADOW_MODEL_DIR:
+        raise HTTPException(status_code=404, detail="SHADOW_MODEL_DIR is not set")
+    if PREFORK_MASTER_PID:
+        return reload_via_master("shadow reload")
+    result = load_shadow_models("admin request")
+    return JSONResponse(result, status_code=200 if result["status"] == "loaded" else 409)
+
+@app.post("/admin/signatures/reload")
+def admin_signatures_reload(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    if PREFORK_MASTER_PID:
+        return reload_via_master("signature reload")
+    result = load_signatures("admin request")
+    return JSONResponse(result, status_code=200 if result["status"] == "loaded" else 409)
+
 # --------------------------
 # Run the FastAPI server
 # --------------------------
@@ -0,0 +1,232 @@
+# batch_score.py — Re-score JSONL log files offline, across a process pool
+#
+#   python batch_score.py ../mock-data/cowrie.json --output scored.ndjson
+#   python batch_score.py logs/cowrie.json.* --output scored.parquet --workers 8
+#
+# Inputs are Cowrie, telnet or HTTP/FTP honeypot logs, or /predict-shaped
+# records (cowrie.parse_line), optionally gzipped. Each worker loads the
+# model set and signatures like the service does and scores chunks with
+# app.score_records, i.e. the same features, models, fusion and signature
+# override as /predict. Rows come out in input order.
+#
+# Offline scores are per event: the source rate boost only exists for live
+# traffic, and near-duplicate collapsing is off so every row gets its own
+# model scores.
+
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from cowrie import parse_line
+
+logger = logging.getLogger("ml_service")
+
+# --------------------------
+# Worker side
+# --------------------------
+_service = None
+
+def init_worker():
+    """Load models and signatures into this process's copy of the service."""
+    global _service
+    import app as service  # imported here: the parent never loads models
+
+    service.limit_framework_threads()
+    candidate = service.load_model_set(service.MODEL_PATHS, ae_dtype=service.AE_DTYPE)
+    if not service.warm_up(candidate):
+        raise RuntimeError("models incomplete or warm-up failed, refusing to score degraded")
+    service.models = candidate
+    service.cache.set_version(candidate.version)
+    service.load_signatures("batch scoring")
+    service.source_activity = None
+    service.near_duplicates = None
+    service.models_loaded.set()
+    _service = service
+
+def score_chunk(chunk: List[Tuple[str, int, dict]]) -> List[Dict]:
+    """One output row per (source, line number, record)."""
+    results = _service.score_records([record for _, _, record in chunk])
+    version = _service.models.version
+    return [_row(source, line_no, record, result, version)
+            for (source, line_no, record), result in zip(chunk, results)]
+
+def _row(source: str, line_no: int, record: dict, result: dict, version: str) -> Dict:
+    explanation = result["explanation"]
+    return {
+        "source": source,
+        "line": line_no,
+        "timestamp": record.get("timestamp"),
+        "honeypotId": record["honeypotId"],
+        "srcIp": record["srcIp"],
+        "event": record["event"],
+        "payload": record["payload"],
+        "score": result["score"],
+        "label": result["label"],
+        "if_score": explanation["if_score"],
+        "ae_score": explanation["ae_score"],
+        "matched_tokens": explanation["matched_tokens"] or [],
+        "matched_categories": explanation["matched_categories"] or [],
+        "reason": explanation["reason"],
+        "model_version": version,
+    }
+
+# --------------------------
+# Input
+# --------------------------
+def _open_text(path: str):
+    # utf-8-sig: exported logs may start with a BOM
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8-sig", errors="replace")
+    return open(path, encoding="utf-8-sig", errors="replace")
+
+def read_chunks(paths: List[str], chunk_size: int, limit: Optional[int], stats: Dict) -> Iterator[List[tuple]]:
+    """Lists of (source, line number, record), read lazily; unscoreable lines are counted."""
+    chunk: List[tuple] = []
+    remaining = limit
+    for path in paths:
+        with _open_text(path) as f:
+            for line_no, line in enumerate(f, 1):
+                stats["lines"] += 1
+                record = parse_line(line)
+                if record is None:
+                    stats["skipped"] += 1
+                    continue
+                chunk.append((path, line_no, record))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+                if remaining is not None:
+                    remaining -= 1
+                    if remaining <= 0:
+                        if chunk:
+                            yield chunk
+                        return
+    if chunk:
+        yield chunk
+
+# --------------------------
+# Output
+# --------------------------
+class NdjsonWriter:
+    def __init__(self, path: str):
+        self._f = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+    def write(self, rows: List[Dict]):
+        self._f.write("".join(json.dumps(row) + "\n" for row in rows))
+
+    def close(self):
+        if self._f is sys.stdout:
+            self._f.flush()
+        else:
+            self._f.close()
+
+class ParquetWriter:
+    """One row group per scored chunk; needs pyarrow (requirements.txt)."""
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("❌ Parquet output needs pyarrow: pip install pyarrow")
+        self._pa = pa
+        self.schema = pa.schema([
+            ("source", pa.string()), ("line", pa.int64()), ("timestamp", pa.string()),
+            ("honeypotId", pa.string()), ("srcIp", pa.string()), ("event", pa.string()),
+            ("payload", pa.string()), ("score", pa.float64()), ("label", pa.string()),
+            ("if_score", pa.float64()), ("ae_score", pa.float64()),
+            ("matched_tokens", pa.list_(pa.string())), ("matched_categories", pa.list_(pa.string())),
+            ("reason", pa.string()), ("model_version", pa.string()),
+        ])
+        self._writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows: List[Dict]):
+        self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+def open_writer(path: str, fmt: Optional[str]):
+    fmt = fmt or ("parquet" if path.endswith(".parquet") else "ndjson")
+    if fmt == "parquet" and path == "-":
+        raise SystemExit("❌ Parquet output needs a file path")
+    return ParquetWriter(path) if fmt == "parquet" else NdjsonWriter(path)
+
+# --------------------------
+# Driver
+# --------------------------
+def score_files(paths: List[str], writer, workers: int, chunk_size: int = 512,
+                limit: Optional[int] = None, progress_every: float = 10.0) -> Dict:
+    """Score every record in `paths` into `writer`, in input order.
+
+    workers=0 scores in this process. Otherwise at most 2 chunks per worker
+    are in flight, so memory stays bounded however long the input is.
+    The float32 autoencoder's scores can move in the last bits with
+    `chunk_size` (like /predict/batch sizes do), never with `workers`.
+    """
+    stats = {"lines": 0, "skipped": 0, "scored": 0, "anomalous": 0, "workers": workers}
+    chunks = read_chunks(paths, chunk_size, limit, stats)
+    start = last_report = time.perf_counter()
+
+    def emit(rows: List[Dict]):
+        nonlocal last_report
+        writer.write(rows)
+        stats["scored"] += len(rows)
+        stats["anomalous"] += sum(row["label"] == "anomalous" for row in rows)
+        now = time.perf_counter()
+        if progress_every and now - last_report >= progress_every:
+            last_report = now
+            logger.info(f"Scored {stats['scored']} events ({stats['scored'] / (now - start):.0f}/s)")
+
+    if workers <= 0:
+        init_worker()
+        for chunk in chunks:
+            emit(score_chunk(chunk))
+    else:
+        # spawn: same start method as the service's process executor
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=init_worker) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(score_chunk, chunk))
+                if len(pending) >= 2 * workers:
+                    emit(pending.popleft().result())
+            while pending:
+                emit(pending.popleft().result())
+
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    stats["events_per_s"] = round(stats["scored"] / stats["seconds"], 1) if stats["seconds"] else None
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score JSONL honeypot logs offline with the service's models")
+    parser.add_argument("inputs", nargs="+", help="JSONL log files (.gz allowed)")
+    parser.add_argument("--output", "-o", default="-", help="output file, - for stdout (NDJSON only)")
+    parser.add_argument("--format", choices=["ndjson", "parquet"],
+                        help="default: parquet for *.parquet outputs, ndjson otherwise")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="scoring processes (0 = score in this process)")
+    parser.add_argument("--chunk-size", type=int, default=512, help="records per scoring call")
+    parser.add_argument("--limit", type=int, help="stop after this many scoreable records")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s", stream=sys.stderr)
+    # Absolute before any worker imports app, which changes into the service directory
+    inputs = [os.path.abspath(p) for p in args.inputs]
+    output = args.output if args.output == "-" else os.path.abspath(args.output)
+
+    writer = open_writer(output, args.format)
+    try:
+        stats = score_files(inputs, writer, args.workers, max(args.chunk_size, 1), args.limit)
+    finally:
+        writer.close()
+    logger.info(f"✅ Scored {stats['scored']} events ({stats['anomalous']} anomalous) from {stats['lines']} lines "
+                f"in {stats['seconds']}s, {stats['events_per_s']} events/s with {args.workers} workers")
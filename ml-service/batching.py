@@ -0,0 +1,143 @@
+# batching.py — Micro-batcher that coalesces concurrent single-event calls
+
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger("ml_service")
+
+_STOP = object()
+
+class MicroBatcher:
+    """Queue single items and hand them to `fn` in groups.
+
+    A background thread takes the first queued item, then keeps collecting
+    until `window_ms` has elapsed since that item arrived or `max_batch_size`
+    items are pending, and calls `fn(items)` once for the group. `fn` must
+    return one result per item, in order. Every caller gets a Future that
+    resolves to its own result (or to the exception raised by `fn`).
+
+    With an `executor`, groups are handed off to it and the batcher goes
+    straight back to collecting, so several groups can be scored at once.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], window_ms: float = 2.0,
+                 max_batch_size: int = 32, name: str = "microbatcher",
+                 executor: Optional[Executor] = None):
+        self.fn = fn
+        self.executor = executor
+        self.window = max(window_ms, 0.0) / 1000.0
+        self.max_batch_size = max(int(max_batch_size), 1)
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+
+    # --------------------------
+    # Lifecycle
+    # --------------------------
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    # --------------------------
+    # Submission
+    # --------------------------
+    def submit(self, item) -> Future:
+        fut = Future()
+        self._queue.put((item, fut))
+        return fut
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    # --------------------------
+    # Worker loop
+    # --------------------------
+    def _collect(self, first) -> tuple:
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _drain(self):
+        # Items queued behind the stop marker still get an answer
+        pending = []
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not _STOP:
+                pending.append(entry)
+        for i in range(0, len(pending), self.max_batch_size):
+            self._flush(pending[i:i + self.max_batch_size])
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is _STOP:
+                break
+            batch, stopping = self._collect(entry)
+            self._flush(batch)
+            if stopping:
+                break
+        self._drain()
+
+    def _flush(self, batch):
+        items = [item for item, _ in batch]
+        futures = [fut for _, fut in batch]
+
+        def _resolve(results=None, error=None):
+            if error is not None:
+                logger.error(f"❌ {self.name} batch of {len(items)} failed: {error}")
+                for fut in futures:
+                    fut.set_exception(error)
+                return
+            for fut, result in zip(futures, results):
+                fut.set_result(result)
+
+        if self.executor is None:
+            try:
+                results = self.fn(items)
+            except Exception as e:
+                _resolve(error=e)
+            else:
+                _resolve(results)
+            return
+
+        try:
+            job = self.executor.submit(self.fn, items)
+        except Exception as e:  # executor shut down
+            _resolve(error=e)
+            return
+
+        def _on_done(job: Future):
+            error = job.exception()
+            if error is not None:
+                _resolve(error=error)
+            else:
+                _resolve(job.result())
+
+        job.add_done_callback(_on_done)
@@ -0,0 +1,442 @@
+# benchmark.py — Replayable /predict benchmarks, in-process or over HTTP
+#
+#   python benchmark.py --replay ../mock-data/cowrie.json --concurrency 1,8,32
+#   python benchmark.py --synthetic n=2000,len=256,repeat=0.5 --synthetic n=2000,len=16:2048
+#   python benchmark.py --url http://localhost:8001 --replay ../mock-data/cowrie.json
+#   python benchmark.py --formats json,msgpack --concurrency 8
+#   python benchmark.py --codec                 # protocol cost per request only
+#   python benchmark.py --compare old.json new.json
+#
+# Without --url the service runs in this process (ASGI, no network), which
+# also gives exact per-stage percentiles. With --url the stages come from
+# the server's /metrics histograms (bucket estimates). Results are saved as
+# JSON (--out) tagged with the commit, so runs can be compared later.
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from itertools import product
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# --------------------------
+# Workloads
+# --------------------------
+def _text_record(line: str) -> Optional[dict]:
+    # Any other JSON object: its string fields become one payload
+    try:
+        obj = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(obj, dict):
+        return None
+    text = " ".join(str(v) for v in obj.values() if isinstance(v, str)).strip()
+    if not text:
+        return None
+    return {"honeypotId": "replay", "srcIp": "0.0.0.0", "event": "replay.text", "payload": text}
+
+def load_replay(path: str, limit: Optional[int] = None) -> List[dict]:
+    """Cowrie events, /predict records or (fallback) any JSON objects per line."""
+    from cowrie import parse_line
+
+    records = []
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f:
+            record = parse_line(line) or _text_record(line)
+            if record is not None:
+                records.append(record)
+            if limit and len(records) >= limit:
+                break
+    if not records:
+        raise ValueError(f"No replayable events in {path}")
+    return records
+
+SHELL_TOKENS = [
+    "ls", "-la", "cat", "/etc/passwd", "/proc/cpuinfo", "uname", "-a", "cd", "/tmp", "wget",
+    "curl", "-O", "http://203.0.113.7/x.sh", "chmod", "+x", "./x.sh", "echo", "busybox",
+    "nproc", "free", "-m", "ps", "aux", "grep", "root", "sh", "-c", "rm", "-rf", "history",
+    "crontab", "-l", "export", "PATH=/usr/bin", "id", "whoami", "tar", "xzf", "python3",
+]
+
+def parse_spec(spec: str) -> Dict[str, str]:
+    # "n=2000,len=16:2048,repeat=0.5,seed=1"
+    out = {}
+    for part in filter(None, spec.split(",")):
+        key, _, value = part.partition("=")
+        out[key.strip()] = value.strip()
+    return out
+
+def synthetic(n: int = 1000, length: str = "64", repeat: float = 0.0, seed: int = 0,
+              salt: str = "") -> List[dict]:
+    """`n` shell-like events; `repeat` of them reuse an earlier payload.
+
+    `length` is a fixed payload length or "lo:hi" (log-uniform). `salt`
+    makes every unique payload differ between runs so server caches do
+    not carry over.
+    """
+    rng = random.Random(seed)
+    lo, _, hi = length.partition(":")
+    lo, hi = int(lo), int(hi or lo)
+    unique: List[str] = []
+    records = []
+    for i in range(n):
+        if unique and rng.random() < repeat:
+            payload = rng.choice(unique)
+        else:
+            target = int(round(np.exp(rng.uniform(np.log(lo), np.log(hi))))) if hi > lo else lo
+            words = [f"{salt}{i}"]
+            while sum(len(w) + 1 for w in words) < target:
+                words.append(rng.choice(SHELL_TOKENS))
+            payload = " ".join(words)[:target]
+            unique.append(payload)
+        records.append({"honeypotId": "bench", "srcIp": f"198.51.100.{i % 250}",
+                        "event": "cowrie.command.input", "payload": payload})
+    return records
+
+def build_workloads(args, salt: str) -> List[tuple]:
+    workloads = []
+    for path in args.replay or []:
+        name = f"replay:{os.path.basename(path)}"
+        workloads.append((name, load_replay(path, args.limit), {"source": path}))
+    for spec in args.synthetic or []:
+        params = parse_spec(spec)
+        records = synthetic(int(params.get("n", 1000)), params.get("len", "64"),
+                            float(params.get("repeat", 0.0)), int(params.get("seed", 0)), salt)
+        workloads.append((f"synthetic:{spec}", records, params))
+    return workloads
+
+# --------------------------
+# Stats
+# --------------------------
+def percentiles_ms(seconds: List[float]) -> Dict[str, float]:
+    if not seconds:
+        return {}
+    ms = np.asarray(seconds) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"count": len(ms), "mean_ms": round(float(ms.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(ms.max()), 3)}
+
+def stage_histograms(metrics_text: str) -> Dict[str, Dict[float, float]]:
+    """Cumulative bucket counts per stage from a /metrics scrape."""
+    from prometheus_client.parser import text_string_to_metric_families
+
+    out: Dict[str, Dict[float, float]] = {}
+    for family in text_string_to_metric_families(metrics_text):
+        if family.name != "ml_stage_duration_seconds":
+            continue
+        for sample in family.samples:
+            if sample.name.endswith("_bucket"):
+                le = float(sample.labels["le"])
+                out.setdefault(sample.labels["stage"], {})[le] = sample.value
+    return out
+
+def histogram_percentiles_ms(before: Dict, after: Dict) -> Dict[str, Dict[str, float]]:
+    # Same linear interpolation inside a bucket as Prometheus' histogram_quantile
+    stats = {}
+    for stage, buckets in after.items():
+        bounds = sorted(buckets)
+        counts = [buckets[b] - before.get(stage, {}).get(b, 0.0) for b in bounds]
+        total = counts[-1] if counts else 0
+        if total <= 0:
+            continue
+        entry = {"count": int(total)}
+        for q in (50, 95, 99):
+            rank = total * q / 100
+            for i, (bound, cum) in enumerate(zip(bounds, counts)):
+                if cum >= rank:
+                    lower = bounds[i - 1] if i else 0.0
+                    prev = counts[i - 1] if i else 0.0
+                    if bound == float("inf"):
+                        value = lower
+                    else:
+                        value = lower + (bound - lower) * (rank - prev) / max(cum - prev, 1e-12)
+                    entry[f"p{q}_ms"] = round(value * 1000, 3)
+                    break
+        stats[stage] = entry
+    return stats
+
+# --------------------------
+# Driver
+# --------------------------
+FORMAT_HEADERS = {
+    "json": {"content-type": "application/json"},
+    "msgpack": {"content-type": "application/msgpack", "accept": "application/msgpack"},
+}
+
+def encode_request(record: dict, fmt: str) -> bytes:
+    if fmt == "msgpack":
+        import msgpack
+        return msgpack.packb(record, use_bin_type=True)
+    return json.dumps(record).encode()
+
+async def drive(client, path: str, records: List[dict], concurrency: int, fmt: str = "json") -> dict:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    errors = 0
+    # Bodies are encoded up front: latency is the service's, not the client's
+    headers = FORMAT_HEADERS[fmt]
+    events = iter([encode_request(r, fmt) for r in records])
+
+    async def worker():
+        nonlocal errors
+        for body in events:  # shared iterator: each event is sent once
+            start = time.perf_counter()
+            try:
+                resp = await client.post(path, content=body, headers=headers)
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(records) / elapsed, 1),
+        "latency": percentiles_ms(latencies),
+        "status_codes": {str(k): v for k, v in sorted(statuses.items())},
+        "client_errors": errors,
+    }
+
+async def run_inprocess(workloads, concurrencies, args) -> dict:
+    import httpx
+    import app as service
+    import metrics
+
+    await service.app.router.startup()
+    try:
+        while not service.models_loaded.is_set():
+            await asyncio.sleep(0.05)
+        settings = {
+            "scoring_executor": service.SCORING_EXECUTOR,
+            "scoring_workers": service.SCORING_WORKERS,
+            "microbatch": service.MICROBATCH_ENABLED,
+            "microbatch_window_ms": service.MICROBATCH_WINDOW_MS,
+            "cache": service.CACHE_ENABLED,
+            "rate_features": service.RATE_FEATURES_ENABLED,
+            "admission_max_in_flight": service.ADMISSION_MAX_IN_FLIGHT if service.ADMISSION_ENABLED else None,
+            "admission_deadline_ms": service.ADMISSION_DEADLINE_MS if service.ADMISSION_ENABLED else None,
+            "ae_precision": service.AE_PRECISION,
+            "if_precision": service.IF_PRECISION,
+            "model_version": service.models.version,
+        }
+
+        stage_times: Dict[str, List[float]] = {}
+
+        def _listener(stage: str, seconds: float):
+            stage_times.setdefault(stage, []).append(seconds)
+
+        metrics.add_stage_listener(_listener)
+        transport = httpx.ASGITransport(app=service.app)
+        runs = []
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+            for name, records, params in workloads:
+                for concurrency, fmt in product(concurrencies, args.formats):
+                    service.cache.features.clear()
+                    service.cache.scores.clear()
+                    if service.near_duplicates is not None:
+                        service.near_duplicates.clear()
+                    if service.source_activity is not None:
+                        service.source_activity.clear()
+                    stage_times.clear()
+                    run = await drive(client, "/predict", records, concurrency, fmt)
+                    if service.SCORING_EXECUTOR == "process":
+                        stage_stats, method = {}, "unavailable (process executor)"
+                    else:
+                        stage_stats = {s: percentiles_ms(v) for s, v in stage_times.items()}
+                        method = "exact"
+                    runs.append({"workload": name, "params": params, "events": len(records),
+                                 "concurrency": concurrency, "format": fmt, **run,
+                                 "stages": stage_stats, "stage_method": method})
+                    print_run(runs[-1])
+        metrics.remove_stage_listener(_listener)
+        return {"settings": settings, "runs": runs}
+    finally:
+        await service.app.router.shutdown()
+
+async def run_http(workloads, concurrencies, args) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=max(concurrencies), max_keepalive_connections=max(concurrencies))
+    runs = []
+    async with httpx.AsyncClient(base_url=args.url, timeout=120, limits=limits) as client:
+        health = await client.get("/health/ready")
+        settings = {"url": args.url, "ready": health.status_code == 200}
+        try:
+            settings["models"] = (await client.get("/admin/models")).json()
+        except Exception:
+            pass
+        for name, records, params in workloads:
+            for concurrency, fmt in product(concurrencies, args.formats):
+                before = stage_histograms((await client.get("/metrics")).text)
+                run = await drive(client, "/predict", records, concurrency, fmt)
+                after = stage_histograms((await client.get("/metrics")).text)
+                runs.append({"workload": name, "params": params, "events": len(records),
+                             "concurrency": concurrency, "format": fmt, **run,
+                             "stages": histogram_percentiles_ms(before, after),
+                             "stage_method": "histogram"})
+                print_run(runs[-1])
+    return {"settings": settings, "runs": runs}
+
+# --------------------------
+# Protocol cost
+# --------------------------
+def codec_costs(records: List[dict], repeats: int = 5) -> Dict[str, Dict[str, float]]:
+    """µs per request spent decoding/validating the body and encoding the response.
+
+    No model work: responses come from build_response with fixed scores.
+    "pydantic_json" is the path FastAPI took before codec.py (typed body,
+    .dict(), response_model validation and jsonable_encoder).
+    """
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    import app as service
+    import codec
+
+    activity = {"events": 1, "window_seconds": 60.0, "rate_per_min": 1.0, "heavy_hitter": False}
+    responses = [service.build_response(r, 0.5, 0.5, 1, activity) for r in records]
+
+    def _timed(fn) -> float:
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for i, r in enumerate(records):
+                fn(i, r)
+            best = min(best, time.perf_counter() - start)
+        return round(best / len(records) * 1e6, 2)
+
+    out = {}
+    json_bodies = [encode_request(r, "json") for r in records]
+    out["pydantic_json"] = {
+        "request_us": _timed(lambda i, r: service.PredictRequest.parse_obj(json.loads(json_bodies[i])).dict()),
+        "response_us": _timed(lambda i, r: JSONResponse(
+            jsonable_encoder(service.PredictResponse(**responses[i]))).body),
+        "request_bytes": round(sum(map(len, json_bodies)) / len(records), 1),
+    }
+    for fmt in ("json", "msgpack"):
+        bodies = [encode_request(r, fmt) for r in records]
+        content_type = FORMAT_HEADERS[fmt]["content-type"]
+        use_msgpack = fmt == "msgpack"
+        out[fmt] = {
+            "request_us": _timed(lambda i, r: service.parse_record(codec.decode(bodies[i], content_type))),
+            "response_us": _timed(lambda i, r: codec.encode(responses[i], use_msgpack)),
+            "request_bytes": round(sum(map(len, bodies)) / len(records), 1),
+            "response_bytes": round(sum(len(codec.encode(x, use_msgpack)[0]) for x in responses) / len(records), 1),
+        }
+    for entry in out.values():
+        entry["total_us"] = round(entry["request_us"] + entry["response_us"], 2)
+    return out
+
+def print_codec(costs: Dict[str, Dict[str, float]]):
+    print(f"{'path':<15}{'request µs':>12}{'response µs':>13}{'total µs':>10}{'req bytes':>11}{'resp bytes':>12}")
+    for name, c in costs.items():
+        print(f"{name:<15}{c['request_us']:>12.2f}{c['response_us']:>13.2f}{c['total_us']:>10.2f}"
+              f"{c['request_bytes']:>11.1f}{c.get('response_bytes', float('nan')):>12.1f}")
+
+# --------------------------
+# Output
+# --------------------------
+def git_info() -> dict:
+    def _git(*cmd):
+        return subprocess.run(["git", *cmd], cwd=HERE, capture_output=True, text=True).stdout.strip()
+    try:
+        return {"commit": _git("rev-parse", "HEAD"), "dirty": bool(_git("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+def print_run(run: dict):
+    lat = run["latency"]
+    print(f"{run['workload']:<40} c={run['concurrency']:<4} {run.get('format', 'json'):<8}"
+          f"{run['throughput_rps']:>8.1f} req/s  "
+          f"p50 {lat.get('p50_ms', 0):7.2f}  p95 {lat.get('p95_ms', 0):7.2f}  p99 {lat.get('p99_ms', 0):7.2f} ms"
+          f"  codes {run['status_codes']}")
+    for stage, s in run["stages"].items():
+        print(f"    {stage:<20} n={s['count']:<6} p50 {s.get('p50_ms', 0):8.3f}  "
+              f"p95 {s.get('p95_ms', 0):8.3f}  p99 {s.get('p99_ms', 0):8.3f} ms")
+
+def compare(old_path: str, new_path: str):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"old {str(old.get('commit'))[:10]}  ->  new {str(new.get('commit'))[:10]}")
+    def _key(r):
+        return r["workload"], r["concurrency"], r.get("format", "json")
+
+    previous = {_key(r): r for r in old["runs"]}
+    for run in new["runs"]:
+        base = previous.get(_key(run))
+        if base is None:
+            continue
+        def _pct(a, b):
+            return f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+        print(f"{run['workload']:<40} c={run['concurrency']:<4} {run.get('format', 'json'):<8}"
+              f"throughput {base['throughput_rps']:.1f} -> {run['throughput_rps']:.1f} "
+              f"({_pct(base['throughput_rps'], run['throughput_rps'])})  "
+              f"p99 {base['latency']['p99_ms']:.2f} -> {run['latency']['p99_ms']:.2f} ms "
+              f"({_pct(base['latency']['p99_ms'], run['latency']['p99_ms'])})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /predict with replayed or synthetic workloads")
+    parser.add_argument("--replay", action="append", help="JSONL file to replay (repeatable)")
+    parser.add_argument("--synthetic", action="append",
+                        help="synthetic workload, e.g. n=2000,len=16:2048,repeat=0.5,seed=1 (repeatable)")
+    parser.add_argument("--limit", type=int, help="max events per replay file")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--formats", default="json", help="comma-separated body formats: json, msgpack")
+    parser.add_argument("--codec", action="store_true",
+                        help="only measure body decoding/encoding cost per request, per format")
+    parser.add_argument("--url", help="benchmark a running service instead of an in-process one")
+    parser.add_argument("--out", help="results JSON (default: benchmark-results/<time>-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if not (args.replay or args.synthetic):
+        args.replay = [os.path.join(HERE, "..", "mock-data", "cowrie.json")]
+    # Resolve before importing the service, which changes directory
+    args.replay = [os.path.abspath(p) for p in args.replay or []]
+    concurrencies = [int(c) for c in args.concurrency.split(",") if c]
+    args.formats = [f for f in args.formats.split(",") if f]
+
+    info = git_info()
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    out = os.path.abspath(args.out or os.path.join(
+        "benchmark-results", f"{stamp}-{(info['commit'] or 'nogit')[:10]}.json"))
+    workloads = build_workloads(args, salt=f"r{stamp}-")
+
+    if args.codec:
+        records = [r for _, workload, _ in workloads for r in workload]
+        result = {"codec": codec_costs(records)}
+        print_codec(result["codec"])
+    else:
+        runner = run_http if args.url else run_inprocess
+        result = asyncio.run(runner(workloads, concurrencies, args))
+
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({
+            **info,
+            "timestamp": stamp,
+            "mode": "codec" if args.codec else "http" if args.url else "in-process",
+            "host": {"cpus": os.cpu_count(), "python": sys.version.split()[0], "platform": platform.platform()},
+            **result,
+        }, f, indent=2)
+    print(f"✅ Results written to {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# cache.py — Prediction caches (LRU + TTL) and in-flight request coalescing
+
+import time
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+def digest(*parts: str) -> bytes:
+    """Stable 128-bit key for a tuple of strings."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update((part or "").encode("utf-8", "surrogatepass"))
+        h.update(b"\x00")
+    return h.digest()
+
+# --------------------------
+# LRU + TTL cache
+# --------------------------
+class TTLCache:
+    """Bounded LRU cache whose entries also expire `ttl` seconds after insert."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = max(int(maxsize), 0)
+        self.ttl = float(ttl)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, record_stats: bool = True) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._data[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                if record_stats:
+                    self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            if record_stats:
+                self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        if self.maxsize == 0:
+            return
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def sample(self, n: int) -> List[tuple]:
+        """Up to n (key, value) pairs, least recently used first (memory estimates)."""
+        with self._lock:
+            return [(key, entry[0]) for key, entry in itertools.islice(self._data.items(), max(n, 0))]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+# --------------------------
+# Singleflight
+# --------------------------
+class SingleFlight:
+    """Share one computation between concurrent callers asking for the same key.
+
+    `do(key, submit)` calls `submit()` (which returns a Future) only if no call
+    for `key` is already in flight; otherwise it returns the in-flight Future.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key, submit: Callable[[], Future]) -> Future:
+        with self._lock:
+            fut = self._calls.get(key)
+            if fut is not None:
+                self.shared += 1
+                return fut
+            fut = Future()
+            self._calls[key] = fut
+
+        def _done(inner: Future):
+            with self._lock:
+                self._calls.pop(key, None)
+            err = inner.exception()
+            if err is not None:
+                fut.set_exception(err)
+            else:
+                fut.set_result(inner.result())
+
+        try:
+            inner = submit()
+        except Exception as e:
+            inner = Future()
+            inner.set_exception(e)
+        inner.add_done_callback(_done)
+        return fut
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+# --------------------------
+# Two-level prediction cache
+# --------------------------
+class PredictionCache:
+    """Feature vectors (level 1) and model scores (level 2), tied to a model version.
+
+    Changing the version drops both levels so stale scores are never served.
+    """
+
+    def __init__(self, feature_size: int, score_size: int, ttl: float):
+        self.features = TTLCache(feature_size, ttl)
+        self.scores = TTLCache(score_size, ttl)
+        self.flight = SingleFlight()
+        self.version = None
+        self.invalidations = 0
+
+    def set_version(self, version):
+        if version == self.version:
+            return
+        self.features.clear()
+        self.scores.clear()
+        self.version = version
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model_version": self.version,
+            "invalidations": self.invalidations,
+            "features": self.features.stats(),
+            "scores": self.scores.stats(),
+            "coalesced": self.flight.shared,
+            "in_flight": self.flight.in_flight(),
+        }
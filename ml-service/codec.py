@@ -0,0 +1,111 @@
+# codec.py — Request and response bodies as JSON or msgpack
+#
+# Clients opt into msgpack per direction:
+#   Content-Type: application/msgpack   the request body is msgpack
+#   Accept: application/msgpack         the response body is msgpack
+# Anything else is JSON. Framing is the same in both formats:
+#   /predict          one map                 -> one map
+#   /predict/batch    {"events": [map, ...]}  -> {"results": [map, ...]}
+#   /predict/stream   NDJSON lines, or concatenated msgpack maps (the format
+#                     is self-delimiting), in and out
+
+import json
+from typing import Any, Iterator, List, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:  # JSON only
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_TYPES = {MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack"}
+JSON_MEDIA_TYPE = "application/json"
+
+class BodyError(ValueError):
+    """A body that cannot be decoded; `status_code` is the HTTP answer."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def _media_types(header: Optional[str]) -> List[str]:
+    return [part.split(";")[0].strip().lower() for part in (header or "").split(",")]
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return _media_types(content_type)[0] in MSGPACK_TYPES
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    # Only when asked for by name; */* and an empty Accept get JSON
+    return any(t in MSGPACK_TYPES for t in _media_types(accept))
+
+def _require_msgpack():
+    if msgpack is None:
+        raise BodyError("msgpack is not installed on this server", status_code=415)
+
+def decode(body: bytes, content_type: Optional[str]) -> Any:
+    if is_msgpack(content_type):
+        _require_msgpack()
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise BodyError(f"invalid msgpack: {str(e) or type(e).__name__}") from e
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise BodyError(f"invalid JSON: {e}") from e
+
+def _json(obj: Any) -> bytes:
+    # starlette's JSONResponse settings: NaN / Infinity are an error, not invalid JSON
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+def encode(obj: Any, use_msgpack: bool) -> Tuple[bytes, str]:
+    """(body, media type). JSON matches starlette's JSONResponse byte for byte."""
+    if use_msgpack:
+        _require_msgpack()
+        return msgpack.packb(obj, use_bin_type=True), MSGPACK_MEDIA_TYPE
+    return _json(obj), JSON_MEDIA_TYPE
+
+def encode_stream_item(obj: Any, use_msgpack: bool) -> bytes:
+    # One NDJSON line, or one msgpack object to concatenate
+    if use_msgpack:
+        return msgpack.packb(obj, use_bin_type=True)
+    return _json(obj) + b"\n"
+
+class MsgpackStream:
+    """Incremental decoder for a body of concatenated msgpack objects.
+
+    Holds at most one partial object of up to `max_object_bytes`. Unlike
+    NDJSON there is no way to resynchronize after a malformed or oversized
+    object, so those raise BodyError and end the stream.
+    """
+
+    def __init__(self, max_object_bytes: int):
+        _require_msgpack()
+        self.max_object_bytes = max_object_bytes
+        self._unpacker = msgpack.Unpacker(raw=False, max_buffer_size=max_object_bytes)
+        self._fed = 0
+
+    def feed(self, chunk: bytes) -> Iterator[Any]:
+        """Objects completed by `chunk`; raises BodyError after the last good one."""
+        # Slices keep one large network chunk of small objects under the limit
+        step = max(self.max_object_bytes // 2, 1)
+        for start in range(0, len(chunk), step):
+            piece = chunk[start:start + step]
+            try:
+                self._unpacker.feed(piece)
+            except msgpack.BufferFull:
+                raise BodyError(f"object exceeds {self.max_object_bytes} bytes")
+            self._fed += len(piece)
+            while True:
+                try:
+                    obj = next(self._unpacker)
+                except StopIteration:
+                    break
+                except Exception as e:
+                    raise BodyError(f"invalid msgpack: {str(e) or type(e).__name__}") from e
+                yield obj
+
+    def close(self):
+        if self._unpacker.tell() != self._fed:
+            raise BodyError("truncated msgpack object at end of stream")
@@ -0,0 +1,99 @@
+# cowrie.py — Honeypot JSON log events as the /predict records the backend sends
+#
+# Mirrors src/services/eventNormalizer.js (Cowrie, telnet) and
+# dionaeaWatcher.processLine (HTTP/FTP honeypot logs) + mlClient.preparePayload,
+# so offline tools (precision report, benchmarks, batch scoring) see the same
+# payloads the live service does.
+
+import json
+from typing import Iterator, Optional
+
+# eventNormalizer.shouldProcess
+IGNORED_EVENTS = {"cowrie.client.size", "cowrie.client.var", "cowrie.log.open"}
+
+def to_record(raw: dict, honeypot_id: str = "cowrie-1") -> dict:
+    event_type = raw.get("eventid") or "unknown"
+    parts = [str(raw.get("message") or "")]
+    if event_type == "cowrie.command.input" and raw.get("input"):
+        # the normalizer copies `input` into both `command` and `input_data`
+        parts += [str(raw["input"]), str(raw["input"])]
+    timestamp = raw.get("timestamp")
+    if timestamp and timestamp.endswith("Z"):
+        timestamp = timestamp[:-1]
+    return {
+        "honeypotId": honeypot_id,
+        "srcIp": raw.get("src_ip") or raw.get("src_host") or "unknown",
+        "event": event_type,
+        "payload": " ".join(parts).strip(),
+        "timestamp": timestamp,
+    }
+
+def _js_str(value) -> str:
+    # `${value}` in the backend: a JSON body object really is sent as "[object Object]"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return "[object Object]" if isinstance(value, dict) else ",".join(_js_str(v) for v in value)
+    return str(value)
+
+def honeypot_to_record(raw: dict) -> dict:
+    """Record for an HTTP/FTP honeypot log line (`eventType`, `sourceIP`)."""
+    kind = str(raw.get("service") or raw.get("protocol") or "http").lower()
+    message = raw.get("message")
+    if not message:
+        if kind == "http":
+            message = f"{raw.get('method') or 'GET'} {raw.get('path') or '/'}"
+        elif kind == "ftp":
+            message = f"FTP: {raw.get('command') or raw.get('action') or 'command'}"
+        else:
+            message = json.dumps(raw, separators=(",", ":"))[:100]
+    command = raw.get("command") or raw.get("path") or raw.get("method")
+    input_data = raw.get("body") or raw.get("request") or raw.get("command") or raw.get("payload")
+    parts = [_js_str(p) for p in (message, command, input_data) if p]
+    return {
+        "honeypotId": "cowrie-1",  # preparePayload sends the same id for every source
+        "srcIp": raw.get("sourceIP") or raw.get("src_ip") or raw.get("source_ip") or "0.0.0.0",
+        "event": str(raw.get("eventType") or raw.get("type") or f"{kind}.request"),
+        "payload": " ".join(parts).strip(),
+        "timestamp": raw.get("timestamp"),
+    }
+
+def parse_line(line: str) -> Optional[dict]:
+    """A /predict record from one JSONL line, or None if it is not scoreable.
+
+    Accepts raw Cowrie and telnet events (with `eventid`), HTTP/FTP honeypot
+    log lines (with `eventType`) and records that are already in /predict
+    shape (with `event` and `payload`).
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        obj = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(obj, dict):
+        return None
+    if "eventid" in obj:
+        if obj["eventid"] in IGNORED_EVENTS:
+            return None
+        return to_record(obj)
+    if "eventType" in obj:
+        return honeypot_to_record(obj)
+    if "event" in obj and "payload" in obj:
+        return {
+            "honeypotId": obj.get("honeypotId") or "replay",
+            "srcIp": obj.get("srcIp") or "0.0.0.0",
+            "event": str(obj["event"]),
+            "payload": str(obj["payload"] or ""),
+            "timestamp": obj.get("timestamp"),
+        }
+    return None
+
+def read_records(path: str) -> Iterator[dict]:
+    # utf-8-sig: exported logs (mock-data/cowrie.json included) may start with a BOM
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f:
+            record = parse_line(line)
+            if record is not None:
+                yield record
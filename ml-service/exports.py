@@ -0,0 +1,23 @@
+# exports.py — Helpers shared by the NumPy exports and the model loader
+#
+# No service or sklearn imports: the export scripts run on their own.
+
+import hashlib
+
+def file_digest(path: str) -> str:
+    """Short sha256 of a file; exports record it for the artifact they came from."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+def parity_batches(X, n_single: int = 16):
+    """`X` as one batch, then its first `n_single` rows one call each.
+
+    Single-row calls are the serving hot path, so export parity checks
+    compare them separately from the batched call.
+    """
+    yield X
+    for i in range(min(n_single, len(X))):
+        yield X[i:i + 1]
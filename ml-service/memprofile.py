@@ -0,0 +1,354 @@
+# memprofile.py — Where the service's memory goes
+#
+#   python memprofile.py                 # load the models, print the report
+#   python memprofile.py --json          # the same report as GET /admin/memory
+#   python memprofile.py --no-trace      # RSS without tracemalloc's own overhead
+#
+# The report has process RSS (and PSS: under serve.py the workers share the
+# model pages), RSS per mapped library (TensorFlow, sklearn, ...), an estimate
+# of each loaded artifact and cache, and tracemalloc's top allocators over a
+# window that can be switched on and off. Estimates walk the objects and count
+# what they reference; shared objects are counted once per estimate.
+
+import os
+import gc
+import sys
+import json
+import time
+import types
+import argparse
+import threading
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+_SKIP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+               types.MethodType, types.CodeType)
+_SCALARS = (str, bytes, bytearray, int, float, complex, bool, type(None), memoryview)
+_SAMPLE = 256  # entries per cache estimate
+_MIB = float(1 << 20)
+
+# --------------------------
+# Object estimates
+# --------------------------
+def deep_sizeof(obj, max_objects: int = 1_000_000) -> int:
+    """Bytes held by `obj` and everything it references (modules, classes and functions excluded).
+
+    NumPy arrays count their buffer (once, however many views share it).
+    Extension types without a __dict__ (sklearn's Cython trees) are walked
+    through their pickle state.
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < max_objects:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _SKIP_TYPES):
+            continue
+        seen.add(id(o))
+        try:
+            total += sys.getsizeof(o)
+        except TypeError:
+            pass
+        if isinstance(o, _SCALARS):
+            continue
+        if isinstance(o, np.ndarray):
+            # getsizeof includes the buffer only when the array owns it
+            if o.base is not None:
+                stack.append(o.base)
+            if o.dtype == object:
+                stack.extend(o.ravel().tolist())
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+            continue
+        if isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+            continue
+        state = getattr(o, "__dict__", None)
+        if state is not None:
+            stack.append(state)
+        for slot in getattr(type(o), "__slots__", ()):
+            value = getattr(o, slot, None)
+            if value is not None:
+                stack.append(value)
+        if state is None and hasattr(o, "__getstate__"):
+            try:
+                stack.append(o.__getstate__())
+            except Exception:
+                pass
+    return total
+
+def artifact_memory(obj) -> Dict:
+    if obj is None:
+        return {"loaded": False}
+    if hasattr(obj, "get_weights") and hasattr(obj, "count_params"):
+        # Keras model: its weights; TensorFlow's runtime shows up under mappings
+        size, method = sum(w.nbytes for w in obj.get_weights()), "weights"
+    else:
+        size, method = deep_sizeof(obj), "walk"
+    return {"loaded": True, "type": type(obj).__name__, "bytes": size, "method": method}
+
+def model_memory(models) -> Dict[str, Dict]:
+    from model_store import ARTIFACTS
+    return {name: artifact_memory(models.get(name)) for name in ARTIFACTS}
+
+def component_memory(obj) -> Optional[Dict]:
+    """Estimate for a cache or index; large ones are sampled and extrapolated."""
+    if obj is None:
+        return None
+    if hasattr(obj, "sample"):
+        entries = len(obj)
+        sample = obj.sample(_SAMPLE)
+        per_entry = deep_sizeof(sample) / len(sample) if sample else 0.0
+        return {"entries": entries, "bytes": int(per_entry * entries), "method": "sampled"}
+    if hasattr(obj, "nbytes"):
+        return {"bytes": int(obj.nbytes), "method": "nbytes"}
+    return {"bytes": deep_sizeof(obj), "method": "walk"}
+
+# --------------------------
+# Process
+# --------------------------
+def _proc_fields(path: str, fields: Dict[str, str]) -> Dict[str, int]:
+    # "Name:   1234 kB" lines -> bytes
+    out = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in fields:
+                    out[fields[name]] = out.get(fields[name], 0) + int(rest.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return out
+
+def process_memory() -> Dict[str, int]:
+    """RSS split (Linux /proc); PSS and private/shared bytes where smaps_rollup exists."""
+    out = _proc_fields("/proc/self/status", {
+        "VmRSS": "rss", "VmHWM": "peak_rss", "RssAnon": "rss_anon",
+        "RssFile": "rss_file", "RssShmem": "rss_shmem",
+    })
+    out.update(_proc_fields("/proc/self/smaps_rollup", {
+        "Pss": "pss", "Private_Clean": "private", "Private_Dirty": "private",
+        "Shared_Clean": "shared", "Shared_Dirty": "shared",
+    }))
+    if "rss" not in out:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        out["peak_rss"] = peak if sys.platform == "darwin" else peak * 1024
+    return out
+
+def _owner(path: str) -> str:
+    # The package a mapping belongs to: site-packages/<pkg>/..., else the file name
+    if not path:
+        return "[anon]"
+    if path.startswith("["):
+        return "[heap]" if path == "[heap]" else "[stack]" if path.startswith("[stack") else "[anon]"
+    marker = "-packages" + os.sep
+    if marker in path:
+        package = path.split(marker, 1)[1].split(os.sep, 1)[0]
+        return package[:-5] if package.endswith(".libs") else package
+    return os.path.basename(path)
+
+def mapped_memory(top: int = 15) -> List[Dict]:
+    """Resident bytes per owner of the mappings (shared libraries, heap, anonymous)."""
+    totals: Dict[str, int] = {}
+    owner = "[anon]"
+    try:
+        with open("/proc/self/smaps") as f:
+            for line in f:
+                head = line.split(None, 5)
+                if head and "-" in head[0] and not head[0].endswith(":"):
+                    owner = _owner(head[5].strip() if len(head) > 5 else "")
+                elif head and head[0] == "Rss:":
+                    totals[owner] = totals.get(owner, 0) + int(head[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        return []
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"owner": name, "rss": size} for name, size in ranked]
+
+def loaded_frameworks() -> List[str]:
+    return [m for m in ("tensorflow", "keras", "sklearn", "scipy", "pandas", "numpy") if m in sys.modules]
+
+# --------------------------
+# Allocation profiling
+# --------------------------
+_TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+def _where(traceback) -> str:
+    def short(path: str) -> str:
+        marker = "-packages" + os.sep
+        return path.split(marker, 1)[1] if marker in path else os.path.basename(path)
+    return " -> ".join(f"{short(frame.filename)}:{frame.lineno}" if frame.lineno else short(frame.filename)
+                       for frame in traceback)  # oldest frame first
+
+class AllocationProfiler:
+    """tracemalloc over a window: what was allocated since start() and is still alive.
+
+    Tracing slows allocations down and costs memory of its own, so it is off
+    until start() and switches itself off after `seconds` (0 = until stop()).
+    The last window's report is kept after it stops.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline = None
+        self._owns_tracing = False
+        self._timer = None
+        self.frames = 1
+        self.started_at = None
+        self.last_report = None
+
+    @property
+    def active(self) -> bool:
+        return self._baseline is not None
+
+    def start(self, frames: int = 1, seconds: float = 0.0) -> Dict:
+        with self._lock:
+            if not self.active:
+                self.frames = max(int(frames), 1)
+                # Already tracing (PYTHONTRACEMALLOC): use it, and leave it on at stop()
+                self._owns_tracing = not tracemalloc.is_tracing()
+                if self._owns_tracing:
+                    tracemalloc.start(self.frames)
+                tracemalloc.reset_peak()
+                self._baseline = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+                self.started_at = time.time()
+                if seconds > 0:
+                    self._timer = threading.Timer(seconds, self.stop)
+                    self._timer.daemon = True
+                    self._timer.start()
+        return self.status()
+
+    def stop(self, top: int = 20, group: str = "lineno") -> Optional[Dict]:
+        """End the window; its final report."""
+        with self._lock:
+            if not self.active:
+                return self.last_report
+            self.last_report = self._report(top, group)
+            self._baseline = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._owns_tracing:
+                tracemalloc.stop()
+            return self.last_report
+
+    def status(self) -> Dict:
+        return {
+            "active": self.active,
+            "frames": self.frames,
+            "started_at": datetime.utcfromtimestamp(self.started_at).isoformat() if self.started_at else None,
+        }
+
+    def report(self, top: int = 20, group: str = "lineno") -> Dict:
+        """Top allocators of the running window, else the last window's report."""
+        with self._lock:
+            if not self.active:
+                return {**self.status(), "last": self.last_report}
+            return self._report(top, group)
+
+    def _report(self, top: int, group: str) -> Dict:
+        # group: lineno | filename | traceback (needs frames > 1 to say more than lineno)
+        snapshot = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+        current, peak = tracemalloc.get_traced_memory()
+        grown = [s for s in snapshot.compare_to(self._baseline, group) if s.size_diff > 0][:top]
+        return {
+            **self.status(),
+            "window_seconds": round(time.time() - self.started_at, 1),
+            "group": group,
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+            # Still alive and allocated during the window: leaks, caches filling up
+            "grown": [{"where": _where(s.traceback), "bytes": s.size_diff, "blocks": s.count_diff,
+                       "total_bytes": s.size} for s in grown],
+            # Largest live allocations overall (since tracing started)
+            "largest": [{"where": _where(s.traceback), "bytes": s.size, "blocks": s.count}
+                        for s in snapshot.statistics(group)[:top]],
+        }
+
+# --------------------------
+# Report
+# --------------------------
+def memory_report(models, components: Dict[str, object], profiler: Optional[AllocationProfiler] = None,
+                  top: int = 20, group: str = "lineno") -> Dict:
+    """Everything above for one process (one worker under serve.py)."""
+    return {
+        "pid": os.getpid(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "process": process_memory(),
+        "mappings": mapped_memory(top),
+        "frameworks": loaded_frameworks(),
+        "models": model_memory(models),
+        "components": {name: component_memory(obj) for name, obj in components.items()},
+        "python": {"gc_objects": len(gc.get_objects())},
+        "tracemalloc": profiler.report(top, group) if profiler is not None else None,
+    }
+
+def _mib(n) -> str:
+    return f"{n / _MIB:8.1f} MiB" if n is not None else "       n/a"
+
+def print_report(report: Dict, stages: Dict[str, Dict]):
+    proc = report["process"]
+    print(f"Process {report['pid']}: RSS{_mib(proc.get('rss'))} (peak{_mib(proc.get('peak_rss'))}, "
+          f"anon{_mib(proc.get('rss_anon'))}, file{_mib(proc.get('rss_file'))}, PSS{_mib(proc.get('pss'))})")
+    print("RSS by stage: " + " -> ".join(f"{name}{_mib(rss)}" for name, rss in stages.items()))
+    print(f"Frameworks imported: {', '.join(report['frameworks']) or 'none'}")
+
+    print("\nModels (estimated):")
+    for name, info in report["models"].items():
+        if info["loaded"]:
+            print(f"  {name:18s}{_mib(info['bytes'])}  {info['type']} ({info['method']})")
+        else:
+            print(f"  {name:18s}  not loaded")
+
+    print("\nResident memory by mapping:")
+    for m in report["mappings"]:
+        print(f"  {_mib(m['rss'])}  {m['owner']}")
+
+    trace = report["tracemalloc"]
+    if trace and trace.get("active"):
+        print(f"\nTop allocators since start ({trace['group']}), traced{_mib(trace['traced_bytes'])}, "
+              f"tracemalloc overhead{_mib(trace['tracemalloc_overhead_bytes'])}:")
+        for s in trace["grown"]:
+            print(f"  {_mib(s['bytes'])} {s['blocks']:>9} blocks  {s['where']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the service's models and report memory use")
+    parser.add_argument("--top", type=int, default=20, help="rows per ranking")
+    parser.add_argument("--group", choices=["lineno", "filename", "traceback"], default="filename",
+                        help="how tracemalloc allocations are grouped")
+    parser.add_argument("--frames", type=int, default=1, help="tracemalloc frames per allocation")
+    parser.add_argument("--no-trace", action="store_true", help="skip tracemalloc (exact RSS, no allocators)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    profiler = None
+    if not args.no_trace:
+        profiler = AllocationProfiler()
+        profiler.start(args.frames)  # before the imports, so framework allocations are traced
+
+    stages = {"start": process_memory().get("rss")}
+    import logging
+    import app as service  # no models load on import
+    logging.getLogger("ml_service").setLevel(logging.WARNING)
+    stages["imports"] = process_memory().get("rss")
+    models = service.load_model_set(service.MODEL_PATHS, parallel=False, ae_dtype=service.AE_DTYPE)
+    service.warm_up(models)
+    stages["models"] = process_memory().get("rss")
+
+    report = memory_report(models, {}, profiler, args.top, args.group)
+    report["stages"] = stages
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, stages)
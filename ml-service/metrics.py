@@ -0,0 +1,227 @@
+# metrics.py — Prometheus metrics for the scoring pipeline
+#
+# Stage histograms get one observation per scoring pass (a micro-batch or a
+# /predict/batch call), so their counts line up with model calls, not events.
+#
+# With SCORING_EXECUTOR=process the stages run in worker processes. Set
+# PROMETHEUS_MULTIPROC_DIR to an empty, writable directory before starting
+# the service so /metrics aggregates them across processes.
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+STAGES = ("feature_extraction", "tfidf_transform", "densify", "if_scoring", "ae_scoring", "fusion")
+
+# 50µs .. 2.5s: fusion sits at the low end, a large batch through the IF at the top
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1000)
+
+STAGE_SECONDS = Histogram(
+    "ml_stage_duration_seconds", "Time per pipeline stage and scoring pass",
+    ["stage"], buckets=STAGE_BUCKETS,
+)
+BATCH_ROWS = Histogram(
+    "ml_scoring_batch_rows", "Rows per scoring pass", buckets=BATCH_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "ml_request_duration_seconds", "End-to-end prediction request latency",
+    ["endpoint"], buckets=REQUEST_BUCKETS,
+)
+PREDICTIONS = Counter("ml_predictions", "Scored events by label", ["label"])
+IN_FLIGHT = Gauge(
+    "ml_requests_in_flight", "Prediction requests currently being handled",
+    ["endpoint"], multiprocess_mode="livesum",
+)
+
+# Shadow model set (shadow.py): sampled live events scored off the request path
+SHADOW_EVENTS = Counter("ml_shadow_events", "Sampled events by outcome", ["outcome"])
+SHADOW_DISAGREEMENTS = Counter(
+    "ml_shadow_label_disagreements", "Compared events whose model label differs",
+    ["direction"],
+)
+SHADOW_SCORE_DIFF = Histogram(
+    "ml_shadow_score_abs_diff", "|shadow - primary| fused model score",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0),
+)
+
+# Near-duplicate collapsing (neardup.py), per exact-cache miss
+NEAR_DUPLICATES = Counter(
+    "ml_near_duplicate_events", "Exact-cache misses by near-duplicate outcome (hit, follow, new, skipped)",
+    ["outcome"],
+)
+
+# Admission control (admission.py): per request that needed model work
+ADMISSION_EVENTS = Counter(
+    "ml_admission_events", "Admission outcomes (admitted, queue_full, overloaded, expired, deadline) by class",
+    ["outcome", "priority"],
+)
+
+# Prediction log (predlog.py): what happened to each scored event's log entry
+PREDICTION_LOG_EVENTS = Counter(
+    "ml_prediction_log_events", "Prediction log entries by outcome (written, sampled_out, dropped, error)",
+    ["outcome"],
+)
+
+_stage = {name: STAGE_SECONDS.labels(name) for name in STAGES}
+_local = threading.local()
+
+# Extra receivers of raw stage timings in this process (benchmark.py uses
+# them for exact percentiles; histograms only give bucket estimates)
+_stage_listeners: List[Callable[[str, float], None]] = []
+
+def add_stage_listener(fn: Callable[[str, float], None]):
+    _stage_listeners.append(fn)
+
+def remove_stage_listener(fn: Callable[[str, float], None]):
+    if fn in _stage_listeners:
+        _stage_listeners.remove(fn)
+
+@contextmanager
+def suppressed():
+    """Stage timings and batch sizes in this thread are not recorded.
+
+    For work that runs the scoring pipeline off the request path (shadow
+    scoring), so it does not show up as serving latency.
+    """
+    _local.suppressed = True
+    try:
+        yield
+    finally:
+        _local.suppressed = False
+
+def observe_batch_rows(n: int):
+    if not getattr(_local, "suppressed", False):
+        BATCH_ROWS.observe(n)
+
+def observe_stage(name: str, seconds: float):
+    if getattr(_local, "suppressed", False):
+        return
+    _stage[name].observe(seconds)
+    for fn in _stage_listeners:
+        fn(name, seconds)
+
+@contextmanager
+def timed(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+@contextmanager
+def track_request(endpoint: str):
+    start = time.perf_counter()
+    gauge = IN_FLIGHT.labels(endpoint)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+        REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+
+# --------------------------
+# Scrape-time state
+# --------------------------
+class ServiceCollector:
+    """Exports state the service already keeps (caches, model set, queues).
+
+    `snapshot()` is called on every scrape and returns:
+      {"cache": PredictionCache.stats(), "models": ModelSet.status(),
+       "model_version": str, "ready": bool, "queue_depth": int,
+       "admission": AdmissionController.stats() or None}
+    """
+
+    def __init__(self, snapshot: Callable[[], Dict]):
+        self.snapshot = snapshot
+
+    def collect(self):
+        snap = self.snapshot()
+
+        ready = GaugeMetricFamily("ml_models_ready", "1 when the active model set passed warm-up",
+                                  labels=["version"])
+        ready.add_metric([snap.get("model_version") or ""], 1.0 if snap.get("ready") else 0.0)
+        yield ready
+
+        load = GaugeMetricFamily("ml_model_load_seconds", "Load time of each active artifact",
+                                 labels=["artifact"])
+        loaded = GaugeMetricFamily("ml_model_loaded", "1 when the artifact is loaded",
+                                   labels=["artifact"])
+        for name, status in snap.get("models", {}).items():
+            if status.get("load_ms") is not None:
+                load.add_metric([name], status["load_ms"] / 1000.0)
+            loaded.add_metric([name], 1.0 if status.get("loaded") else 0.0)
+        yield load
+        yield loaded
+
+        cache = snap.get("cache", {})
+        size = GaugeMetricFamily("ml_cache_entries", "Entries per cache level", labels=["level"])
+        capacity = GaugeMetricFamily("ml_cache_capacity", "Max entries per cache level", labels=["level"])
+        counters = {
+            field: CounterMetricFamily(f"ml_cache_{field}", f"Cache {field} per level", labels=["level"])
+            for field in ("hits", "misses", "evictions", "expirations")
+        }
+        for level in ("features", "scores", "near_duplicates"):
+            stats = cache.get(level)
+            if not stats:
+                continue
+            size.add_metric([level], stats["size"])
+            capacity.add_metric([level], stats["maxsize"])
+            for field, family in counters.items():
+                family.add_metric([level], stats[field])
+        yield size
+        yield capacity
+        yield from counters.values()
+
+        yield CounterMetricFamily("ml_cache_coalesced", "Requests that joined an in-flight identical call",
+                                  value=cache.get("coalesced", 0))
+        yield CounterMetricFamily("ml_cache_invalidations", "Cache flushes caused by a model swap",
+                                  value=cache.get("invalidations", 0))
+        yield GaugeMetricFamily("ml_singleflight_in_flight", "Distinct model calls currently in flight",
+                                value=cache.get("in_flight", 0))
+        yield GaugeMetricFamily("ml_microbatch_queue_depth", "Events waiting for the micro-batcher",
+                                value=snap.get("queue_depth", 0))
+
+        admission = snap.get("admission")
+        if admission:
+            yield GaugeMetricFamily("ml_admission_in_flight", "Requests holding an admission slot",
+                                    value=admission["in_flight"])
+            waiting = GaugeMetricFamily("ml_admission_queued", "Requests waiting for a slot", labels=["priority"])
+            waiting.add_metric(["priority"], admission["queued_priority"])
+            waiting.add_metric(["routine"], admission["queued_routine"])
+            waiting.add_metric(["background"], admission["queued_background"])
+            yield waiting
+
+_service_collector = None
+
+def register_service(snapshot: Callable[[], Dict]):
+    global _service_collector
+    if _service_collector is not None:
+        return
+    _service_collector = ServiceCollector(snapshot)
+    if not MULTIPROCESS:
+        REGISTRY.register(_service_collector)
+
+def render():
+    """(body, content type) for the /metrics response."""
+    if not MULTIPROCESS:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+    from prometheus_client import multiprocess
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    if _service_collector is not None:
+        registry.register(_service_collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
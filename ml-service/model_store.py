@@ -0,0 +1,225 @@
+# model_store.py — Loading the scoring artifacts as one timed, consistent set
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+import joblib
+import numpy as np
+
+from exports import file_digest
+from numpy_autoencoder import NumpyAutoencoder
+from numpy_isolation_forest import FlatIsolationForest
+from numpy_tfidf import CompactTfidf
+
+logger = logging.getLogger("ml_service")
+
+# artifact name -> ModelSet attribute
+ARTIFACTS = {
+    "isolation_forest": "if_model",
+    "autoencoder": "ae_model",
+    "num_scaler": "num_scaler",
+    "tfidf_vectorizer": "tfidf_vec",
+}
+
+# --------------------------
+# Loaders
+# --------------------------
+def load_export(numpy_path: Optional[str], source_path: str, load_numpy: Callable[[str], object],
+                load_source: Callable[[str], object], label: str) -> Tuple[object, str]:
+    """The NumPy export if it was made from `source_path` as it is now, else the source artifact."""
+    if numpy_path and os.path.exists(numpy_path):
+        try:
+            export = load_numpy(numpy_path)
+            if os.path.exists(source_path) and export.source_digest != file_digest(source_path):
+                logger.warning(f"⚠️ {numpy_path} was exported from another {source_path}, using the {label}")
+            else:
+                return export, numpy_path
+        except Exception as e:
+            logger.error(f"❌ {numpy_path} load error, falling back to the {label}: {e}")
+
+    return load_source(source_path), source_path
+
+def load_autoencoder(numpy_path: Optional[str], keras_path: str,
+                     dtype=np.float32) -> Tuple[object, str]:
+    # Prefer the exported NumPy weights; Keras (and TensorFlow) is only a fallback
+    def _keras(path: str):
+        from tensorflow.keras.models import load_model
+        return load_model(path)
+
+    return load_export(numpy_path, keras_path, lambda path: NumpyAutoencoder.load(path, dtype=dtype),
+                       _keras, "Keras model")
+
+def load_isolation_forest(numpy_path: Optional[str], pkl_path: str) -> Tuple[object, str]:
+    return load_export(numpy_path, pkl_path, FlatIsolationForest.load, joblib.load, "pickle")
+
+def load_tfidf_vectorizer(numpy_path: Optional[str], pkl_path: str) -> Tuple[object, str]:
+    return load_export(numpy_path, pkl_path, CompactTfidf.load, joblib.load, "pickle")
+
+def _joblib(path: str) -> Tuple[object, str]:
+    return joblib.load(path), path
+
+def _loaders(paths: Dict[str, str], ae_dtype) -> Dict[str, Callable]:
+    # Each loader returns (artifact, path it was read from)
+    return {
+        "isolation_forest": lambda: load_isolation_forest(paths.get("isolation_forest_numpy"),
+                                                          paths["isolation_forest"]),
+        "autoencoder": lambda: load_autoencoder(paths.get("autoencoder_numpy"), paths["autoencoder"],
+                                                ae_dtype),
+        "num_scaler": lambda: _joblib(paths["num_scaler"]),
+        "tfidf_vectorizer": lambda: load_tfidf_vectorizer(paths.get("tfidf_vectorizer_numpy"),
+                                                          paths["tfidf_vectorizer"]),
+    }
+
+# --------------------------
+# Model set
+# --------------------------
+class ModelSet:
+    """Artifacts that are always used together, plus how loading them went."""
+
+    def __init__(self):
+        self.if_model = None
+        self.ae_model = None
+        self.num_scaler = None
+        self.tfidf_vec = None
+        self.load_ms: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.versions: Dict[str, str] = {}  # content digest per artifact
+        self.sources: Dict[str, str] = {}  # file each artifact was read from
+        self.version: Optional[str] = None  # digest of the whole set
+        self.loaded_at: Optional[float] = None
+        self.warmup_ms: Optional[float] = None
+        self.ready = False
+
+    def get(self, name: str):
+        return getattr(self, ARTIFACTS[name])
+
+    @property
+    def complete(self) -> bool:
+        return all(self.get(name) is not None for name in ARTIFACTS)
+
+    def status(self) -> Dict[str, Dict]:
+        return {
+            name: {
+                "loaded": self.get(name) is not None,
+                "version": self.versions.get(name),
+                "source": self.sources.get(name),
+                "load_ms": self.load_ms.get(name),
+                "error": self.errors.get(name),
+            }
+            for name in ARTIFACTS
+        }
+
+def load_model_set(paths: Dict[str, str], parallel: bool = True, ae_dtype=np.float32) -> ModelSet:
+    """Load every artifact (in parallel threads by default) and time each one.
+
+    `ae_dtype` is the compute dtype of the NumPy autoencoder.
+
+    A failing artifact is recorded in `errors` and left as None; the others
+    still load so the service can degrade the way it always has.
+    """
+    models = ModelSet()
+
+    def _timed(name: str, loader: Callable):
+        start = time.perf_counter()
+        try:
+            value, path = loader()
+            version = file_digest(path)
+        except Exception as e:
+            return name, None, None, None, (time.perf_counter() - start) * 1000, e
+        return name, value, path, version, (time.perf_counter() - start) * 1000, None
+
+    loaders = _loaders(paths, ae_dtype)
+    if parallel:
+        with ThreadPoolExecutor(max_workers=len(loaders), thread_name_prefix="model-load") as pool:
+            results = list(pool.map(lambda item: _timed(*item), loaders.items()))
+    else:
+        results = [_timed(name, loader) for name, loader in loaders.items()]
+
+    for name, value, path, version, elapsed_ms, error in results:
+        models.load_ms[name] = round(elapsed_ms, 1)
+        if error is not None:
+            models.errors[name] = str(error)
+            logger.error(f"❌ {name} load error: {error}")
+        else:
+            setattr(models, ARTIFACTS[name], value)
+            models.versions[name] = version
+            models.sources[name] = path
+            logger.info(f"✅ Loaded {name} ({type(value).__name__}, {version}) from {path} in {elapsed_ms:.0f}ms")
+
+    h = hashlib.sha256()
+    for name in ARTIFACTS:
+        h.update(f"{name}={models.versions.get(name)};".encode())
+    models.version = h.hexdigest()[:12]
+    models.loaded_at = time.time()
+    return models
+
+# --------------------------
+# Artifact watcher
+# --------------------------
+class ArtifactWatcher:
+    """Poll artifact files and call `on_change` once a change has settled.
+
+    A change is only reported when two consecutive polls see the same new
+    (mtime, size) fingerprint, so half-written files are not picked up.
+    """
+
+    def __init__(self, paths: Dict[str, str], interval: float, on_change: Callable[[], None]):
+        self.paths = [p for p in paths.values() if p]
+        self.interval = interval
+        self.on_change = on_change
+        self._stop = threading.Event()
+        self._thread = None
+        self._active = None   # fingerprint currently in service
+        self._pending = None  # changed fingerprint waiting to settle
+
+    def fingerprint(self) -> Tuple:
+        prints = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                prints.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                prints.append((path, None, None))
+        return tuple(prints)
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._active = self.fingerprint()
+        self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def check(self) -> bool:
+        """One poll; True (after calling `on_change`) when a change has settled.
+
+        start() runs this on a thread. Callers that must not have extra
+        threads (the pre-fork master) call it from their own loop instead.
+        """
+        current = self.fingerprint()
+        if self._active is None:
+            self._active = current
+        if current == self._active:
+            self._pending = None
+            return False
+        if current != self._pending:
+            self._pending = current  # changed, wait one more poll for it to settle
+            return False
+        self._active, self._pending = current, None
+        logger.info("🔄 Model artifacts changed on disk")
+        try:
+            self.on_change()
+        except Exception as e:
+            logger.error(f"❌ Model reload after file change failed: {e}")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
@@ -0,0 +1,244 @@
+# neardup.py — Near-duplicate payloads share one model score
+#
+# Campaigns send the same one-liner with a different C2 address or file
+# name, which the exact score cache never matches. Each payload gets a
+# MinHash signature over character shingles; an LSH index over the
+# signatures of recently scored payloads finds a representative that is
+# similar enough, and its model scores are reused.
+#
+# Only the model scores are shared: signature rules and source rates still
+# run on every event's own payload (app.build_response).
+
+import os
+import re
+import time
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+_SHINGLE_PRIME = np.uint64(1099511628211)  # FNV-64 prime
+_MAX_BLOCK = 1024  # shingles per (shingles x permutations) block
+
+def _bands(threshold: float, n_perm: int) -> Tuple[int, int]:
+    """(bands, rows) whose LSH curve best separates pairs around `threshold`.
+
+    Missed near-duplicates cost a model call while extra candidates are only
+    compared, so false negatives weigh more than false positives.
+    """
+    xs = np.linspace(0.0, 1.0, 201)
+    best, best_err = (n_perm, 1), np.inf
+    for rows in range(1, n_perm + 1):
+        if n_perm % rows:
+            continue
+        bands = n_perm // rows
+        p = 1.0 - (1.0 - xs ** rows) ** bands
+        err = 0.3 * p[xs < threshold].sum() + 0.7 * (1.0 - p[xs >= threshold]).sum()
+        if err < best_err:
+            best, best_err = (bands, rows), err
+    return best
+
+class NearDuplicateIndex:
+    """Bounded LRU index of MinHash signatures with attached model scores.
+
+    Payloads are normalized (lowercase, digit runs -> "0", whitespace runs ->
+    " ") and cut into `shingle`-character shingles. Two payloads in the same
+    scope (any hashable) match when their estimated Jaccard similarity is at
+    least `threshold`. At most `maxsize` representatives are kept, each for `ttl`
+    seconds; payloads shorter than `min_length` are not indexed (too few
+    shingles for a meaningful estimate).
+    """
+
+    def __init__(self, maxsize: int = 5000, threshold: float = 0.7, n_perm: int = 64, shingle: int = 4,
+                 min_length: int = 32, ttl: float = 3600.0, max_candidates: int = 32):
+        self.maxsize = max(int(maxsize), 0)
+        self.threshold = min(max(float(threshold), 0.0), 1.0)
+        self.n_perm = max(int(n_perm), 1)
+        self.shingle = max(int(shingle), 1)
+        self.min_length = max(int(min_length), self.shingle)
+        self.ttl = float(ttl)
+        self.max_candidates = max(int(max_candidates), 1)
+        self.n_bands, self.n_rows = _bands(self.threshold, self.n_perm)
+
+        # Random multiply-shift hash family; the key is per process, so
+        # payloads cannot be shaped against known permutations
+        rng = np.random.default_rng(int.from_bytes(os.urandom(8), "little"))
+        self._salt = np.uint64(rng.integers(0, 2 ** 63))
+        self._a = rng.integers(0, 2 ** 63, size=self.n_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=self.n_perm, dtype=np.uint64)
+
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # id -> (sig, scores, cluster, keys, expires)
+        self._buckets: Dict[tuple, set] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.follows = 0
+        self.misses = 0
+        self.skipped = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # --------------------------
+    # Signatures
+    # --------------------------
+    def normalize(self, payload: str) -> str:
+        return _SPACES.sub(" ", _DIGITS.sub("0", payload.lower())).strip()
+
+    def signature(self, payload: str) -> Optional[np.ndarray]:
+        """MinHash signature (n_perm uint32), None for payloads too short to index."""
+        if self.maxsize == 0:
+            return None
+        text = self.normalize(payload or "")
+        if len(text) < self.min_length:
+            self.skipped += 1
+            return None
+        cps = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32).astype(np.uint64)
+        n = cps.size - self.shingle + 1
+        shingles = np.zeros(n, dtype=np.uint64)
+        for j in range(self.shingle):  # wraps mod 2^64
+            shingles = shingles * _SHINGLE_PRIME + cps[j:j + n]
+        shingles ^= self._salt  # repeated shingles do not change a minimum, no unique() needed
+        sig = (shingles[:_MAX_BLOCK, None] * self._a + self._b).min(axis=0)
+        for lo in range(_MAX_BLOCK, shingles.size, _MAX_BLOCK):
+            block = shingles[lo:lo + _MAX_BLOCK, None] * self._a + self._b
+            np.minimum(sig, block.min(axis=0), out=sig)
+        return (sig >> np.uint64(32)).astype(np.uint32)
+
+    def _band_keys(self, scope, sig: np.ndarray) -> List[tuple]:
+        r = self.n_rows
+        return [(band, scope, sig[band * r:(band + 1) * r].tobytes()) for band in range(self.n_bands)]
+
+    def _similarity(self, a: np.ndarray, b: np.ndarray) -> float:
+        return float(np.count_nonzero(a == b)) / self.n_perm
+
+    # --------------------------
+    # Index
+    # --------------------------
+    def resolve(self, items: List[Tuple[object, str]]) -> List[tuple]:
+        """What to do with each (scope, payload) that missed the exact cache.
+
+        The service scopes payloads by model version and event type. Per item:
+          ("hit", scores, cluster_id, similarity)  an indexed payload is close enough
+          ("new", scope, sig)                      score it; add() it afterwards
+          ("follow", j, similarity)                reuse the scores of items[j], a "new"
+                                                   one from this same call
+        """
+        out: List[tuple] = []
+        local: Dict[tuple, List[int]] = {}  # band key -> earlier "new" items
+        now = time.monotonic()
+        for scope, payload in items:
+            sig = self.signature(payload)
+            if sig is None:
+                out.append(("new", scope, None))
+                metrics.NEAR_DUPLICATES.labels("skipped").inc()
+                continue
+            keys = self._band_keys(scope, sig)
+            with self._lock:
+                match = self._best(keys, sig, now)
+            if match is not None:
+                entry, similarity = match
+                out.append(("hit", entry[1], entry[2], similarity))
+                self.hits += 1
+                metrics.NEAR_DUPLICATES.labels("hit").inc()
+                continue
+            # Not indexed yet, but maybe close to a payload earlier in this call
+            best_j, best_sim = None, -1.0
+            for j in {j for key in keys for j in local.get(key, ())}:
+                sim = self._similarity(out[j][2], sig)
+                if sim > best_sim:
+                    best_j, best_sim = j, sim
+            if best_j is not None and best_sim >= self.threshold:
+                out.append(("follow", best_j, best_sim))
+                self.follows += 1
+                metrics.NEAR_DUPLICATES.labels("follow").inc()
+                continue
+            for key in keys:
+                local.setdefault(key, []).append(len(out))
+            out.append(("new", scope, sig))
+            self.misses += 1
+            metrics.NEAR_DUPLICATES.labels("new").inc()
+        return out
+
+    def _best(self, keys: List[tuple], sig: np.ndarray, now: float) -> Optional[Tuple[tuple, float]]:
+        # (entry, similarity) of the closest live candidate at or above the threshold
+        candidates = set()
+        for key in keys:
+            ids = self._buckets.get(key)
+            if ids:
+                candidates.update(ids)
+        best_id, best_sim = None, -1.0
+        # Capped: a flood of colliding signatures costs a bounded number of compares
+        for entry_id in sorted(candidates, reverse=True)[:self.max_candidates]:  # newest first
+            entry = self._entries[entry_id]
+            if entry[4] <= now:
+                self._remove(entry_id)
+                self.expirations += 1
+                continue
+            sim = self._similarity(entry[0], sig)
+            if sim > best_sim:
+                best_id, best_sim = entry_id, sim
+        if best_id is None or best_sim < self.threshold:
+            return None
+        self._entries.move_to_end(best_id)
+        return self._entries[best_id], best_sim
+
+    def add(self, scope, sig: Optional[np.ndarray], scores: tuple, cluster_id: str):
+        """Index a freshly scored "new" payload as the representative of `cluster_id`."""
+        if sig is None or self.maxsize == 0:
+            return
+        keys = self._band_keys(scope, sig)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (sig, scores, cluster_id, keys, time.monotonic() + self.ttl)
+            for key in keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for key in entry[3]:
+            ids = self._buckets.get(key)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def sample(self, n: int) -> List[tuple]:
+        """Up to n index entries, least recently used first (memory estimates)."""
+        with self._lock:
+            return list(itertools.islice(self._entries.values(), max(n, 0)))
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "permutations": self.n_perm,
+            "bands": self.n_bands,
+            "rows_per_band": self.n_rows,
+            "shingle": self.shingle,
+            "min_length": self.min_length,
+            "hits": self.hits,
+            "follows": self.follows,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,185 @@
+# numpy_autoencoder.py — TensorFlow-free autoencoder inference
+#
+# Export once (needs TensorFlow):
+#     python numpy_autoencoder.py --keras model/autoencoder_model_colab.keras \
+#         --out model/autoencoder_model_colab.npz --check
+#
+# Serving only needs NumPy: NumpyAutoencoder.load(path).predict(X)
+# precision.py derives the int8 (weight-quantized) variant from this export.
+
+import os
+import argparse
+import numpy as np
+
+from exports import file_digest, parity_batches
+
+# --------------------------
+# Activations
+# --------------------------
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+def _linear(x):
+    return x
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+def _tanh(x):
+    return np.tanh(x, out=x)
+
+ACTIVATIONS = {
+    "relu": _relu,
+    "linear": _linear,
+    "sigmoid": _sigmoid,
+    "tanh": _tanh,
+}
+
+# --------------------------
+# Inference engine
+# --------------------------
+class NumpyAutoencoder:
+    """Forward pass of a stack of Dense layers with plain NumPy matmuls.
+
+    With `scales` the weights are int8, one float scale per output column
+    (W ~= W_int8 * scale); activations are still computed in `dtype`.
+    `source_digest` is the file_digest of the .keras file it was exported from.
+    """
+
+    def __init__(self, weights, biases, activations, dtype=np.float32, scales=None,
+                 source_digest: str = ""):
+        if not (len(weights) == len(biases) == len(activations)):
+            raise ValueError("weights, biases and activations must have the same length")
+        unknown = [a for a in activations if a not in ACTIVATIONS]
+        if unknown:
+            raise ValueError(f"Unsupported activations: {unknown}")
+        self.dtype = np.dtype(dtype)
+        if scales is None:
+            self.weights = [np.ascontiguousarray(w, dtype=self.dtype) for w in weights]
+            self.scales = None
+        else:
+            self.weights = [np.ascontiguousarray(w, dtype=np.int8) for w in weights]
+            self.scales = [np.ascontiguousarray(s, dtype=self.dtype) for s in scales]
+        self.biases = [np.ascontiguousarray(b, dtype=self.dtype) for b in biases]
+        self.activations = list(activations)
+        self.source_digest = source_digest
+        self._fns = [ACTIVATIONS[a] for a in self.activations]
+
+    @property
+    def quantized(self) -> bool:
+        return self.scales is not None
+
+    @property
+    def nbytes(self) -> int:
+        arrays = self.weights + self.biases + (self.scales or [])
+        return sum(a.nbytes for a in arrays)
+
+    def quantize_int8(self) -> "NumpyAutoencoder":
+        """Symmetric per-column int8 copy of the weights (biases stay float)."""
+        if self.quantized:
+            return self
+        q_weights, scales = [], []
+        for w in self.weights:
+            scale = np.abs(w).max(axis=0) / 127.0
+            scale[scale == 0] = 1.0
+            q_weights.append(np.clip(np.rint(w / scale), -127, 127).astype(np.int8))
+            scales.append(scale)
+        return NumpyAutoencoder(q_weights, self.biases, self.activations,
+                                dtype=np.float32, scales=scales, source_digest=self.source_digest)
+
+    @property
+    def input_dim(self) -> int:
+        return self.weights[0].shape[0]
+
+    @classmethod
+    def load(cls, path: str, dtype=np.float32) -> "NumpyAutoencoder":
+        with np.load(path, allow_pickle=False) as data:
+            n_layers = int(data["n_layers"])
+            weights = [data[f"W{i}"] for i in range(n_layers)]
+            biases = [data[f"b{i}"] for i in range(n_layers)]
+            activations = [str(a) for a in data["activations"]]
+            scales = [data[f"S{i}"] for i in range(n_layers)] if "S0" in data else None
+            source_digest = str(data["source_digest"]) if "source_digest" in data else ""
+        return cls(weights, biases, activations, dtype=dtype, scales=scales, source_digest=source_digest)
+
+    def save(self, path: str):
+        arrays = {"n_layers": np.array(len(self.weights)),
+                  "activations": np.array(self.activations),
+                  "source_digest": np.array(self.source_digest)}
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            arrays[f"W{i}"] = w
+            arrays[f"b{i}"] = b
+            if self.quantized:
+                arrays[f"S{i}"] = self.scales[i]
+        np.savez(path, **arrays)
+
+    def predict(self, X, verbose=0) -> np.ndarray:
+        # Same call shape as keras Model.predict so it is a drop-in replacement
+        h = np.asarray(X, dtype=self.dtype)
+        for i, (w, b, fn) in enumerate(zip(self.weights, self.biases, self._fns)):
+            if self.scales is None:
+                h = h @ w
+            else:
+                # int8 -> float for the BLAS matmul, on every call: int8 saves memory, not time
+                h = h @ w.astype(self.dtype)
+                h *= self.scales[i]
+            h += b
+            h = fn(h)
+        return h
+
+# --------------------------
+# Export from Keras
+# --------------------------
+def export_keras_model(keras_path: str, out_path: str) -> NumpyAutoencoder:
+    from tensorflow.keras.models import load_model
+
+    model = load_model(keras_path)
+    weights, biases, activations = [], [], []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in ("InputLayer", "Dropout"):
+            continue  # no-ops at inference time
+        if kind != "Dense":
+            raise ValueError(f"Cannot export layer {layer.name} of type {kind}")
+        params = layer.get_weights()
+        w = params[0]
+        b = params[1] if len(params) > 1 else np.zeros(w.shape[1], dtype=w.dtype)
+        weights.append(w)
+        biases.append(b)
+        activations.append(layer.get_config().get("activation", "linear"))
+
+    engine = NumpyAutoencoder(weights, biases, activations, source_digest=file_digest(keras_path))
+    engine.save(out_path)
+    return engine
+
+def check_parity(keras_path: str, npz_path: str, n_rows: int = 256, seed: int = 0) -> float:
+    """Max absolute difference between Keras and NumPy reconstructions."""
+    from tensorflow.keras.models import load_model
+
+    keras_model = load_model(keras_path)
+    engine = NumpyAutoencoder.load(npz_path)
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, engine.input_dim)).astype(np.float32)
+    X[: n_rows // 2] = np.abs(X[: n_rows // 2]) / 10  # tf-idf-like rows
+    diffs = [np.max(np.abs(engine.predict(batch) - keras_model.predict(batch, verbose=0)))
+             for batch in parity_batches(X)]
+    return float(max(diffs))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a Keras Dense autoencoder to a NumPy .npz")
+    parser.add_argument("--keras", default=os.path.join("model", "autoencoder_model_colab.keras"))
+    parser.add_argument("--out", default=os.path.join("model", "autoencoder_model_colab.npz"))
+    parser.add_argument("--check", action="store_true", help="verify parity against the Keras model")
+    parser.add_argument("--tolerance", type=float, default=1e-5)
+    args = parser.parse_args()
+
+    engine = export_keras_model(args.keras, args.out)
+    print(f"✅ Exported {len(engine.weights)} Dense layers "
+          f"({' -> '.join(str(w.shape[1]) for w in engine.weights)}) to {args.out}")
+
+    if args.check:
+        max_diff = check_parity(args.keras, args.out)
+        status = "✅" if max_diff <= args.tolerance else "❌"
+        print(f"{status} Max |keras - numpy| = {max_diff:.3e} (tolerance {args.tolerance:.0e})")
+        if max_diff > args.tolerance:
+            raise SystemExit(1)
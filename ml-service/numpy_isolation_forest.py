@@ -0,0 +1,205 @@
+# numpy_isolation_forest.py — Flattened, vectorized Isolation Forest scoring
+#
+# Export once:
+#     python numpy_isolation_forest.py --model model/isolation_forest_model.pkl \
+#         --out model/isolation_forest_model.npz --check
+#
+# Serving: FlatIsolationForest.load(path).decision_function(X) matches the
+# sklearn model to ~1e-15 without its per-call validation and per-tree loop.
+# precision.py derives the float32-threshold variant from this export.
+
+import os
+import argparse
+import numpy as np
+
+from exports import file_digest, parity_batches
+
+def _average_path_length(n_samples: np.ndarray) -> np.ndarray:
+    # Same as sklearn.ensemble._iforest._average_path_length
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    out = np.zeros_like(n_samples)
+    out[n_samples == 2] = 1.0
+    big = n_samples > 2
+    n = n_samples[big]
+    out[big] = 2.0 * (np.log(n - 1.0) + np.euler_gamma) - 2.0 * (n - 1.0) / n
+    return out
+
+# --------------------------
+# Inference engine
+# --------------------------
+class FlatIsolationForest:
+    """Every tree of a fitted IsolationForest in one set of node arrays.
+
+    Nodes of all trees are concatenated; `roots` holds each tree's first
+    node. Leaves point to themselves, so walking all trees `max_depth`
+    steps for a batch of rows lands every (row, tree) pair on its leaf.
+    `leaf_depth` is the path length sklearn adds for that leaf.
+
+    Thresholds are float64 by default; see with_float32_thresholds().
+    """
+
+    CHUNK_ROWS = 256  # (rows x trees) temporaries stay cache-sized
+
+    def __init__(self, feature, threshold, left, right, leaf_depth, roots,
+                 max_depth: int, n_features: int, denominator: float, offset: float,
+                 source_digest: str = ""):
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        threshold = np.asarray(threshold)
+        self.threshold = np.ascontiguousarray(
+            threshold, dtype=np.float32 if threshold.dtype == np.float32 else np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.intp)
+        self.right = np.ascontiguousarray(right, dtype=np.intp)
+        self.leaf_depth = np.ascontiguousarray(leaf_depth, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features)
+        self.denominator = float(denominator)
+        self.offset_ = float(offset)
+        self.source_digest = source_digest
+        # children[2 * node + went_right]: one gather per step instead of a where()
+        self._children = np.stack([self.left, self.right], axis=1).ravel()
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.feature, self.threshold, self.left, self.right,
+                  self.leaf_depth, self.roots, self._children)
+        return sum(a.nbytes for a in arrays)
+
+    def with_float32_thresholds(self) -> "FlatIsolationForest":
+        """Copy with float32 thresholds, rounded down so splits do not change.
+
+        Inputs are float32, and for a float32 x: x > t  <=>  x > t32 when t32
+        is the largest float32 <= t. Leaf path lengths stay float64.
+        """
+        t32 = self.threshold.astype(np.float32)
+        above = t32.astype(np.float64) > self.threshold
+        t32[above] = np.nextafter(t32[above], np.float32(-np.inf))
+        return FlatIsolationForest(self.feature, t32, self.left, self.right, self.leaf_depth,
+                                   self.roots, self.max_depth, self.n_features_in_,
+                                   self.denominator, self.offset_, self.source_digest)
+
+    @classmethod
+    def from_sklearn(cls, model, source_digest: str = "") -> "FlatIsolationForest":
+        n_features = model.n_features_in_
+        subsample = model._max_features != n_features
+        features, thresholds, lefts, rights, depths, roots = [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for idx, (est, est_features) in enumerate(zip(model.estimators_, model.estimators_features_)):
+            tree = est.tree_
+            is_leaf = tree.children_left == -1
+            nodes = np.arange(tree.node_count)
+
+            feature = tree.feature.astype(np.intp)
+            feature[is_leaf] = 0
+            if subsample:  # tree columns index into this estimator's feature subset
+                feature = np.asarray(est_features, dtype=np.intp)[feature]
+            features.append(feature)
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+            depths.append(model._decision_path_lengths[idx]
+                          + model._average_path_length_per_tree[idx] - 1.0)
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        denominator = len(model.estimators_) * _average_path_length([model._max_samples])[0]
+        return cls(np.concatenate(features), np.concatenate(thresholds),
+                   np.concatenate(lefts), np.concatenate(rights), np.concatenate(depths),
+                   np.array(roots), max_depth, n_features, denominator, model.offset_,
+                   source_digest)
+
+    @classmethod
+    def load(cls, path: str) -> "FlatIsolationForest":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["feature"], data["threshold"], data["left"], data["right"],
+                       data["leaf_depth"], data["roots"], int(data["max_depth"]),
+                       int(data["n_features"]), float(data["denominator"]),
+                       float(data["offset"]), str(data["source_digest"]))
+
+    def save(self, path: str):
+        np.savez(path, feature=self.feature.astype(np.int32), threshold=self.threshold,
+                 left=self.left.astype(np.int32), right=self.right.astype(np.int32),
+                 leaf_depth=self.leaf_depth, roots=self.roots.astype(np.int32),
+                 max_depth=np.array(self.max_depth), n_features=np.array(self.n_features_in_),
+                 denominator=np.array(self.denominator), offset=np.array(self.offset_),
+                 source_digest=np.array(self.source_digest))
+
+    def _path_lengths(self, X: np.ndarray) -> np.ndarray:
+        n, d = X.shape
+        flat = X.ravel()
+        row_base = (np.arange(n, dtype=np.intp) * d)[:, None]
+        nodes = np.broadcast_to(self.roots, (n, self.n_trees))
+        for _ in range(self.max_depth):
+            x = np.take(flat, row_base + np.take(self.feature, nodes))
+            nodes = np.take(self._children, 2 * nodes + (x > np.take(self.threshold, nodes)))
+        return np.take(self.leaf_depth, nodes).sum(axis=1)
+
+    def score_samples(self, X) -> np.ndarray:
+        # sklearn casts to float32 before comparing with the (float64) thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has shape {X.shape}, expected (n, {self.n_features_in_})")
+        depths = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], self.CHUNK_ROWS):
+            depths[start:start + self.CHUNK_ROWS] = self._path_lengths(X[start:start + self.CHUNK_ROWS])
+        return -(2.0 ** (-depths / self.denominator))
+
+    def decision_function(self, X) -> np.ndarray:
+        return self.score_samples(X) - self.offset_
+
+# --------------------------
+# Export from sklearn
+# --------------------------
+def export_isolation_forest(model_path: str, out_path: str) -> FlatIsolationForest:
+    import joblib
+
+    engine = FlatIsolationForest.from_sklearn(joblib.load(model_path), file_digest(model_path))
+    engine.save(out_path)
+    return engine
+
+def check_parity(model_path: str, npz_path: str, n_rows: int = 2048, seed: int = 0) -> float:
+    """Max absolute difference between sklearn and flattened decision_function."""
+    import joblib
+
+    model = joblib.load(model_path)
+    engine = FlatIsolationForest.load(npz_path)
+    rng = np.random.default_rng(seed)
+
+    # Rows spread over the range of the split thresholds, so they go down
+    # both sides of the splits, plus exact threshold values (ties go left)
+    used = engine.threshold[np.isfinite(engine.threshold)]
+    lo, hi = (used.min(), used.max()) if used.size else (0.0, 1.0)
+    X = rng.uniform(lo, hi, size=(n_rows, engine.n_features_in_))
+    X[: n_rows // 2] = np.abs(rng.normal(size=(n_rows // 2, engine.n_features_in_))) / 10
+    splits = np.flatnonzero(engine.left != np.arange(len(engine.left)))
+    for i, node in enumerate(splits[: n_rows // 4]):
+        X[i, engine.feature[node]] = engine.threshold[node]
+    X = X.astype(np.float32)
+
+    diffs = [np.max(np.abs(engine.decision_function(batch) - model.decision_function(batch)))
+             for batch in parity_batches(X)]
+    return float(max(diffs))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flatten a fitted IsolationForest into a NumPy .npz")
+    parser.add_argument("--model", default=os.path.join("model", "isolation_forest_model.pkl"))
+    parser.add_argument("--out", default=os.path.join("model", "isolation_forest_model.npz"))
+    parser.add_argument("--check", action="store_true", help="verify parity against the sklearn model")
+    parser.add_argument("--tolerance", type=float, default=1e-9)
+    args = parser.parse_args()
+
+    engine = export_isolation_forest(args.model, args.out)
+    print(f"✅ Exported {engine.n_trees} trees ({len(engine.feature)} nodes, "
+          f"max depth {engine.max_depth}) to {args.out}")
+
+    if args.check:
+        max_diff = check_parity(args.model, args.out)
+        status = "✅" if max_diff <= args.tolerance else "❌"
+        print(f"{status} Max |sklearn - flat| = {max_diff:.3e} (tolerance {args.tolerance:.0e})")
+        if max_diff > args.tolerance:
+            raise SystemExit(1)
@@ -0,0 +1,199 @@
+# numpy_tfidf.py — Compact TF-IDF vectorizer without sklearn
+#
+# Export once:
+#     python numpy_tfidf.py --vectorizer model/tfidf_vectorizer_colab.pkl \
+#         --out model/tfidf_vectorizer_colab.npz --check
+#
+# Serving: CompactTfidf.load(path).transform(payloads) returns the same CSR
+# matrix as the fitted TfidfVectorizer, bit for bit. The vocabulary is one
+# sorted array looked up with np.searchsorted for a whole batch at once,
+# instead of a Python dict probed token by token, and loading it does not
+# unpickle (or import) sklearn.
+
+import os
+import re
+import argparse
+from typing import List
+
+import numpy as np
+import scipy.sparse as sp
+
+from exports import file_digest, parity_batches
+
+class CompactTfidf:
+    """transform() of a fitted word-unigram TfidfVectorizer.
+
+    `terms` is the vocabulary in sorted order and `columns` the output column
+    of each term; `idf` is indexed by column like sklearn's idf_.
+    """
+
+    def __init__(self, terms: np.ndarray, columns: np.ndarray, idf: np.ndarray, token_pattern: str,
+                 lowercase: bool = True, norm: str = "l2", source_digest: str = ""):
+        self.terms = terms
+        self.columns = columns
+        self.idf_ = idf
+        self.token_pattern = token_pattern
+        self.lowercase = lowercase
+        self.norm = norm or None
+        self.source_digest = source_digest
+        self._findall = re.compile(token_pattern).findall
+
+    @property
+    def n_features(self) -> int:
+        return len(self.idf_)
+
+    @property
+    def nbytes(self) -> int:
+        return self.terms.nbytes + self.columns.nbytes + self.idf_.nbytes
+
+    def get_feature_names_out(self) -> np.ndarray:
+        names = np.empty(self.n_features, dtype=self.terms.dtype)
+        names[self.columns] = self.terms
+        return names
+
+    @classmethod
+    def from_sklearn(cls, vectorizer, source_digest: str = "") -> "CompactTfidf":
+        # Only what the service's vectorizer uses; anything else would need
+        # more of sklearn's analyzer reimplemented
+        unsupported = {
+            "analyzer": vectorizer.analyzer != "word",
+            "ngram_range": tuple(vectorizer.ngram_range) != (1, 1),
+            "tokenizer": vectorizer.tokenizer is not None,
+            "preprocessor": vectorizer.preprocessor is not None,
+            "stop_words": vectorizer.stop_words is not None,
+            "strip_accents": vectorizer.strip_accents is not None,
+            "input": vectorizer.input != "content",
+            "binary": vectorizer.binary,
+            "sublinear_tf": vectorizer.sublinear_tf,
+            "use_idf": not vectorizer.use_idf,
+            "norm": vectorizer.norm not in ("l2", None),
+            "dtype": np.dtype(vectorizer.dtype) != np.float64,
+        }
+        bad = [name for name, flag in unsupported.items() if flag]
+        if bad:
+            raise ValueError(f"Unsupported TfidfVectorizer settings: {', '.join(bad)}")
+
+        vocabulary = vectorizer.vocabulary_
+        terms = np.array(sorted(vocabulary))
+        columns = np.array([vocabulary[t] for t in terms.tolist()], dtype=np.int32)
+        return cls(terms, columns, np.asarray(vectorizer.idf_, dtype=np.float64), vectorizer.token_pattern,
+                   bool(vectorizer.lowercase), vectorizer.norm or "", source_digest)
+
+    @classmethod
+    def load(cls, path: str) -> "CompactTfidf":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["terms"], data["columns"], data["idf"], str(data["token_pattern"]),
+                       bool(data["lowercase"]), str(data["norm"]), str(data["source_digest"]))
+
+    def save(self, path: str):
+        np.savez(path, terms=self.terms, columns=self.columns, idf=self.idf_,
+                 token_pattern=np.array(self.token_pattern), lowercase=np.array(self.lowercase),
+                 norm=np.array(self.norm or ""), source_digest=np.array(self.source_digest))
+
+    def transform(self, payloads: List[str]) -> sp.csr_matrix:
+        n, k = len(payloads), self.n_features
+        if self.lowercase:
+            payloads = [p.lower() for p in payloads]
+        tokens = [self._findall(p) for p in payloads]
+        lengths = np.fromiter(map(len, tokens), dtype=np.int64, count=n)
+        flat = np.array([t for row in tokens for t in row], dtype=self.terms.dtype.kind)
+        if flat.size and self.terms.size:
+            pos = np.minimum(np.searchsorted(self.terms, flat), self.terms.size - 1)
+            hit = self.terms[pos] == flat
+            cols = self.columns[pos[hit]]
+            rows = np.repeat(np.arange(n), lengths)[hit]
+        else:
+            cols = rows = np.zeros(0, dtype=np.int64)
+
+        # Term counts, as CountVectorizer builds them (float64, sorted indices)
+        X = sp.csr_matrix((np.ones(cols.size), (rows, cols)), shape=(n, k), dtype=np.float64)
+        X.sum_duplicates()
+        X.data *= self.idf_[X.indices]
+        if self.norm == "l2":
+            self._normalize_l2(X)
+        return X
+
+    @staticmethod
+    def _normalize_l2(X: sp.csr_matrix):
+        # Squares summed left to right within each row, like sklearn's
+        # inplace_csr_row_normalize_l2 (np.add.reduceat sums pairwise and
+        # differs in the last bit): each row's entries go down one column of
+        # a zero-padded grid, and accumulate adds the grid's rows in order
+        nnz = np.diff(X.indptr)
+        if not X.nnz:
+            return
+        rows = np.repeat(np.arange(X.shape[0]), nnz)
+        pos = np.arange(X.nnz) - X.indptr[rows]
+        squares = X.data * X.data
+        depth = int(nnz.max())
+        sums = np.zeros(X.shape[0])
+        step = max((1 << 20) // depth, 1)  # bounds the grid at 8 MiB
+        for lo in range(0, X.shape[0], step):
+            a, b = X.indptr[lo], X.indptr[min(lo + step, X.shape[0])]
+            grid = np.zeros((depth, min(step, X.shape[0] - lo)))
+            grid[pos[a:b], rows[a:b] - lo] = squares[a:b]
+            sums[lo:lo + grid.shape[1]] = np.add.accumulate(grid, axis=0)[-1]
+        norms = np.sqrt(sums)
+        norms[norms == 0.0] = 1.0
+        X.data /= np.repeat(norms, nnz)
+
+# --------------------------
+# Export from sklearn
+# --------------------------
+def export_tfidf(vectorizer_path: str, out_path: str) -> CompactTfidf:
+    import joblib
+
+    compact = CompactTfidf.from_sklearn(joblib.load(vectorizer_path), file_digest(vectorizer_path))
+    compact.save(out_path)
+    return compact
+
+def check_parity(vectorizer_path: str, npz_path: str, payloads: List[str]) -> int:
+    """Number of payloads whose compact row differs from sklearn's in any bit."""
+    import joblib
+
+    vectorizer = joblib.load(vectorizer_path)
+    compact = CompactTfidf.load(npz_path)
+    mismatches = 0
+    for batch in parity_batches(payloads, n_single=64):
+        expected, got = vectorizer.transform(batch).tocsr(), compact.transform(batch)
+        mismatches += sum(
+            not (np.array_equal(e.indices, g.indices) and np.array_equal(e.data, g.data))
+            for e, g in zip(expected, got)
+        )
+    return mismatches
+
+def _parity_payloads(data_path: str, terms: List[str], n_random: int = 2000, seed: int = 0) -> List[str]:
+    from cowrie import read_records
+    from features import EDGE_PAYLOADS
+
+    payloads = [r.get("payload") or "" for r in read_records(data_path)] if os.path.exists(data_path) else []
+    payloads += EDGE_PAYLOADS + ["İSTANBUL Wget WGET wget", "ǅungla ß ﬃ", "a_b __ ab12 12ab"]
+    # Random mixes of vocabulary terms, case changes and noise
+    vocabulary = list(terms) or ["x"]
+    rng = np.random.default_rng(seed)
+    separators = ["/", " ", ";", "-", "..", "", "é", "Ω", "_", "0"]
+    for _ in range(n_random):
+        words = rng.choice(vocabulary, size=rng.integers(0, 40))
+        seps = rng.choice(separators, size=len(words))
+        payloads.append("".join((w.upper() if rng.random() < 0.2 else w) + s for w, s in zip(words, seps)))
+    return payloads
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a fitted TfidfVectorizer to a compact NumPy .npz")
+    parser.add_argument("--vectorizer", default=os.path.join("model", "tfidf_vectorizer_colab.pkl"))
+    parser.add_argument("--out", default=os.path.join("model", "tfidf_vectorizer_colab.npz"))
+    parser.add_argument("--check", action="store_true", help="verify identical output to the sklearn vectorizer")
+    parser.add_argument("--data", default=os.path.join("..", "mock-data", "cowrie.json"),
+                        help="Cowrie or /predict-shaped JSONL with payloads for --check")
+    args = parser.parse_args()
+
+    compact = export_tfidf(args.vectorizer, args.out)
+    print(f"✅ Exported {compact.n_features} terms ({compact.nbytes} bytes) to {args.out}")
+
+    if args.check:
+        payloads = _parity_payloads(args.data, compact.terms.tolist())
+        mismatches = check_parity(args.vectorizer, args.out, payloads)
+        status = "✅" if mismatches == 0 else "❌"
+        print(f"{status} {mismatches} of {len(payloads)} payloads differ from the sklearn vectorizer")
+        if mismatches:
+            raise SystemExit(1)
@@ -0,0 +1,164 @@
+# precision.py — Reduced-precision model artifacts and their accuracy report
+#
+#   python precision.py --convert      # write the int8 AE and float32-threshold IF
+#   python precision.py --report       # compare every variant with float64
+#   python precision.py --report --data ../mock-data/cowrie.json --json report.json
+#
+# The service picks a variant with AE_PRECISION (float64 | float32 | int8)
+# and IF_PRECISION (float64 | float32). The int8 AE and the float32 IF only
+# save memory: int8 widens its weights on every call, so it is slower per
+# call than float32, and the float32 IF is no faster than float64.
+
+import os
+import copy
+import json
+import time
+import argparse
+import logging
+
+import numpy as np
+
+from numpy_autoencoder import NumpyAutoencoder
+from numpy_isolation_forest import FlatIsolationForest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+AE_NPZ = os.path.join(HERE, "model", "autoencoder_model_colab.npz")
+AE_INT8_NPZ = os.path.join(HERE, "model", "autoencoder_model_colab.int8.npz")
+IF_NPZ = os.path.join(HERE, "model", "isolation_forest_model.npz")
+IF_F32_NPZ = os.path.join(HERE, "model", "isolation_forest_model.f32.npz")
+REFERENCE_DATA = os.path.join(HERE, "..", "mock-data", "cowrie.json")
+
+# (name, AE_PRECISION, IF_PRECISION); the first one is the reference
+VARIANTS = [
+    ("float64", "float64", "float64"),
+    ("ae_float32", "float32", "float64"),  # serving default
+    ("ae_int8", "int8", "float64"),
+    ("if_float32", "float64", "float32"),
+    ("float32", "float32", "float32"),
+    ("int8", "int8", "float32"),
+]
+
+# --------------------------
+# Conversion
+# --------------------------
+def convert(ae_path=AE_NPZ, ae_int8_path=AE_INT8_NPZ, if_path=IF_NPZ, if_f32_path=IF_F32_NPZ) -> dict:
+    ae = NumpyAutoencoder.load(ae_path)
+    ae.quantize_int8().save(ae_int8_path)
+    FlatIsolationForest.load(if_path).with_float32_thresholds().save(if_f32_path)
+    return {path: os.path.getsize(path) for path in (ae_path, ae_int8_path, if_path, if_f32_path)}
+
+def load_variant(ae_precision: str, if_precision: str):
+    ae_path = AE_INT8_NPZ if ae_precision == "int8" else AE_NPZ
+    ae_dtype = np.float64 if ae_precision == "float64" else np.float32
+    if_path = IF_F32_NPZ if if_precision == "float32" else IF_NPZ
+    ae, iforest = NumpyAutoencoder.load(ae_path, dtype=ae_dtype), FlatIsolationForest.load(if_path)
+    # A variant converted from an older export would be compared against the wrong model
+    for model, path, base in ((ae, ae_path, NumpyAutoencoder.load(AE_NPZ)),
+                              (iforest, if_path, FlatIsolationForest.load(IF_NPZ))):
+        if model.source_digest != base.source_digest:
+            raise ValueError(f"{path} was converted from another export, run python precision.py --convert")
+    return ae, ae_path, iforest, if_path
+
+# --------------------------
+# Report
+# --------------------------
+def _per_row_us(fn, X, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(X)
+    return (time.perf_counter() - start) / repeats / X.shape[0] * 1e6
+
+def accuracy_report(data_path: str = REFERENCE_DATA, repeats: int = 200) -> dict:
+    """Scores of every variant on `data_path` against the float64 reference.
+
+    Uses the service's own feature extraction, scoring and fusion code.
+    """
+    import app as service  # for score_features / build_response (no models load on import)
+    from cowrie import read_records
+    from features import extract_feature_blocks_batch, stack_dense
+    from model_store import load_model_set
+
+    logging.getLogger("ml_service").setLevel(logging.WARNING)  # model loading is chatty
+    base = load_model_set(service.MODEL_PATHS)
+    records = list(read_records(data_path))
+    if not records:
+        raise ValueError(f"No scoreable events in {data_path}")
+    X_num, X_tfidf = extract_feature_blocks_batch(records, base.tfidf_vec)
+    X = stack_dense(X_num, X_tfidf)
+    X_ae = X.copy()
+    X_ae[:, :X_num.shape[1]] = base.num_scaler.transform(X_num)
+
+    report = {"data": os.path.relpath(data_path, HERE), "events": len(records), "variants": {}}
+    reference = None
+    for name, ae_precision, if_precision in VARIANTS:
+        ae, ae_path, iforest, if_path = load_variant(ae_precision, if_precision)
+        m = copy.copy(base)
+        m.ae_model, m.if_model = ae, iforest
+        if_scores, ae_scores = service.score_features(X_num, X_tfidf, m)
+        responses = [service.build_response(r, i, a, 0) for r, i, a in zip(records, if_scores, ae_scores)]
+        scores = {
+            "if": np.array(if_scores, dtype=np.float64),
+            "ae": np.array(ae_scores, dtype=np.float64),
+            "final": np.array([r["score"] for r in responses], dtype=np.float64),
+            "label": [r["label"] for r in responses],
+        }
+        if reference is None:
+            reference = scores
+
+        entry = {
+            "ae_precision": ae_precision,
+            "if_precision": if_precision,
+            "artifact_bytes": {"autoencoder": os.path.getsize(ae_path), "isolation_forest": os.path.getsize(if_path)},
+            "memory_bytes": {"autoencoder": ae.nbytes, "isolation_forest": iforest.nbytes},
+            "latency_us_per_row": {
+                "autoencoder_single": round(_per_row_us(ae.predict, X_ae[:1], repeats * 10), 2),
+                "autoencoder_batch": round(_per_row_us(ae.predict, X_ae, repeats), 2),
+                "isolation_forest_single": round(_per_row_us(iforest.decision_function, X[:1], repeats * 10), 2),
+                "isolation_forest_batch": round(_per_row_us(iforest.decision_function, X, repeats), 2),
+            },
+        }
+        for key in ("if", "ae", "final"):
+            diff = np.abs(scores[key] - reference[key])
+            entry[f"{key}_score_abs_diff"] = {"max": float(diff.max()), "mean": float(diff.mean())}
+        entry["label_flips"] = sum(a != b for a, b in zip(scores["label"], reference["label"]))
+        report["variants"][name] = entry
+    return report
+
+def print_report(report: dict):
+    print(f"Reference: {report['data']} ({report['events']} events), baseline float64\n")
+    header = (f"{'variant':<12}{'max|Δif|':>11}{'max|Δae|':>11}{'max|Δfinal|':>13}{'flips':>7}"
+              f"{'AE bytes':>10}{'IF bytes':>10}{'AE µs/row':>11}{'IF µs/row':>11}")
+    print(header)
+    print("-" * len(header))
+    for name, v in report["variants"].items():
+        lat = v["latency_us_per_row"]
+        print(f"{name:<12}{v['if_score_abs_diff']['max']:>11.1e}{v['ae_score_abs_diff']['max']:>11.1e}"
+              f"{v['final_score_abs_diff']['max']:>13.1e}{v['label_flips']:>7}"
+              f"{v['memory_bytes']['autoencoder']:>10}{v['memory_bytes']['isolation_forest']:>10}"
+              f"{lat['autoencoder_single']:>11.1f}{lat['isolation_forest_single']:>11.1f}")
+    print("\nµs/row columns are single-row calls; batch latencies are in the JSON report.")
+    print("⚠️ int8 and if_float32 are memory-only: int8 is slower per call than float32 "
+          "(weights widened on every call), if_float32 is no faster than float64.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reduced-precision artifacts and accuracy report")
+    parser.add_argument("--convert", action="store_true", help="write the int8 / float32 artifacts")
+    parser.add_argument("--report", action="store_true", help="compare all variants with float64")
+    parser.add_argument("--data", default=REFERENCE_DATA, help="Cowrie or /predict-shaped JSONL")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+    data_path = os.path.abspath(args.data)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    if not (args.convert or args.report):
+        parser.error("nothing to do: pass --convert and/or --report")
+    if args.convert:
+        for path, size in convert().items():
+            print(f"✅ {os.path.relpath(path, HERE)}: {size} bytes")
+    if args.report:
+        report = accuracy_report(data_path)
+        print_report(report)
+        if json_path:
+            with open(json_path, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"✅ Report written to {json_path}")
@@ -0,0 +1,158 @@
+# predlog.py — Structured prediction log, written off the request path
+#
+# build_response hands each decision to record(), which only samples and
+# enqueues; a background thread serializes the entries and writes them in
+# batches, one write() and flush per batch. Anomalous results are always
+# kept, normal ones 1 in N. When the queue is full entries are dropped and
+# counted, so a slow disk or a flood of events never blocks scoring.
+
+import sys
+import json
+import time
+import queue
+import threading
+import itertools
+import logging
+from typing import BinaryIO, Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger("ml_service")
+
+_STOP = object()
+
+class PredictionLog:
+    """Bounded, sampled, batched JSON-lines writer for prediction entries.
+
+    `path` is appended to (opened in the writer thread); None writes to
+    stderr like the rest of the service log. `normal_every` keeps one normal
+    result in N (1 = all, 0 = none). Batches are written when `batch_size`
+    entries are waiting or `flush_seconds` after the first one arrived.
+    """
+
+    def __init__(self, path: Optional[str] = None, normal_every: int = 10, queue_size: int = 10000,
+                 batch_size: int = 256, flush_seconds: float = 0.5):
+        self.path = path or None
+        self.normal_every = max(int(normal_every), 0)
+        self.batch_size = max(int(batch_size), 1)
+        self.flush_seconds = max(float(flush_seconds), 0.0)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(int(queue_size), 1))
+        self._normals = itertools.count()  # next() is atomic under the GIL
+        self._thread = None
+        self.offered = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self.batches = 0
+
+    # --------------------------
+    # Request side
+    # --------------------------
+    def record(self, entry: Dict, anomalous: bool):
+        """Queue one prediction entry if sampled; never blocks."""
+        self.offered += 1
+        if not anomalous and (self.normal_every == 0 or next(self._normals) % self.normal_every):
+            self.sampled_out += 1
+            metrics.PREDICTION_LOG_EVENTS.labels("sampled_out").inc()
+            return
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            metrics.PREDICTION_LOG_EVENTS.labels("dropped").inc()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    # --------------------------
+    # Writer side
+    # --------------------------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Write what is queued and end the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)  # blocking: the stop marker must not be dropped
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _open(self) -> Optional[BinaryIO]:
+        # Unbuffered append: each batch is one write(), so the workers that
+        # serve.py forks can share the file without interleaving lines
+        if self.path is None:
+            return None
+        try:
+            return open(self.path, "ab", buffering=0)
+        except OSError as e:
+            logger.error(f"❌ Cannot open prediction log {self.path}: {e}, writing to stderr")
+            return None
+
+    def _run(self):
+        stream = self._open()
+        try:
+            while True:
+                batch, stopping = self._next_batch()
+                if batch:
+                    self._write(stream, batch)
+                if stopping:
+                    return
+        finally:
+            if stream is not None:
+                stream.close()
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        # Wait for more only up to flush_seconds after the first entry
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write(self, stream: Optional[BinaryIO], batch: List[Dict]):
+        try:
+            data = "".join(json.dumps(entry) + "\n" for entry in batch)
+            if stream is None:
+                sys.stderr.write(data)
+                sys.stderr.flush()
+            else:
+                stream.write(data.encode("utf-8"))
+        except Exception as e:
+            self.errors += len(batch)
+            metrics.PREDICTION_LOG_EVENTS.labels("error").inc(len(batch))
+            logger.error(f"❌ Prediction log write failed: {e}")
+            return
+        self.written += len(batch)
+        self.batches += 1
+        metrics.PREDICTION_LOG_EVENTS.labels("written").inc(len(batch))
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path or "stderr",
+            "normal_every": self.normal_every,
+            "queue_size": self._queue.maxsize,
+            "batch_size": self.batch_size,
+            "flush_seconds": self.flush_seconds,
+            "pending": self.pending(),
+            "offered": self.offered,
+            "sampled_out": self.sampled_out,
+            "dropped": self.dropped,
+            "written": self.written,
+            "errors": self.errors,
+            "batches": self.batches,
+        }
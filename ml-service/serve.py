@@ -0,0 +1,256 @@
+# serve.py — Pre-fork launcher: load the models once, fork N uvicorn workers
+#
+#   python serve.py --workers 4 --port 8000
+#
+# The master loads and warms up the model set, then forks the workers, which
+# share those read-only pages copy-on-write instead of holding N copies. The
+# master also watches the artifacts: on a change, SIGHUP or /admin/reload in
+# any worker it loads and validates the new set once, then replaces the
+# workers one at a time.
+
+import os
+import gc
+import sys
+import time
+import shutil
+import signal
+import socket
+import logging
+import argparse
+import tempfile
+
+logger = logging.getLogger("ml_service")
+
+# Read by OpenBLAS / MKL / OpenMP / TensorFlow when they load, so they are
+# set before the service (and NumPy) is imported
+THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+              "NUMEXPR_NUM_THREADS", "TF_INTRA_OP_THREADS")
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))  # honours container CPU sets
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def configure_worker_env(workers: int) -> int:
+    """Cap every thread pool so workers x threads fits the available cores."""
+    threads = max(1, available_cpus() // workers)
+    for var in THREAD_ENV:
+        os.environ.setdefault(var, str(threads))
+    os.environ.setdefault("TF_INTER_OP_THREADS", "1")
+    os.environ.setdefault("SCORING_WORKERS", "1")
+    # The workers are the parallelism; a process executor per worker would
+    # load private copies of the models again
+    os.environ["SCORING_EXECUTOR"] = "thread"
+    os.environ["PREFORK_MASTER_PID"] = str(os.getpid())
+    return threads
+
+def configure_metrics_dir() -> tuple:
+    """(path, created): a clean PROMETHEUS_MULTIPROC_DIR shared by all workers."""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        path = tempfile.mkdtemp(prefix="ml-service-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+        return path, True
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))  # left over from a previous run
+    return path, False
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+# --------------------------
+# Master
+# --------------------------
+class Master:
+    """Forks and supervises the workers; owns model reloads."""
+
+    def __init__(self, service, sock: socket.socket, args):
+        self.service = service
+        self.sock = sock
+        self.args = args
+        self.workers = args.workers
+        self.children = {}  # pid -> start time
+        self.retiring = {}  # pid -> kill deadline
+        self.stopping = False
+        self.reload_reason = None
+        self.last_spawn = 0.0
+        self.watcher = None
+        if service.MODEL_WATCH_INTERVAL > 0:
+            from model_store import ArtifactWatcher
+            paths = {**service.MODEL_PATHS, "signatures": service.SIGNATURES_PATH}
+            if service.SHADOW_MODEL_DIR:
+                paths.update({f"shadow_{k}": v for k, v in service.shadow_paths().items()},
+                             shadow=service.SHADOW_MODEL_DIR)
+            # Polled from the main loop: the master must not run threads it forks from
+            self.watcher = ArtifactWatcher(paths, service.MODEL_WATCH_INTERVAL, self._on_file_change)
+
+    def _on_file_change(self):
+        self.reload_reason = "file change"
+
+    # ----- Workers
+    def spawn(self):
+        # Objects alive now are never collected by the workers' GC, so it
+        # does not touch (and copy) the pages holding the shared models
+        gc.collect()
+        gc.freeze()
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker()
+        self.children[pid] = time.monotonic()
+        self.last_spawn = time.monotonic()
+        logger.info(f"✅ Worker {pid} started")
+
+    def _run_worker(self):
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        status = 0
+        try:
+            import uvicorn
+            config = uvicorn.Config(
+                self.service.app,
+                log_level=self.args.log_level,
+                timeout_keep_alive=self.args.timeout_keep_alive,
+            )
+            uvicorn.Server(config).run(sockets=[self.sock])
+        except BaseException as e:
+            logger.error(f"❌ Worker {os.getpid()} crashed: {e}")
+            status = 1
+        finally:
+            os._exit(status)
+
+    def retire(self, pid: int):
+        self.children.pop(pid, None)
+        self.retiring[pid] = time.monotonic() + self.args.graceful_timeout
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self._mark_dead(pid)
+            if self.retiring.pop(pid, None) is None and self.children.pop(pid, None) is not None:
+                if not self.stopping:
+                    logger.warning(f"⚠️ Worker {pid} exited (status {status}), restarting")
+
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                os.kill(pid, signal.SIGKILL)
+
+    def _mark_dead(self, pid: int):
+        try:
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(pid)
+        except Exception:
+            pass
+
+    # ----- Reload
+    def reload(self, reason: str):
+        result = self.service.reload_models(reason)
+        if result["status"] != "swapped":
+            logger.error(f"❌ Keeping workers on {result['previous_version']}: reload rejected")
+            return
+        self.service.load_signatures(reason)
+        if self.service.SHADOW_MODEL_DIR:
+            self.service.load_shadow_models(reason)
+        gc.unfreeze()  # let the old model set be collected before forking again
+        logger.info(f"🔄 Replacing {len(self.children)} workers")
+        for pid in list(self.children):
+            self.spawn()
+            time.sleep(self.args.replace_delay)  # the new worker starts accepting first
+            self.retire(pid)
+
+    # ----- Main loop
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_hup)
+
+        for _ in range(self.workers):
+            self.spawn()
+
+        next_poll = time.monotonic() + (self.watcher.interval if self.watcher else 0)
+        while not self.stopping:
+            self.reap()
+            if self.reload_reason and not self.stopping:
+                reason, self.reload_reason = self.reload_reason, None
+                self.reload(reason)
+            if self.watcher is not None and time.monotonic() >= next_poll:
+                self.watcher.check()
+                next_poll = time.monotonic() + self.watcher.interval
+            # Replace crashed workers, at most one per second
+            if len(self.children) < self.workers and time.monotonic() - self.last_spawn >= 1.0:
+                self.spawn()
+            time.sleep(0.2)
+
+        self.shutdown()
+
+    def _handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def _handle_hup(self, signum, frame):
+        self.reload_reason = "SIGHUP"
+
+    def shutdown(self):
+        logger.info(f"🛑 Stopping {len(self.children)} workers")
+        for pid in list(self.children):
+            self.retire(pid)
+        while self.retiring:
+            self.reap()
+            time.sleep(0.1)
+
+# --------------------------
+# CLI
+# --------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork launcher for the ML service")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", str(available_cpus()))))
+    parser.add_argument("--graceful-timeout", type=float, default=30.0,
+                        help="seconds a stopping worker gets before SIGKILL")
+    parser.add_argument("--replace-delay", type=float, default=1.0,
+                        help="seconds between starting a replacement and stopping the old worker")
+    parser.add_argument("--timeout-keep-alive", type=int, default=5)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    args.workers = max(1, args.workers)
+
+    threads = configure_worker_env(args.workers)
+    metrics_dir, created = configure_metrics_dir()
+
+    import app as service  # reads the environment set above
+
+    logger.info(f"🚀 Master {os.getpid()}: {args.workers} workers x {threads} threads")
+    service.load_models()
+    if not service.models.ready:
+        logger.error("❌ Models incomplete or warm-up failed, workers will serve degraded")
+    if "tensorflow" in sys.modules:
+        logger.warning("⚠️ TensorFlow is loaded in the master; forking it is unsafe, prefer the .npz autoencoder")
+
+    sock = bind_socket(args.host, args.port)
+    try:
+        Master(service, sock, args).run()
+    finally:
+        sock.close()
+        if created:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# shadow.py — Score sampled live events with a candidate model set
+#
+# The primary response is never delayed: endpoints hand (record, primary
+# scores) to offer() after the response has gone out, a bounded queue
+# absorbs bursts (overflow is dropped and counted) and one background thread
+# scores the samples in batches with the shadow set and records how far its
+# scores and labels are from the primary ones.
+
+import queue
+import random
+import threading
+import logging
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger("ml_service")
+
+_STOP = object()
+
+class ShadowScorer:
+    """Compares a shadow model set with the primary one on sampled traffic.
+
+    `score_fn(records)` returns (if_score, ae_score) per record from the
+    shadow set (or None when no shadow set is loaded); `fuse_fn(if, ae)` is
+    the service's model fusion. Labels are compared before signature and
+    rate overrides, which apply to both sides equally.
+    """
+
+    def __init__(self, score_fn: Callable[[List[dict]], Optional[List[tuple]]],
+                 fuse_fn: Callable[[Optional[float], Optional[float]], Optional[float]],
+                 threshold: float, sample_rate: float = 0.1, queue_size: int = 1000,
+                 batch_size: int = 64, recent_diffs: int = 10000, examples: int = 20):
+        self.score_fn = score_fn
+        self.fuse_fn = fuse_fn
+        self.threshold = threshold
+        self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        self.batch_size = max(int(batch_size), 1)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(int(queue_size), 1))
+        self._lock = threading.Lock()
+        self._thread = None
+        self._recent_size = max(int(recent_diffs), 1)
+        self._examples_size = examples
+        self.reset()
+
+    def reset(self, version: Optional[str] = None):
+        """Start the statistics over (a new shadow set was loaded)."""
+        with self._lock:
+            self.version = version
+            self.offered = 0
+            self.sampled = 0
+            self.dropped = 0
+            self.compared = 0
+            self.errors = 0
+            self.labels = {"both_anomalous": 0, "both_normal": 0, "primary_only": 0, "shadow_only": 0}
+            self.sums = {"if": 0.0, "ae": 0.0, "score": 0.0}
+            self.maxima = {"if": 0.0, "ae": 0.0, "score": 0.0}
+            self.counts = {"if": 0, "ae": 0, "score": 0}
+            # Last N fused-score differences, for percentiles in fixed memory
+            self._recent = np.zeros(self._recent_size, dtype=np.float64)
+            self._recent_n = 0
+            self.examples = deque(maxlen=self._examples_size)
+
+    # --------------------------
+    # Request side
+    # --------------------------
+    def offer(self, records: List[dict], scores: List[tuple]):
+        """Queue a sample of scored events; never blocks."""
+        for record, primary in zip(records, scores):
+            self.offered += 1
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                continue
+            self.sampled += 1
+            try:
+                self._queue.put_nowait((record, primary))
+            except queue.Full:
+                self.dropped += 1
+                metrics.SHADOW_EVENTS.labels("dropped").inc()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    # --------------------------
+    # Background side
+    # --------------------------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._score(batch)
+                    return
+                batch.append(item)
+            self._score(batch)
+
+    def _score(self, batch: List[Tuple[dict, tuple]]):
+        records = [record for record, _ in batch]
+        try:
+            with metrics.suppressed():
+                shadow_scores = self.score_fn(records)
+        except Exception as e:
+            self.errors += len(batch)
+            metrics.SHADOW_EVENTS.labels("error").inc(len(batch))
+            logger.error(f"❌ Shadow scoring failed: {e}")
+            return
+        if shadow_scores is None:  # no shadow set loaded (any more)
+            return
+        for (record, primary), shadow in zip(batch, shadow_scores):
+            self._compare(record, primary, shadow)
+        metrics.SHADOW_EVENTS.labels("compared").inc(len(batch))
+
+    def _compare(self, record: dict, primary: tuple, shadow: tuple):
+        p_score, s_score = self.fuse_fn(*primary), self.fuse_fn(*shadow)
+        p_anomalous = p_score is not None and p_score >= self.threshold
+        s_anomalous = s_score is not None and s_score >= self.threshold
+        if p_anomalous and s_anomalous:
+            outcome = "both_anomalous"
+        elif p_anomalous:
+            outcome = "primary_only"
+        elif s_anomalous:
+            outcome = "shadow_only"
+        else:
+            outcome = "both_normal"
+
+        with self._lock:
+            self.compared += 1
+            self.labels[outcome] += 1
+            for key, p, s in (("if", primary[0], shadow[0]), ("ae", primary[1], shadow[1]),
+                              ("score", p_score, s_score)):
+                if p is None or s is None:
+                    continue
+                diff = abs(s - p)
+                self.sums[key] += diff
+                self.counts[key] += 1
+                self.maxima[key] = max(self.maxima[key], diff)
+                if key == "score":
+                    self._recent[self._recent_n % self._recent_size] = diff
+                    self._recent_n += 1
+                    metrics.SHADOW_SCORE_DIFF.observe(diff)
+            if outcome in ("primary_only", "shadow_only"):
+                metrics.SHADOW_DISAGREEMENTS.labels(outcome).inc()
+                self.examples.append({
+                    "srcIp": record.get("srcIp"),
+                    "event": record.get("event"),
+                    "payload": (record.get("payload") or "")[:200],
+                    "primary_score": p_score,
+                    "shadow_score": s_score,
+                    "disagreement": outcome,
+                })
+
+    def stats(self) -> Dict:
+        with self._lock:
+            recent = self._recent[:min(self._recent_n, self._recent_size)]
+            disagreements = self.labels["primary_only"] + self.labels["shadow_only"]
+            out = {
+                "version": self.version,
+                "sample_rate": self.sample_rate,
+                "offered": self.offered,
+                "sampled": self.sampled,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "pending": self.pending(),
+                "compared": self.compared,
+                "labels": dict(self.labels),
+                "label_disagreement_rate": round(disagreements / self.compared, 6) if self.compared else None,
+                "abs_diff": {
+                    key: {
+                        "mean": self.sums[key] / self.counts[key] if self.counts[key] else None,
+                        "max": self.maxima[key] if self.counts[key] else None,
+                    }
+                    for key in self.sums
+                },
+                "recent_disagreements": list(self.examples),
+            }
+            if recent.size:
+                p50, p95, p99 = np.percentile(recent, [50, 95, 99])
+                out["abs_diff"]["score"].update({"p50": float(p50), "p95": float(p95), "p99": float(p99),
+                                                 "window": int(recent.size)})
+        return out
@@ -0,0 +1,141 @@
+# signatures.py — Compiled multi-pattern IOC matcher for the token override
+#
+# Signature file format, one signature per line (blank lines and # comments
+# are ignored). The pattern is the rest of the line and may contain spaces:
+#
+#     <category>  <weight>  <pattern>
+#     downloader  0.9       wget
+#     miner       0.95      stratum+tcp://
+
+import re
+import logging
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger("ml_service")
+
+class Signature(NamedTuple):
+    pattern: str
+    category: str
+    weight: float
+
+# Used when no signature file exists; same tokens and score as the old override
+DEFAULT_SIGNATURES = [
+    Signature("curl", "downloader", 0.9),
+    Signature("bash", "shell", 0.9),
+    Signature("password", "credential", 0.9),
+    Signature("root", "credential", 0.9),
+    Signature("wget", "downloader", 0.9),
+    Signature("eval", "shell", 0.9),
+]
+
+def parse_signatures(lines) -> List[Signature]:
+    signatures = []
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = line.split(None, 2)
+        if len(parts) != 3:
+            raise ValueError(f"line {lineno}: expected '<category> <weight> <pattern>'")
+        category, weight, pattern = parts
+        try:
+            weight = float(weight)
+        except ValueError:
+            raise ValueError(f"line {lineno}: weight {weight!r} is not a number")
+        signatures.append(Signature(pattern.lower(), category, weight))
+    return signatures
+
+# --------------------------
+# Trie-shaped regex
+# --------------------------
+_END = ""
+
+def _build_trie(patterns) -> Dict:
+    trie: Dict = {}
+    for pattern in patterns:
+        node = trie
+        for ch in pattern:
+            node = node.setdefault(ch, {})
+        node[_END] = True
+    return trie
+
+def _trie_to_regex(trie: Dict) -> str:
+    # Shared prefixes are factored out, so each position is tested against
+    # the trie instead of every pattern in turn. Optional tails are greedy,
+    # so the longest pattern starting at a position wins. Built bottom-up
+    # with an explicit stack: the trie is as deep as the longest pattern.
+    regex: Dict[int, str] = {}  # id(node) -> regex of its subtree
+    stack = [(trie, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if not children_done:
+            stack.append((node, True))
+            stack.extend((child, False) for ch, child in node.items() if ch != _END)
+            continue
+        branches = [re.escape(ch) + regex.pop(id(child))
+                    for ch, child in sorted(node.items()) if ch != _END]
+        if not branches:
+            regex[id(node)] = ""
+            continue
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if _END in node:
+            body = "(?:" + body + ")?"
+        regex[id(node)] = body
+    return regex[id(trie)]
+
+# --------------------------
+# Engine
+# --------------------------
+class SignatureEngine:
+    """All signatures compiled into one regex, built once per signature set."""
+
+    def __init__(self, signatures: List[Signature], version: Optional[str] = None):
+        self.version = version
+        self.by_pattern: Dict[str, List[Signature]] = {}
+        self._order: Dict[str, int] = {}
+        for sig in signatures:
+            if not sig.pattern:
+                continue
+            self.by_pattern.setdefault(sig.pattern, []).append(sig)
+            self._order.setdefault(sig.pattern, len(self._order))
+
+        trie = _build_trie(self.by_pattern)
+        # Every pattern that is a prefix of a longer one, so one hit per
+        # position still reports all patterns starting there
+        self._prefixes: Dict[str, List[str]] = {}
+        for pattern in self.by_pattern:
+            node, found = trie, []
+            for i, ch in enumerate(pattern):
+                node = node[ch]
+                if _END in node:
+                    found.append(pattern[:i + 1])
+            self._prefixes[pattern] = found
+
+        body = _trie_to_regex(trie)
+        # Zero-width lookahead: a match is tried at every position, overlaps included
+        self._regex = re.compile(f"(?=({body}))", re.DOTALL) if body else None
+
+    def __len__(self):
+        return len(self.by_pattern)
+
+    @classmethod
+    def load(cls, path: Optional[str], version: Optional[str] = None) -> "SignatureEngine":
+        if not path:
+            return cls(DEFAULT_SIGNATURES, version="builtin")
+        with open(path, encoding="utf-8") as f:
+            return cls(parse_signatures(f), version=version)
+
+    def match(self, text: str) -> List[Signature]:
+        """Signatures whose pattern occurs in `text` (case-insensitive).
+
+        Returned in signature-file order, each pattern once.
+        """
+        if self._regex is None:
+            return []
+        hits = set()
+        for m in self._regex.finditer(text.lower()):
+            hits.update(self._prefixes[m.group(1)])
+        matched = []
+        for pattern in sorted(hits, key=self._order.__getitem__):
+            matched.extend(self.by_pattern[pattern])
+        return matched
@@ -0,0 +1,41 @@
+# conftest.py — The service driven in-process over ASGI
+#
+#   cd ml-service && python -m pytest -q tests
+#
+# Uses the real model artifacts in model/; the file watchers are off.
+
+import os
+import sys
+import asyncio
+import contextlib
+
+import httpx
+import pytest
+
+os.environ.setdefault("MODEL_WATCH_INTERVAL", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def service():
+    import app
+    return app
+
+@pytest.fixture
+def serve(service):
+    """serve() -> async context manager: the started service and an httpx client on it."""
+
+    @contextlib.asynccontextmanager
+    async def _serve():
+        await service.app.router.startup()
+        await asyncio.get_running_loop().run_in_executor(None, service.models_loaded.wait)
+        try:
+            transport = httpx.ASGITransport(app=service.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=120) as client:
+                yield client
+        finally:
+            await service.app.router.shutdown()
+
+    return _serve
+
+def event(payload: str, src_ip: str = "198.51.100.7", event_type: str = "cowrie.command.input") -> dict:
+    return {"honeypotId": "hp-test", "srcIp": src_ip, "event": event_type, "payload": payload}
